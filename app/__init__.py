@@ -1,30 +1,71 @@
 from flask import Flask
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
+from app.cache import ResponseCache
+from app.compression import Compression
+from app.hashing import PasswordHasher
+from app.idempotency import Idempotency
+from app.metrics import RequestMetrics
+from app.replicas import RoutingSession
+
 
 class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
-migrate = Migrate()
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 jwt = JWTManager()
+password_hasher = PasswordHasher()
+response_cache = ResponseCache()
+compression = Compression()
+idempotency = Idempotency()
+metrics = RequestMetrics()
+
+
+def __getattr__(name: str):
+    # Flask-Migrate imports Alembic, which only the `flask db` commands need,
+    # so its extension is created on first use.
+    global migrate
+    if name == "migrate":
+        from flask_migrate import Migrate
+
+        migrate = Migrate()
+        return migrate
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
+def create_app(start_db: bool = True, migrations: bool = True):
+    """
+    Builds the app.
 
-def create_app(start_db: bool = True):
+    Nothing is built when the package is imported: settings are read from the
+    environment, and the blueprints and commands imported, by this function.
+
+    :param start_db: Whether to configure the database from the settings.
+    :param migrations: Whether to set up the `flask db` commands, which
+                       import Alembic. Servers do not need them.
+    :return: The Flask app.
+    """
     app = Flask(__name__)
     global db
     if start_db:
-        from app.config import Config
+        from app.config import get_config
 
-        app.config.from_object(Config)
+        app.config.from_mapping(get_config())
 
         db.init_app(app)
-        migrate.init_app(app, db)
+        if migrations:
+            from app import migrate
+
+            migrate.init_app(app, db)
     jwt.init_app(app)
+    password_hasher.init_app(app)
+    response_cache.init_app(app)
+    compression.init_app(app)
+    idempotency.init_app(app)
+    metrics.init_app(app)
 
     from app.auth import auth as auth_blueprint
     from app.routes import main as main_blueprint
@@ -32,12 +73,24 @@ def create_app(start_db: bool = True):
     app.register_blueprint(auth_blueprint, url_prefix="/auth")
     app.register_blueprint(main_blueprint, url_prefix="/main")
 
-    return app
+    from app.changes import changes_cli
+    from app.export import export_leads_command
+    from app.idempotency import idempotency_cli
+    from app.importer import import_fleet_command
+    from app.stats import stats_cli
 
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(export_leads_command)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(import_fleet_command)
+    app.cli.add_command(stats_cli)
 
-app = create_app()
+    from app.readiness import ready
 
+    app.add_url_rule("/ready", "ready", ready)
 
-@app.route("/")
-def hello_world():
-    return "<p>Hello, World!</p>"
+    @app.route("/")
+    def hello_world():
+        return "<p>Hello, World!</p>"
+
+    return app
@@ -0,0 +1,42 @@
+"""
+Async variant of the API, served by an ASGI server such as hypercorn:
+
+    hypercorn --bind 0.0.0.0:5000 "app.asgi:create_app()"
+
+It exposes the routes of the `auth` and `main` blueprints with the same
+schemas, responses and status codes, but runs on Quart and an async
+SQLAlchemy engine (asyncpg, or aiosqlite in tests), so a request waiting on
+the database does not hold a thread.
+"""
+
+from quart import Quart
+
+from app.asgi.database import AsyncDatabase
+from app.asgi.security import AsyncPasswordHasher, init_jwt
+
+database = AsyncDatabase()
+password_hasher = AsyncPasswordHasher()
+
+
+def create_app(start_db: bool = True) -> Quart:
+    app = Quart(__name__)
+    if start_db:
+        from app.config import get_config
+
+        app.config.from_mapping(get_config())
+
+        database.init_app(app)
+    init_jwt(app)
+    password_hasher.init_app(app)
+
+    from app.asgi.auth import auth as auth_blueprint
+    from app.asgi.routes import main as main_blueprint
+
+    app.register_blueprint(auth_blueprint, url_prefix="/auth")
+    app.register_blueprint(main_blueprint, url_prefix="/main")
+
+    @app.route("/")
+    async def hello_world():
+        return "<p>Hello, World!</p>"
+
+    return app
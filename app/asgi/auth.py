@@ -0,0 +1,92 @@
+from pydantic import ValidationError
+from quart import Blueprint, jsonify
+from sqlalchemy import select
+
+from app.hashing import PasswordHasherBusy
+from app.models import User
+from app.schemas import UserSchema
+
+from . import database, password_hasher
+from .security import create_access_token
+from .validation import validate
+
+auth = Blueprint("auth", __name__)
+
+
+def busy_response():
+    response = jsonify({"msg": "Server busy, try again later"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+@auth.route("/register", methods=["POST"])
+@validate()
+async def register(body: UserSchema):
+    """
+    Registers a new user.
+
+    This endpoint takes a JSON body containing a username and password,
+    checks if the user already exists, and if not, creates a new user
+    with the provided username and password.
+
+    :param body: The UserSchema containing the username and password.
+    :return: A JSON response with a success or error message.
+    """
+    try:
+        session = database.session
+        stmt = select(User).filter_by(username=body.username).limit(1)
+        if await session.scalar(stmt):
+            return jsonify({"msg": "User already exists"}), 409
+
+        new_user = User(
+            username=body.username,
+            password_hash=await password_hasher.hash(body.password),
+        )
+
+        session.add(new_user)
+        await session.commit()
+
+        return jsonify({"msg": "User registered!"}), 201
+    except PasswordHasherBusy:
+        return busy_response()
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@auth.route("/login", methods=["POST"])
+@validate()
+async def login(body: UserSchema):
+    """
+    Authenticates a user and generates a JWT token.
+
+    This endpoint takes a JSON body containing a username and password,
+    validates the credentials, and if valid, returns a JWT token. Passwords
+    stored with outdated hashing parameters are rehashed on success.
+
+    :param body: The UserSchema containing the username and password.
+    :return: A JSON response with the JWT token or an error message.
+    """
+    try:
+        session = database.session
+        stmt = select(User).filter_by(username=body.username).limit(1)
+        user: User | None = await session.scalar(stmt)
+        if user is None:
+            return jsonify({"msg": "Wrong credentials"}), 409
+        if await password_hasher.verify(user.password_hash, body.password) is False:
+            return jsonify({"msg": "Wrong credentials"}), 409
+
+        if password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = await password_hasher.hash(body.password)
+            await session.commit()
+
+        access_token = create_access_token(identity=user.username)
+
+        return jsonify(access_token=access_token), 200
+    except PasswordHasherBusy:
+        return busy_response()
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
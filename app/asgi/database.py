@@ -0,0 +1,82 @@
+import threading
+
+from quart import Quart, current_app, g
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+
+class AsyncDatabase:
+    """
+    Quart extension giving access to the async SQLAlchemy engine of the app.
+
+    The engine is built on first use from `SQLALCHEMY_ASYNC_DATABASE_URI` and
+    `SQLALCHEMY_ASYNC_ENGINE_OPTIONS`, so they can still be changed after
+    `init_app`. Each request gets its own session, closed with the app context.
+    Sessions do not expire their objects on commit, since reloading expired
+    attributes would need an implicit query outside of an `await`.
+    """
+
+    def __init__(self, app: Quart | None = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Quart):
+        app.config.setdefault("SQLALCHEMY_ASYNC_DATABASE_URI", None)
+        app.config.setdefault("SQLALCHEMY_ASYNC_ENGINE_OPTIONS", {})
+        app.extensions["async_sqlalchemy"] = {
+            "engine": None,
+            "sessionmaker": None,
+            "lock": threading.Lock(),
+        }
+        app.teardown_appcontext(self._close_session)
+
+    def _state(self, app: Quart | None = None) -> dict:
+        app = app or current_app
+        state = app.extensions["async_sqlalchemy"]
+        with state["lock"]:
+            if state["engine"] is None:
+                uri = app.config["SQLALCHEMY_ASYNC_DATABASE_URI"]
+                if not uri:
+                    raise RuntimeError("SQLALCHEMY_ASYNC_DATABASE_URI is not set.")
+                state["engine"] = create_async_engine(
+                    uri, **app.config["SQLALCHEMY_ASYNC_ENGINE_OPTIONS"]
+                )
+                state["sessionmaker"] = async_sessionmaker(
+                    state["engine"], expire_on_commit=False
+                )
+            return state
+
+    def get_engine(self, app: Quart | None = None) -> AsyncEngine:
+        return self._state(app)["engine"]
+
+    @property
+    def engine(self) -> AsyncEngine:
+        return self.get_engine()
+
+    @property
+    def sessionmaker(self) -> async_sessionmaker[AsyncSession]:
+        return self._state()["sessionmaker"]
+
+    @property
+    def session(self) -> AsyncSession:
+        """
+        The session of the current request.
+        """
+        if "async_session" not in g:
+            g.async_session = self.sessionmaker()
+        return g.async_session
+
+    async def _close_session(self, exc: BaseException | None):
+        session = g.pop("async_session", None)
+        if session is not None:
+            await session.close()
+
+    async def dispose(self, app: Quart | None = None):
+        state = (app or current_app).extensions["async_sqlalchemy"]
+        if state["engine"] is not None:
+            await state["engine"].dispose()
+            state["engine"] = state["sessionmaker"] = None
@@ -0,0 +1,682 @@
+from typing import Type
+
+from pydantic import BaseModel, ValidationError
+from quart import Blueprint, Response, jsonify, request
+from sqlalchemy import Select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.batch import create_cars, create_owners, delete_cars, delete_owners
+from app.changes import ChangesCompacted, read_changes
+from app.export import CSV_MIMETYPE, LEAD_COLUMNS, format_csv, select_lead_rows
+from app.models import Car, Owner, OwnerNotFound, is_car_limit_violation
+from app.pagination import paginate, split_page
+from app.patches import (
+    VersionConflict,
+    entity_tag,
+    if_match_versions,
+    update_car_fields,
+    update_owner_fields,
+)
+from app.pool import pool_status
+from app.queries import (
+    filter_cars,
+    select_car_rows,
+    select_cars,
+    select_owner,
+    select_owners,
+)
+from app.schemas import (
+    BatchSchemaIn,
+    CarDeleteQuery,
+    CarListQuery,
+    CarPatchIn,
+    ChangesQuery,
+    CarSchemaIn,
+    CarSchemaOut,
+    LeadsQuery,
+    OwnerDeleteQuery,
+    OwnerListQuery,
+    OwnerPatchIn,
+    OwnerSchemaIn,
+    OwnerSchemaOut,
+    OwnerSummarySchemaOut,
+    StatsSchemaOut,
+)
+from app.serialization import page_body
+from app.stats import read_stats
+from app.streaming import NDJSON_MIMETYPE, STREAM_BATCH_SIZE, wants_ndjson
+
+from . import database
+from .security import jwt_required
+from .validation import validate
+
+main = Blueprint("main", __name__)
+
+
+def ndjson_response(stmt: Select, schema: Type[BaseModel]) -> Response:
+    """
+    Streams every entity selected by `stmt` as one JSON document per line.
+
+    Async counterpart of `app.streaming.ndjson_response`. The stream has its
+    own session, since it outlives the request that started it.
+
+    :param stmt: The SELECT statement of the entities to stream.
+    :param schema: The schema used to serialize each entity.
+    :return: A streamed response with the NDJSON media type.
+    """
+    sessionmaker = database.sessionmaker
+
+    async def generate():
+        async with sessionmaker() as session:
+            entities = await session.stream_scalars(
+                stmt.execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            async for entity in entities:
+                yield (schema.model_validate(entity).model_dump_json() + "\n").encode()
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+
+def json_page(schema: Type[BaseModel], rows, next_cursor: str | None) -> Response:
+    return Response(page_body(schema, rows, next_cursor), mimetype="application/json")
+
+
+"""
+Owners routes
+"""
+
+
+@main.route("/owners", methods=["POST"])
+@jwt_required()
+@validate(on_success_status=201)
+async def add_owner(body: OwnerSchemaIn):
+    """
+    Add a new owner.
+
+    This endpoint creates a new owner with the provided name.
+
+    :param body: The OwnerSchemaIn containing the owner's name.
+    :return: A JSON response with the created owner's details or an error message.
+    """
+    try:
+        session = database.session
+        owner = Owner(name=body.name, cars=[])
+        session.add(owner)
+        await session.commit()
+        return OwnerSchemaOut.model_validate(owner)
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/owners/batch", methods=["POST"])
+@jwt_required()
+@validate()
+async def add_owners_batch(body: BatchSchemaIn):
+    """
+    Add many owners at once.
+
+    This endpoint validates every owner of the batch on its own and creates
+    the valid ones in a single transaction.
+
+    :param body: The BatchSchemaIn containing the owners to create.
+    :return: A JSON response with the result of each owner, in request order.
+    """
+    session = database.session
+    try:
+        results, status = await session.run_sync(
+            lambda sync_session: create_owners(body.root, sync_session)
+        )
+        return jsonify({"results": results}), status
+    except Exception as e:
+        await session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/owners", methods=["GET"])
+@jwt_required()
+@validate(on_success_status=200)
+async def get_all_owners(query: OwnerListQuery):
+    """
+    Retrieve all owners.
+
+    This endpoint retrieves a page of owners from the database, ordered by ID.
+    The cars of the owners are embedded unless `include` is given without
+    `cars`, and are fetched with a fixed number of queries regardless of the
+    number of owners. Every owner is streamed as NDJSON when `stream` is set
+    or the client accepts `application/x-ndjson`.
+
+    Given `fields`, only the requested columns are read and returned, and the
+    cars are only fetched if one of their fields is requested.
+
+    :param query: The OwnerListQuery with the page, the relations to embed
+                  and the fields to return.
+    :return: A JSON response with a page of owners and the cursor of the next
+             page, or an error message.
+    """
+    try:
+        schema = query.output_schema
+        stmt = select_owners(query.include_cars, query.owner_fields, query.car_fields)
+        if wants_ndjson(query.stream, request.accept_mimetypes):
+            return ndjson_response(stmt, schema)
+        stmt = paginate(stmt, Owner.id, query.after_id, query.limit)
+        owners = (await database.session.scalars(stmt)).all()
+        owners, next_cursor = split_page(owners, query.limit)
+        return json_page(schema, owners, next_cursor)
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/owners/<int:owner_id>", methods=["PUT"])
+@jwt_required()
+@validate(on_success_status=200)
+async def update_owner(owner_id: int, body: OwnerSchemaIn):
+    """
+    Update an existing owner.
+
+    This endpoint updates the details of an existing owner based on the provided owner ID.
+
+    :param owner_id: The ID of the owner to update.
+    :param body: The OwnerSchemaIn containing the updated owner's name.
+    :return: A JSON response with the updated owner's details or an error message.
+    """
+    try:
+        session = database.session
+        result = await session.execute(select_owner(owner_id))
+        owner = result.unique().scalar_one_or_none()
+
+        if not owner:
+            return jsonify({"msg": "Owner not found"}), 404
+
+        owner.name = body.name
+        await session.flush()
+        response = OwnerSchemaOut.model_validate(owner)
+        await session.commit()
+
+        return response
+    except StaleDataError:
+        await session.rollback()
+        return jsonify({"msg": "Owner was modified by another request"}), 409
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/owners/<int:owner_id>", methods=["PATCH"])
+@jwt_required()
+@validate(on_success_status=200)
+async def patch_owner(owner_id: int, body: OwnerPatchIn):
+    """
+    Partially update an owner.
+
+    This endpoint updates the given fields of an owner with a single UPDATE
+    statement, without loading it. When an `If-Match` header is sent, the
+    owner is only updated if its version is one of the listed entity tags,
+    as returned in the `ETag` header.
+
+    :param owner_id: The ID of the owner to update.
+    :param body: The OwnerPatchIn containing the fields to update.
+    :return: A JSON response with the updated owner's details, without its
+             cars, and its ETag, or an error message.
+    """
+    session = database.session
+    versions = if_match_versions(request.if_match)
+    try:
+        owner = await session.run_sync(
+            lambda sync_session: update_owner_fields(
+                owner_id, body.values, versions, sync_session
+            )
+        )
+
+        if not owner:
+            return jsonify({"msg": "Owner not found"}), 404
+
+        response = OwnerSummarySchemaOut.model_validate(owner)
+        return response, {"ETag": entity_tag(owner.version)}
+    except VersionConflict:
+        await session.rollback()
+        return jsonify({"msg": "Owner was modified by another request"}), 412
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        await session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/owners/<int:owner_id>", methods=["DELETE"])
+@jwt_required()
+@validate()
+async def delete_owner(owner_id: int):
+    """
+    Delete an owner.
+
+    This endpoint deletes an owner based on the provided owner ID, without
+    loading it, see `delete_owners`. Its cars are deleted by the database
+    along with it.
+
+    :param owner_id: The ID of the owner to delete.
+    :return: A JSON response with a success message or an error message.
+    """
+    try:
+        session = database.session
+        deleted = await session.run_sync(
+            lambda sync_session: delete_owners(session=sync_session, owner_id=owner_id)
+        )
+
+        if not deleted:
+            return jsonify({"msg": "Owner not found"}), 404
+
+        return jsonify({"msg": "Owner deleted!"}), 200
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        await session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/owners", methods=["DELETE"])
+@jwt_required()
+@validate()
+async def delete_owners_by_filter(query: OwnerDeleteQuery):
+    """
+    Delete the owners matching a filter.
+
+    This endpoint deletes every owner matching the given sale opportunity
+    flag and range of numbers of cars, along with their cars, with a single
+    DELETE statement. At least one filter is required.
+
+    :param query: The OwnerDeleteQuery with the filters of the owners.
+    :return: A JSON response with the number of deleted owners or an error message.
+    """
+    session = database.session
+    try:
+        deleted = await session.run_sync(
+            lambda sync_session: delete_owners(
+                query.sale_opportunity, query.min_cars, query.max_cars, sync_session
+            )
+        )
+        return jsonify({"msg": "Owners deleted!", "deleted": deleted}), 200
+    except Exception as e:
+        await session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Cars routes
+"""
+
+
+@main.route("/cars", methods=["POST"])
+@jwt_required()
+@validate(on_success_status=201)
+async def add_car(body: CarSchemaIn):
+    """
+    Add a new car.
+
+    This endpoint creates a new car with the provided owner ID, color, and model.
+
+    :param body: The CarSchemaIn containing the car's details.
+    :return: A JSON response with the created car's details or an error message.
+    """
+    session = database.session
+    try:
+        car = Car(owner_id=body.owner_id, color=body.color, model=body.model)
+        session.add(car)
+        await session.commit()
+        return CarSchemaOut.model_validate(car)
+    except OwnerNotFound:
+        await session.rollback()
+        return jsonify({"msg": "Owner not found"}), 404
+    except IntegrityError as e:
+        await session.rollback()
+        if is_car_limit_violation(e):
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 400
+        return jsonify({"msg": "Internal server error"}), 500
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars/batch", methods=["POST"])
+@jwt_required()
+@validate()
+async def add_cars_batch(body: BatchSchemaIn):
+    """
+    Add many cars at once.
+
+    This endpoint validates every car of the batch on its own, checks the
+    limit of cars per owner for the whole batch and creates the valid cars
+    in a single transaction.
+
+    :param body: The BatchSchemaIn containing the cars to create.
+    :return: A JSON response with the result of each car, in request order.
+    """
+    session = database.session
+    try:
+        results, status = await session.run_sync(
+            lambda sync_session: create_cars(body.root, sync_session)
+        )
+        return jsonify({"results": results}), status
+    except IntegrityError as e:
+        await session.rollback()
+        if is_car_limit_violation(e):
+            # Another request added cars to the same owners meanwhile.
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 409
+        return jsonify({"msg": "Internal server error"}), 500
+    except Exception as e:
+        await session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars", methods=["GET"])
+@jwt_required()
+@validate(on_success_status=200)
+async def get_all_cars(query: CarListQuery):
+    """
+    Retrieve all cars.
+
+    This endpoint retrieves a page of cars from the database, ordered by ID,
+    optionally restricted to an owner, a color and a model. Every car is
+    streamed as NDJSON when `stream` is set or the client accepts
+    `application/x-ndjson`.
+
+    Given `fields`, only the requested columns are read and returned.
+
+    :param query: The CarListQuery with the filters, the page and the fields
+                  to return.
+    :return: A JSON response with a page of cars and the cursor of the next
+             page, or an error message.
+    """
+    try:
+        if wants_ndjson(query.stream, request.accept_mimetypes):
+            stmt = select_cars(query.car_fields)
+            stmt = filter_cars(stmt, query.owner_id, query.color, query.model)
+            return ndjson_response(stmt, query.output_schema)
+        stmt = select_car_rows(query.car_fields)
+        stmt = filter_cars(stmt, query.owner_id, query.color, query.model)
+        stmt = paginate(stmt, Car.id, query.after_id, query.limit)
+        cars = (await database.session.execute(stmt)).all()
+        cars, next_cursor = split_page(cars, query.limit)
+        return json_page(query.output_schema, cars, next_cursor)
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars/<int:car_id>", methods=["PUT"])
+@jwt_required()
+@validate(on_success_status=200)
+async def update_car(car_id: int, body: CarSchemaIn):
+    """
+    Update an existing car.
+
+    This endpoint updates the details of an existing car based on the provided car ID.
+
+    :param car_id: The ID of the car to update.
+    :param body: The CarSchemaIn containing the updated car's details.
+    :return: A JSON response with the updated car's details or an error message.
+    """
+    session = database.session
+    try:
+        car = await session.get(Car, car_id)
+
+        if not car:
+            return jsonify({"msg": "Car not found"}), 404
+
+        car.owner_id = body.owner_id
+        car.color = body.color
+        car.model = body.model
+        await session.commit()
+
+        return CarSchemaOut.model_validate(car)
+    except StaleDataError:
+        await session.rollback()
+        return jsonify({"msg": "Car was modified by another request"}), 409
+    except OwnerNotFound:
+        await session.rollback()
+        return jsonify({"msg": "Owner not found"}), 404
+    except IntegrityError as e:
+        await session.rollback()
+        if is_car_limit_violation(e):
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 400
+        return jsonify({"msg": "Internal server error"}), 500
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars/<int:car_id>", methods=["PATCH"])
+@jwt_required()
+@validate(on_success_status=200)
+async def patch_car(car_id: int, body: CarPatchIn):
+    """
+    Partially update a car.
+
+    This endpoint updates the given fields of a car with a single UPDATE
+    statement, without loading it. When an `If-Match` header is sent, the
+    car is only updated if its version is one of the listed entity tags,
+    as returned in the `ETag` header.
+
+    :param car_id: The ID of the car to update.
+    :param body: The CarPatchIn containing the fields to update.
+    :return: A JSON response with the updated car's details and its ETag, or
+             an error message.
+    """
+    session = database.session
+    versions = if_match_versions(request.if_match)
+    try:
+        car = await session.run_sync(
+            lambda sync_session: update_car_fields(
+                car_id, body.values, versions, sync_session
+            )
+        )
+
+        if not car:
+            return jsonify({"msg": "Car not found"}), 404
+
+        return CarSchemaOut.model_validate(car), {"ETag": entity_tag(car["version"])}
+    except VersionConflict:
+        await session.rollback()
+        return jsonify({"msg": "Car was modified by another request"}), 412
+    except OwnerNotFound:
+        await session.rollback()
+        return jsonify({"msg": "Owner not found"}), 404
+    except IntegrityError as e:
+        await session.rollback()
+        if is_car_limit_violation(e):
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 400
+        return jsonify({"msg": "Internal server error"}), 500
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        await session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars/<int:car_id>", methods=["DELETE"])
+@jwt_required()
+@validate()
+async def delete_car(car_id: int):
+    """
+    Delete a car.
+
+    This endpoint deletes a car based on the provided car ID.
+
+    :param car_id: The ID of the car to delete.
+    :return: A JSON response with a success message or an error message.
+    """
+    try:
+        session = database.session
+        car = await session.get(Car, car_id)
+
+        if not car:
+            return jsonify({"msg": "Car not found"}), 404
+
+        await session.delete(car)
+        await session.commit()
+
+        return jsonify({"msg": "Car deleted!"}), 200
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars", methods=["DELETE"])
+@jwt_required()
+@validate()
+async def delete_cars_by_filter(query: CarDeleteQuery):
+    """
+    Delete the cars matching a filter.
+
+    This endpoint deletes every car matching the given owner, color and
+    model with a single DELETE statement. At least one filter is required.
+
+    :param query: The CarDeleteQuery with the filters of the cars.
+    :return: A JSON response with the number of deleted cars or an error message.
+    """
+    session = database.session
+    try:
+        deleted = await session.run_sync(
+            lambda sync_session: delete_cars(
+                query.owner_id, query.color, query.model, sync_session
+            )
+        )
+        return jsonify({"msg": "Cars deleted!", "deleted": deleted}), 200
+    except Exception as e:
+        await session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Change feed routes
+"""
+
+
+@main.route("/changes", methods=["GET"])
+@jwt_required()
+@validate(on_success_status=200)
+async def get_changes(query: ChangesQuery):
+    """
+    Retrieve the changes of owners and cars.
+
+    This endpoint returns the owners and cars created, updated or deleted
+    after the `since` sequence, oldest first, with their current state, so
+    clients only fetch what changed since their last sync. Each owner or car
+    appears once, at the sequence of its latest change.
+
+    :param query: The ChangesQuery with the sequence to read from.
+    :return: A JSON response with a page of changes and the `since` of the
+             next page, a 410 if the changes since `since` were compacted,
+             or an error message.
+    """
+    try:
+        return await database.session.run_sync(
+            lambda sync_session: read_changes(sync_session, query.since, query.limit)
+        )
+    except ChangesCompacted:
+        return (
+            jsonify({"msg": "Changes were compacted, list owners and cars again"}),
+            410,
+        )
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Export routes
+"""
+
+
+@main.route("/leads/export", methods=["GET"])
+@jwt_required()
+@validate()
+async def export_leads(query: LeadsQuery):
+    """
+    Export the sale opportunities as CSV.
+
+    This endpoint streams one CSV line per car of every owner that is a sale
+    opportunity, and one line with empty car columns per such owner without
+    cars, optionally restricted to a range of numbers of cars. Like the NDJSON
+    listings, the stream has its own session and reads through a server side
+    cursor.
+
+    :param query: The LeadsQuery with the range of numbers of cars.
+    :return: A streamed CSV response or an error message.
+    """
+    sessionmaker = database.sessionmaker
+    stmt = select_lead_rows(query.min_cars, query.max_cars).execution_options(
+        yield_per=STREAM_BATCH_SIZE
+    )
+
+    async def generate():
+        yield format_csv([LEAD_COLUMNS]).encode()
+        async with sessionmaker() as session:
+            result = await session.stream(stmt)
+            async for rows in result.partitions():
+                yield format_csv(rows).encode()
+
+    return Response(
+        generate(),
+        mimetype=CSV_MIMETYPE,
+        headers={"Content-Disposition": "attachment; filename=leads.csv"},
+    )
+
+
+"""
+Statistics routes
+"""
+
+
+@main.route("/stats", methods=["GET"])
+@jwt_required()
+@validate()
+async def get_stats():
+    """
+    Retrieve the fleet statistics.
+
+    This endpoint returns the number of cars by color and by model, and the
+    number of owners by sale opportunity and by number of cars, read from the
+    counters kept up to date by every write.
+
+    :return: A JSON response with the fleet statistics or an error message.
+    """
+    try:
+        return StatsSchemaOut(**await database.session.run_sync(read_stats))
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Database routes
+"""
+
+
+@main.route("/pool", methods=["GET"])
+@jwt_required()
+@validate()
+async def get_pool_status():
+    """
+    Report the database connection pool.
+
+    This endpoint reports the number of checked out, idle and overflow
+    connections of the async engine.
+
+    :return: A JSON response with the status of the pool or an error message.
+    """
+    try:
+        return jsonify({"data": {"default": pool_status(database.engine.sync_engine)}})
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
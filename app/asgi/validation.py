@@ -0,0 +1,66 @@
+from functools import wraps
+from typing import Type
+
+from flask_pydantic.converters import convert_query_params
+from flask_pydantic.exceptions import JsonBodyParsingError
+from pydantic import BaseModel, RootModel, ValidationError
+from quart import Response, abort, jsonify, request
+
+
+def validate(on_success_status: int = 200):
+    """
+    Async counterpart of `flask_pydantic.validate`.
+
+    Validates the `query` and `body` arguments of a view from their type
+    annotations, answers invalid requests with the same 400 error document as
+    flask_pydantic, and serializes the pydantic models returned by the view,
+    alone or with a dict of headers, with `on_success_status`. Bodies that
+    are not JSON are rejected with a 415.
+    """
+
+    def decorator(view):
+        query_model: Type[BaseModel] | None = view.__annotations__.get("query")
+        body_model: Type[BaseModel] | None = view.__annotations__.get("body")
+
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            errors = {}
+            if query_model is not None:
+                try:
+                    kwargs["query"] = query_model(
+                        **convert_query_params(request.args, query_model)
+                    )
+                except ValidationError as e:
+                    errors["query_params"] = e.errors()
+            if body_model is not None:
+                if not request.is_json:
+                    abort(415)
+                params = await request.get_json()
+                try:
+                    if issubclass(body_model, RootModel):
+                        kwargs["body"] = body_model(params)
+                    else:
+                        kwargs["body"] = body_model(**params)
+                except TypeError:
+                    raise JsonBodyParsingError()
+                except ValidationError as e:
+                    errors["body_params"] = e.errors()
+            if errors:
+                return jsonify({"validation_error": errors}), 400
+
+            result = await view(*args, **kwargs)
+            headers = None
+            if isinstance(result, tuple) and isinstance(result[0], BaseModel):
+                result, headers = result
+            if isinstance(result, BaseModel):
+                return Response(
+                    result.model_dump_json(),
+                    status=on_success_status,
+                    headers=headers,
+                    mimetype="application/json",
+                )
+            return result
+
+        return wrapper
+
+    return decorator
@@ -2,16 +2,22 @@ from flask import Blueprint, jsonify
 from flask_jwt_extended import create_access_token
 from flask_pydantic import validate
 from pydantic import ValidationError
-from werkzeug.security import check_password_hash
 
-from app import db
+from app import db, password_hasher
 
+from .hashing import PasswordHasherBusy
 from .models import User
 from .schemas import UserSchema
 
 auth = Blueprint("auth", __name__)
 
 
+def busy_response():
+    response = jsonify({"msg": "Server busy, try again later"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
 @auth.route("/register", methods=["POST"])
 @validate()
 def register(body: UserSchema):
@@ -36,6 +42,8 @@ def register(body: UserSchema):
         db.session.commit()
 
         return jsonify({"msg": "User registered!"}), 201
+    except PasswordHasherBusy:
+        return busy_response()
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
@@ -49,7 +57,8 @@ def login(body: UserSchema):
     Authenticates a user and generates a JWT token.
 
     This endpoint takes a JSON body containing a username and password,
-    validates the credentials, and if valid, returns a JWT token.
+    validates the credentials, and if valid, returns a JWT token. Passwords
+    stored with outdated hashing parameters are rehashed on success.
 
     :param body: The UserSchema containing the username and password.
     :return: A JSON response with the JWT token or an error message.
@@ -60,12 +69,18 @@ def login(body: UserSchema):
         )
         if user is None:
             return jsonify({"msg": "Wrong credentials"}), 409
-        if check_password_hash(user.password_hash, body.password) is False:
+        if user.check_password(body.password) is False:
             return jsonify({"msg": "Wrong credentials"}), 409
 
+        if password_hasher.needs_rehash(user.password_hash):
+            user.set_password(body.password)
+            db.session.commit()
+
         access_token = create_access_token(identity=user.username)
 
         return jsonify(access_token=access_token), 200
+    except PasswordHasherBusy:
+        return busy_response()
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
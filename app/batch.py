@@ -0,0 +1,261 @@
+from typing import Any, Dict, List, Tuple, Type
+
+from flask_pydantic.exceptions import JsonBodyParsingError
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from .models import (
+    DELETE,
+    MAX_CARS_PER_OWNER,
+    UPSERT,
+    Car,
+    Owner,
+    adjust_car_counts,
+    adjust_fleet_stats,
+    car_count_stats,
+    car_stats,
+    count_cars_of_owners,
+    db,
+    owner_stats,
+    record_changes,
+    record_changes_from,
+)
+from .queries import filter_cars, filter_owners
+from .schemas import CarSchemaIn, CarSchemaOut, OwnerSchemaIn, OwnerSchemaOut
+
+
+def validate_items(
+    schema: Type[BaseModel], items: List[Dict[str, Any]]
+) -> Tuple[List[Tuple[int, BaseModel]], Dict[int, dict]]:
+    """
+    Validates every item of a batch on its own.
+
+    :param schema: The schema used to validate each item.
+    :param items: The raw items of the batch.
+    :return: The valid items with their index, and the errors by index.
+    """
+    valid, errors = [], {}
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item)))
+        except ValidationError as e:
+            errors[index] = item_error(
+                index,
+                400,
+                "Validation error",
+                e.errors(include_url=False, include_context=False),
+            )
+        except JsonBodyParsingError as e:
+            errors[index] = item_error(index, 400, "Validation error", [str(e)])
+    return valid, errors
+
+
+def item_error(index: int, status: int, msg: str, errors: list | None = None) -> dict:
+    error = {"index": index, "status": status, "msg": msg}
+    if errors is not None:
+        error["errors"] = errors
+    return error
+
+
+def collect_results(count: int, created: Dict[int, dict], errors: Dict[int, dict]):
+    """
+    Merges created items and errors into a list ordered like the request.
+
+    :return: The per item results and the HTTP status of the whole batch:
+             201 if every item was created, 207 if only some of them were
+             and 400 if none was.
+    """
+    results = [created.get(index) or errors[index] for index in range(count)]
+    if not errors:
+        status = 201
+    elif created:
+        status = 207
+    else:
+        status = 400
+    return results, status
+
+
+def create_owners(items: List[Dict[str, Any]], session: Session | None = None):
+    """
+    Creates the valid owners of a batch in a single transaction.
+
+    The owners are inserted with one executemany of INSERT ... RETURNING,
+    which SQLAlchemy batches into multi-row INSERTs on PostgreSQL. SQLite
+    does not guarantee the order of the rows returned by a multi-row INSERT,
+    so it runs one INSERT per owner there.
+
+    :param items: The raw owners of the batch.
+    :param session: The session to write with, `db.session` by default.
+    :return: The per item results and the HTTP status of the batch.
+    """
+    if session is None:
+        session = db.session
+    valid, errors = validate_items(OwnerSchemaIn, items)
+    created = {}
+    if valid:
+        ids = session.scalars(
+            insert(Owner).returning(Owner.id, sort_by_parameter_order=True),
+            [{"name": owner.name} for _, owner in valid],
+        ).all()
+        # Bulk INSERTs skip the mapper events maintaining the statistics
+        # and the change feed.
+        adjust_fleet_stats(session.connection(), owner_stats(True, 0, len(ids)))
+        record_changes(
+            session.connection(), UPSERT, [("owner", owner_id) for owner_id in ids]
+        )
+        session.commit()
+        for (index, owner), owner_id in zip(valid, ids):
+            data = OwnerSchemaOut(id=owner_id, name=owner.name, version=1, cars=[])
+            created[index] = {"index": index, "status": 201, "data": data.model_dump()}
+    return collect_results(len(items), created, errors)
+
+
+def create_cars(items: List[Dict[str, Any]], session: Session | None = None):
+    """
+    Creates the valid cars of a batch in a single transaction.
+
+    The owners of the whole batch and their current number of cars are read
+    with one query, which is then used to enforce the limit of cars per owner
+    across the batch before inserting the accepted cars, like the owners of
+    `create_owners`. The counters of the owners are shifted in the same
+    transaction, so a concurrent write past the limit still fails.
+
+    :param items: The raw cars of the batch.
+    :param session: The session to write with, `db.session` by default.
+    :return: The per item results and the HTTP status of the batch.
+    """
+    if session is None:
+        session = db.session
+    valid, errors = validate_items(CarSchemaIn, items)
+    owner_ids = {car.owner_id for _, car in valid}
+    car_counts = dict(
+        session.execute(
+            select(Owner.id, Owner.car_count).where(Owner.id.in_(owner_ids))
+        ).all()
+    )
+
+    accepted = []
+    for index, car in valid:
+        if car.owner_id not in car_counts:
+            errors[index] = item_error(index, 404, "Owner not found")
+        elif car_counts[car.owner_id] >= MAX_CARS_PER_OWNER:
+            errors[index] = item_error(
+                index, 400, "An owner cannot have more than 3 cars"
+            )
+        else:
+            car_counts[car.owner_id] += 1
+            accepted.append((index, car))
+
+    created = {}
+    if accepted:
+        ids = session.scalars(
+            insert(Car).returning(Car.id, sort_by_parameter_order=True),
+            [car.model_dump() for _, car in accepted],
+        ).all()
+        deltas = {}
+        for _, car in accepted:
+            deltas[car.owner_id] = deltas.get(car.owner_id, 0) + 1
+        num_cars = adjust_car_counts(session.connection(), deltas)
+        stats = []
+        for _, car in accepted:
+            stats += car_stats(car.color, car.model, 1)
+        for owner_id, count in num_cars.items():
+            stats += car_count_stats(count - deltas[owner_id], count)
+        adjust_fleet_stats(session.connection(), stats)
+        record_changes(
+            session.connection(), UPSERT, [("car", car_id) for car_id in ids]
+        )
+        session.commit()
+        for (index, car), car_id in zip(accepted, ids):
+            data = CarSchemaOut(id=car_id, version=1, **car.model_dump())
+            created[index] = {"index": index, "status": 201, "data": data.model_dump()}
+    return collect_results(len(items), created, errors)
+
+
+def delete_cars(
+    owner_id: int | None = None,
+    color: str | None = None,
+    model: str | None = None,
+    session: Session | None = None,
+) -> int:
+    """
+    Deletes the cars matching the filters with a single DELETE.
+
+    The statement returns the deleted cars, from which the counters of their
+    owners and the fleet statistics are shifted in the same transaction.
+
+    :param owner_id: The ID of the owner of the cars, if any.
+    :param color: The color of the cars, if any.
+    :param model: The model of the cars, if any.
+    :param session: The session to write with, `db.session` by default.
+    :return: The number of deleted cars.
+    """
+    if session is None:
+        session = db.session
+    table = Car.__table__
+    stmt = filter_cars(delete(table), owner_id, color, model).returning(
+        table.c.id, table.c.owner_id, table.c.color, table.c.model
+    )
+    connection = session.connection()
+    cars = connection.execute(stmt).all()
+
+    deltas, stats = {}, []
+    for car in cars:
+        deltas[car.owner_id] = deltas.get(car.owner_id, 0) - 1
+        stats += car_stats(car.color, car.model, -1)
+    num_cars = adjust_car_counts(connection, deltas)
+    for owner_id, count in num_cars.items():
+        stats += car_count_stats(count - deltas[owner_id], count)
+    adjust_fleet_stats(connection, stats)
+    record_changes(connection, DELETE, [("car", car.id) for car in cars])
+    session.commit()
+    return len(cars)
+
+
+def delete_owners(
+    sale_opportunity: bool | None = None,
+    min_cars: int | None = None,
+    max_cars: int | None = None,
+    session: Session | None = None,
+    owner_id: int | None = None,
+) -> int:
+    """
+    Deletes the owners matching the filters with a single DELETE.
+
+    Their cars are deleted by the database, see `Car.owner_id`. They are
+    counted beforehand, with the owners locked so that no car is added to
+    them in between, to shift the fleet statistics in the same transaction.
+
+    :param sale_opportunity: Whether the owners are sale opportunities, if given.
+    :param min_cars: The minimum number of cars of the owners, if any.
+    :param max_cars: The maximum number of cars of the owners, if any.
+    :param session: The session to write with, `db.session` by default.
+    :param owner_id: The ID of the owner to delete, if a single one.
+    :return: The number of deleted owners.
+    """
+    if session is None:
+        session = db.session
+    table = Owner.__table__
+    connection = session.connection()
+    owner_ids = filter_owners(select(table.c.id), sale_opportunity, min_cars, max_cars)
+    stmt = filter_owners(delete(table), sale_opportunity, min_cars, max_cars)
+    if owner_id is not None:
+        owner_ids = owner_ids.where(table.c.id == owner_id)
+        stmt = stmt.where(table.c.id == owner_id)
+    stats = count_cars_of_owners(connection, owner_ids)
+    cars = Car.__table__
+    record_changes_from(
+        connection,
+        DELETE,
+        select(literal("car"), cars.c.id).where(cars.c.owner_id.in_(owner_ids)),
+    )
+    stmt = stmt.returning(table.c.id, table.c.sale_opportunity, table.c.num_cars)
+    owners = connection.execute(stmt).all()
+    record_changes(connection, DELETE, [("owner", owner.id) for owner in owners])
+
+    for owner in owners:
+        stats += owner_stats(owner.sale_opportunity, owner.num_cars, -1)
+    adjust_fleet_stats(connection, stats)
+    session.commit()
+    return len(owners)
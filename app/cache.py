@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import wraps
+
+from flask import Flask, Response, current_app, make_response, request
+
+from app.compression import CachedEncodings, accepted_encoding, compressible
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    mimetype: str
+    etag: str
+    expires: float
+    encodings: CachedEncodings = field(default_factory=CachedEncodings)
+
+
+class ResponseStore:
+    """
+    Thread safe LRU of serialized responses with a time to live.
+
+    Entries are keyed by the version of the data they were built from. Writes
+    bump the version, so responses computed before a write can never be
+    served after it, even when they are stored once the write is done.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body: bytes, mimetype: str) -> CachedResponse:
+        entry = CachedResponse(
+            body=body,
+            mimetype=mimetype,
+            etag=hashlib.blake2b(body, digest_size=16).hexdigest(),
+            expires=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            if key[0] == self.version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+
+class ResponseCache:
+    """
+    Flask extension caching the serialized responses of GET views.
+
+    Cached views answer `If-None-Match` requests with a 304 straight from the
+    cache, without querying the database or serializing anything. The cache
+    is local to each process and bounded by `RESPONSE_CACHE_SIZE` entries
+    living `RESPONSE_CACHE_TTL` seconds, which also bounds how stale a
+    process can be after a write handled by another process.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("RESPONSE_CACHE_SIZE", 256)
+        app.config.setdefault("RESPONSE_CACHE_TTL", 5.0)
+        app.extensions["response_cache"] = {"store": None, "lock": threading.Lock()}
+
+    @property
+    def store(self) -> ResponseStore:
+        state = current_app.extensions["response_cache"]
+        with state["lock"]:
+            if state["store"] is None:
+                state["store"] = ResponseStore(
+                    maxsize=current_app.config["RESPONSE_CACHE_SIZE"],
+                    ttl=current_app.config["RESPONSE_CACHE_TTL"],
+                )
+            return state["store"]
+
+    def invalidate(self):
+        self.store.invalidate()
+
+    def cached(self, view):
+        """
+        Caches the 200 responses of a GET view by path, query string and
+        Accept header. Streamed responses are never cached.
+        """
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            store = self.store
+            if request.method != "GET" or store.maxsize <= 0:
+                return view(*args, **kwargs)
+
+            key = (
+                store.version,
+                request.path,
+                tuple(sorted(request.args.items(multi=True))),
+                request.headers.get("Accept", ""),
+            )
+            entry = store.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = store.put(key, response.get_data(), response.mimetype)
+
+            varies = compressible(entry.mimetype, len(entry.body))
+            encoding = accepted_encoding() if varies else None
+            etag = entry.etag if encoding is None else f"{entry.etag}-{encoding}"
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            elif encoding is None:
+                response = Response(entry.body, mimetype=entry.mimetype)
+            else:
+                body = entry.encodings.get(entry.body, encoding)
+                response = Response(body, mimetype=entry.mimetype)
+                response.headers["Content-Encoding"] = encoding
+            if varies:
+                response.vary.add("Accept-Encoding")
+            response.set_etag(etag)
+            return response
+
+        return wrapper
@@ -0,0 +1,242 @@
+"""
+Change feed of the owners and cars.
+
+Every write appends the changed owners and cars to the `change` table, in
+the transaction of the write, see `record_changes`. Clients sync
+incrementally by reading the entries after the last sequence they saw,
+instead of listing every owner and car again.
+
+Sequences are not allocated by the writers: a transaction that inserted an
+entry before another could commit after it, and a client reading in between
+would skip it for good. Instead, readers sequence the entries committed so
+far, in one short transaction, before reading. Entries committed later get
+higher sequences, whatever the order of their INSERTs, and writers never
+wait on the feed.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Tuple
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Exists, Select, Table, and_, delete, exists, func, select, update
+from sqlalchemy.orm import Session
+
+from .models import DELETE, UPSERT, Car, Change, ChangeHorizon, Owner, db
+from .schemas import (
+    CarSchemaOut,
+    ChangeSchemaOut,
+    ChangesPageOut,
+    OwnerSummarySchemaOut,
+)
+
+# Deleted owners and cars are kept in the feed for 7 days by default.
+DEFAULT_RETENTION = 7 * 24 * 3600.0
+# Any constant identifying the lock of the change feed among advisory locks.
+CHANGE_FEED_LOCK = 0x63686E67
+
+
+class ChangesCompacted(LookupError):
+    pass
+
+
+def sequence_changes(session: Session):
+    """
+    Assigns sequences to the committed entries that have none, in the order
+    they were inserted, after every sequence assigned so far.
+
+    Runs on the primary and commits, so that the sequences are final before
+    they are read. On PostgreSQL concurrent calls are serialized by a
+    transaction level advisory lock. Only the readers of the feed take it,
+    for the duration of a single UPDATE, and only when there are entries to
+    sequence. SQLite already serializes writers.
+    """
+    connection = session.connection()
+    change = Change.__table__
+    unsequenced = select(change.c.id).where(change.c.seq.is_(None)).limit(1)
+    if connection.execute(unsequenced).first() is None:
+        return
+    if connection.dialect.name == "postgresql":
+        connection.execute(select(func.pg_advisory_xact_lock(CHANGE_FEED_LOCK)))
+
+    # Read after the lock, so the sequences assigned by the previous holder
+    # are seen. The horizon keeps the sequences of the compacted entries
+    # from being assigned again.
+    last_seq, horizon = connection.execute(
+        select(
+            func.max(change.c.seq),
+            select(ChangeHorizon.seq).where(ChangeHorizon.id == 1).scalar_subquery(),
+        )
+    ).one()
+    start = max(last_seq or 0, horizon or 0)
+    numbered = (
+        select(
+            change.c.id,
+            (start + func.row_number().over(order_by=change.c.id)).label("seq"),
+        )
+        .where(change.c.seq.is_(None))
+        .subquery()
+    )
+    connection.execute(
+        update(change).where(change.c.id == numbered.c.id).values(seq=numbered.c.seq)
+    )
+    session.commit()
+
+
+def superseded(change: Table) -> Exists:
+    """
+    Tells whether a newer entry of the same owner or car exists.
+    """
+    newer = Change.__table__.alias("newer")
+    return exists().where(
+        newer.c.entity == change.c.entity,
+        newer.c.entity_id == change.c.entity_id,
+        newer.c.seq > change.c.seq,
+    )
+
+
+def select_changes(since: int) -> Select:
+    """
+    Builds the statement that reads the change feed after `since`.
+
+    Only the latest entry of each owner and car is read, along with the
+    current state of the owners and cars that still exist.
+
+    :param since: The sequence of the last entry read by the client.
+    :return: A SELECT statement of the entries ordered by sequence.
+    """
+    change, owner, car = Change.__table__, Owner.__table__, Car.__table__
+    return (
+        select(
+            change.c.seq,
+            change.c.entity,
+            change.c.entity_id,
+            change.c.op,
+            owner.c.name,
+            owner.c.version.label("owner_version"),
+            car.c.owner_id,
+            car.c.color,
+            car.c.model,
+            car.c.version.label("car_version"),
+        )
+        .outerjoin(
+            owner, and_(change.c.entity == "owner", owner.c.id == change.c.entity_id)
+        )
+        .outerjoin(car, and_(change.c.entity == "car", car.c.id == change.c.entity_id))
+        .where(change.c.seq > since, ~superseded(change))
+        .order_by(change.c.seq)
+    )
+
+
+def change_data(row) -> OwnerSummarySchemaOut | CarSchemaOut | None:
+    if row.op == UPSERT and row.owner_version is not None:
+        return OwnerSummarySchemaOut(
+            id=row.entity_id, name=row.name, version=row.owner_version
+        )
+    if row.op == UPSERT and row.car_version is not None:
+        return CarSchemaOut(
+            id=row.entity_id,
+            owner_id=row.owner_id,
+            color=row.color,
+            model=row.model,
+            version=row.car_version,
+        )
+    return None
+
+
+def read_changes(session: Session, since: int, limit: int) -> ChangesPageOut:
+    """
+    Reads a page of the change feed.
+
+    :param session: The session to read with. The entries are sequenced
+                    on the primary first, see `sequence_changes`, and may then
+                    be read from a replica: a lagging replica only misses the
+                    latest entries, which the next page returns.
+    :param since: The sequence of the last entry read by the client, 0 to
+                  read the whole feed.
+    :param limit: The maximum number of entries of the page.
+    :raises ChangesCompacted: If deletions after `since` were compacted.
+    :return: The entries and the sequence to read the next page from.
+    """
+    sequence_changes(session)
+    rows = session.execute(select_changes(since).limit(limit + 1)).all()
+    # Read after the entries, so a compaction committed in between is seen.
+    horizon = session.scalar(select(ChangeHorizon.seq).where(ChangeHorizon.id == 1))
+    if since and horizon is not None and since < horizon:
+        raise ChangesCompacted(since)
+
+    entries = [
+        ChangeSchemaOut(
+            seq=row.seq,
+            entity=row.entity,
+            id=row.entity_id,
+            op=row.op,
+            data=change_data(row),
+        )
+        for row in rows[:limit]
+    ]
+    return ChangesPageOut(
+        data=entries,
+        next_since=entries[-1].seq if entries else since,
+        has_more=len(rows) > limit,
+    )
+
+
+def compact_changes(session: Session, retention: float) -> Tuple[int, int]:
+    """
+    Compacts the change feed.
+
+    Entries superseded by a newer entry of the same owner or car are never
+    read, so they are deleted. Deleted owners and cars are kept for
+    `retention` seconds, after which clients that did not read the feed since
+    are told to list the owners and cars again.
+
+    :param session: The session to write with.
+    :param retention: The number of seconds to keep the deleted entries.
+    :return: The number of superseded and of deleted entries dropped.
+    """
+    sequence_changes(session)
+    change = Change.__table__
+    superseded_count = session.execute(
+        delete(change).where(superseded(change))
+    ).rowcount
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=retention)
+    seqs = session.scalars(
+        delete(change)
+        .where(
+            change.c.op == DELETE,
+            change.c.seq.is_not(None),
+            change.c.changed_at < cutoff,
+        )
+        .returning(change.c.seq)
+    ).all()
+    if seqs:
+        horizon = session.get(ChangeHorizon, 1)
+        if horizon is None:
+            session.add(ChangeHorizon(id=1, seq=max(seqs)))
+        else:
+            horizon.seq = max(horizon.seq, *seqs)
+    session.commit()
+    return superseded_count, len(seqs)
+
+
+changes_cli = AppGroup("changes", help="Manage the change feed.")
+
+
+@changes_cli.command("compact")
+@click.option(
+    "--retention",
+    type=float,
+    default=None,
+    help="Seconds to keep the deleted owners and cars, CHANGES_RETENTION by default.",
+)
+def compact_command(retention):
+    """Drop the superseded and expired entries of the change feed."""
+    if retention is None:
+        retention = current_app.config.get("CHANGES_RETENTION", DEFAULT_RETENTION)
+    superseded_count, deleted_count = compact_changes(db.session, retention)
+    click.echo(
+        f"Dropped {superseded_count} superseded and {deleted_count} deleted entries."
+    )
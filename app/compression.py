@@ -0,0 +1,203 @@
+"""
+Compression of the responses negotiated through `Accept-Encoding`.
+
+Listings of owners with their cars are large and very repetitive JSON, which
+gzip, deflate and brotli shrink by an order of magnitude. Brotli is offered
+when the `brotli` package is installed.
+"""
+
+import threading
+import zlib
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+from flask import Flask, Response, current_app, request
+
+COMPRESSIBLE_MIMETYPES = frozenset(
+    {
+        "application/json",
+        "application/x-ndjson",
+        "text/csv",
+        "text/html",
+        "text/plain",
+    }
+)
+# Window bits of zlib for each encoding: gzip and zlib (deflate) framing.
+ZLIB_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+@lru_cache
+def brotli_module():
+    # Imported on first use, `import app` does not need it.
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def available_encodings() -> tuple:
+    """
+    Lists the supported encodings, most preferred first.
+    """
+    if brotli_module() is None:
+        return ("gzip", "deflate")
+    return ("br", "gzip", "deflate")
+
+
+class BrotliCompressor:
+    """
+    Streaming brotli compressor with the interface of the zlib ones.
+    """
+
+    def __init__(self, quality: int):
+        self._compressor = brotli_module().Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compressor(encoding: str):
+    """
+    Creates a streaming compressor for `encoding`, at the levels configured
+    by `COMPRESSION_LEVEL` and `COMPRESSION_BROTLI_QUALITY`.
+
+    :return: An object whose `compress` returns the compressed data available
+             so far and whose `flush` returns the rest.
+    """
+    config = current_app.config
+    if encoding == "br":
+        return BrotliCompressor(config["COMPRESSION_BROTLI_QUALITY"])
+    return zlib.compressobj(
+        config["COMPRESSION_LEVEL"], zlib.DEFLATED, ZLIB_WBITS[encoding]
+    )
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    stream = compressor(encoding)
+    return stream.compress(body) + stream.flush()
+
+
+def compress_stream(chunks: Iterable[bytes | str], stream) -> Iterator[bytes]:
+    """
+    Compresses a streamed body on the fly.
+
+    The compressor emits its output as its blocks fill up, so the memory used
+    by the response stays bounded, as it is without compression.
+
+    :param chunks: The chunks of the body.
+    :param stream: The compressor, see `compressor`. It is created while the
+                   request is handled, as the app is gone once the body is
+                   streamed.
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = stream.compress(chunk)
+            if data:
+                yield data
+        yield stream.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def compressible(mimetype: str, size: int | None) -> bool:
+    """
+    Tells whether a body may be compressed, i.e. whether its representation
+    depends on the `Accept-Encoding` header.
+
+    :param mimetype: The media type of the body.
+    :param size: The length of the body, or None for a streamed body, which
+                 is always compressed.
+    """
+    config = current_app.config
+    if not config["COMPRESSION_ENABLED"] or mimetype not in COMPRESSIBLE_MIMETYPES:
+        return False
+    return size is None or size >= config["COMPRESSION_MIN_SIZE"]
+
+
+def accepted_encoding() -> str | None:
+    """
+    Picks the encoding preferred by the client among the supported ones.
+
+    :return: The encoding, or None if the client accepts none of them.
+    """
+    return request.accept_encodings.best_match(available_encodings())
+
+
+class CachedEncodings:
+    """
+    Thread safe map of the compressed bodies of a cached response, so that a
+    listing served from the cache is compressed once per encoding.
+    """
+
+    def __init__(self):
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def get(self, body: bytes, encoding: str) -> bytes:
+        with self._lock:
+            compressed = self._bodies.get(encoding)
+        if compressed is None:
+            compressed = compress(body, encoding)
+            with self._lock:
+                compressed = self._bodies.setdefault(encoding, compressed)
+        return compressed
+
+
+class Compression:
+    """
+    Flask extension compressing the responses of the clients sending an
+    `Accept-Encoding` header.
+
+    JSON, NDJSON, CSV and text bodies of at least `COMPRESSION_MIN_SIZE`
+    bytes are compressed with the encoding preferred by the client, at
+    `COMPRESSION_LEVEL` for gzip and deflate and `COMPRESSION_BROTLI_QUALITY`
+    for brotli. Streamed bodies are compressed chunk by chunk, whatever their
+    size. Responses of cached views are compressed by ResponseCache, which
+    keeps the compressed bodies along the cached one. Set
+    `COMPRESSION_ENABLED` to False to turn compression off, e.g. behind a
+    proxy that compresses.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("COMPRESSION_ENABLED", True)
+        app.config.setdefault("COMPRESSION_MIN_SIZE", 1024)
+        app.config.setdefault("COMPRESSION_LEVEL", 6)
+        app.config.setdefault("COMPRESSION_BROTLI_QUALITY", 4)
+        app.after_request(self._compress)
+
+    def _compress(self, response: Response) -> Response:
+        if (
+            not 200 <= response.status_code < 300
+            or response.status_code in (204, 206)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.cache_control.no_transform
+        ):
+            return response
+        size = None if response.is_streamed else len(response.get_data())
+        if not compressible(response.mimetype, size):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = accepted_encoding()
+        if encoding is None:
+            return response
+
+        if size is None:
+            response.response = compress_stream(response.response, compressor(encoding))
+            response.headers.pop("Content-Length", None)
+        else:
+            response.set_data(compress(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -2,20 +2,69 @@ from functools import lru_cache
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from app.pool import InstrumentedQueuePool
 
-class Settings(BaseSettings):
+
+class ServeSettings(BaseSettings):
+    """
+    Settings of the server process, which do not need the database or JWT
+    settings to be set.
+    """
+
+    serve_host: str = "0.0.0.0"
+    serve_port: int = 5000
+    serve_workers: int | None = None
+    serve_threads: int = 1
+    serve_max_requests: int = 0
+    serve_timeout: int = 30
+    serve_graceful_timeout: int = 30
+
+    model_config = SettingsConfigDict(
+        env_file=".env", extra="ignore", populate_by_name=True
+    )
+
+
+class Settings(ServeSettings):
     database_driver: str
     database_host: str
     database_port: int
     database_user: str
     database_password: str
     database_dbname: str
+    database_async_driver: str = "postgresql+asyncpg"
+
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_recycle: int = 1800
+    database_pool_timeout: float = 30.0
+    database_pool_pre_ping: bool = True
+    database_statement_timeout_ms: int | None = None
+    database_replica_uris: list[str] = []
 
     jwt_secret_key: str
 
-    model_config = SettingsConfigDict(
-        env_file=".env", extra="ignore", populate_by_name=True
-    )
+    password_hash_method: str = "scrypt"
+    password_hash_salt_length: int = 16
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 32
+    password_hash_timeout: float = 10.0
+
+    response_cache_size: int = 256
+    response_cache_ttl: float = 5.0
+
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    compression_level: int = 6
+    compression_brotli_quality: int = 4
+
+    idempotency_ttl: float = 86400.0
+    idempotency_lease: float = 60.0
+    idempotency_cache_size: int = 1024
+    idempotency_wait_timeout: float = 10.0
+
+    changes_retention: float = 7 * 24 * 3600.0
+
+    metrics_enabled: bool = True
 
     def get_sql_alch_dbconnstr(self):
         return (
@@ -23,13 +72,94 @@ class Settings(BaseSettings):
             + f":{self.database_port}/{self.database_dbname}"
         )
 
+    def get_sql_alch_async_dbconnstr(self):
+        return (
+            f"{self.database_async_driver}://{self.database_user}:{self.database_password}@{self.database_host}"
+            + f":{self.database_port}/{self.database_dbname}"
+        )
+
+    def get_sql_alch_binds(self):
+        return {f"replica_{i}": uri for i, uri in enumerate(self.database_replica_uris)}
+
+    def get_sql_alch_engine_options(self):
+        options = {
+            "poolclass": InstrumentedQueuePool,
+            "pool_size": self.database_pool_size,
+            "max_overflow": self.database_max_overflow,
+            "pool_recycle": self.database_pool_recycle,
+            "pool_timeout": self.database_pool_timeout,
+            "pool_pre_ping": self.database_pool_pre_ping,
+        }
+        if self.database_statement_timeout_ms and self.database_driver.startswith(
+            "postgresql"
+        ):
+            options["connect_args"] = {
+                "options": f"-c statement_timeout={self.database_statement_timeout_ms}"
+            }
+        return options
+
+    def get_sql_alch_async_engine_options(self):
+        options = {
+            "pool_size": self.database_pool_size,
+            "max_overflow": self.database_max_overflow,
+            "pool_recycle": self.database_pool_recycle,
+            "pool_timeout": self.database_pool_timeout,
+            "pool_pre_ping": self.database_pool_pre_ping,
+        }
+        if self.database_statement_timeout_ms and self.database_async_driver.endswith(
+            "asyncpg"
+        ):
+            options["connect_args"] = {
+                "server_settings": {
+                    "statement_timeout": str(self.database_statement_timeout_ms)
+                }
+            }
+        return options
+
 
 @lru_cache
 def get_settings():
     return Settings()
 
 
-class Config:
-    SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
-    SQLALCHEMY_DATABASE_URI = get_settings().get_sql_alch_dbconnstr()
-    JWT_SECRET_KEY = get_settings().jwt_secret_key
+@lru_cache
+def get_serve_settings():
+    return ServeSettings()
+
+
+def get_config() -> dict:
+    """
+    Builds the Flask configuration from the settings.
+
+    The settings are read from the environment on the first call, when an app
+    is created, rather than when this module is imported.
+
+    :return: The configuration keys of the app.
+    """
+    settings = get_settings()
+    return {
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SQLALCHEMY_DATABASE_URI": settings.get_sql_alch_dbconnstr(),
+        "SQLALCHEMY_ENGINE_OPTIONS": settings.get_sql_alch_engine_options(),
+        "SQLALCHEMY_BINDS": settings.get_sql_alch_binds(),
+        "SQLALCHEMY_ASYNC_DATABASE_URI": settings.get_sql_alch_async_dbconnstr(),
+        "SQLALCHEMY_ASYNC_ENGINE_OPTIONS": settings.get_sql_alch_async_engine_options(),
+        "JWT_SECRET_KEY": settings.jwt_secret_key,
+        "PASSWORD_HASH_METHOD": settings.password_hash_method,
+        "PASSWORD_HASH_SALT_LENGTH": settings.password_hash_salt_length,
+        "PASSWORD_HASH_WORKERS": settings.password_hash_workers,
+        "PASSWORD_HASH_MAX_PENDING": settings.password_hash_max_pending,
+        "PASSWORD_HASH_TIMEOUT": settings.password_hash_timeout,
+        "RESPONSE_CACHE_SIZE": settings.response_cache_size,
+        "RESPONSE_CACHE_TTL": settings.response_cache_ttl,
+        "COMPRESSION_ENABLED": settings.compression_enabled,
+        "COMPRESSION_MIN_SIZE": settings.compression_min_size,
+        "COMPRESSION_LEVEL": settings.compression_level,
+        "COMPRESSION_BROTLI_QUALITY": settings.compression_brotli_quality,
+        "IDEMPOTENCY_TTL": settings.idempotency_ttl,
+        "IDEMPOTENCY_LEASE": settings.idempotency_lease,
+        "IDEMPOTENCY_CACHE_SIZE": settings.idempotency_cache_size,
+        "IDEMPOTENCY_WAIT_TIMEOUT": settings.idempotency_wait_timeout,
+        "CHANGES_RETENTION": settings.changes_retention,
+        "METRICS_ENABLED": settings.metrics_enabled,
+    }
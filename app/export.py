@@ -0,0 +1,120 @@
+import csv
+import io
+import sys
+from typing import Iterator
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Select, and_, or_, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from .models import Car, Owner, db
+from .queries import filter_owners
+from .replicas import resume_on_primary
+from .streaming import STREAM_BATCH_SIZE
+
+CSV_MIMETYPE = "text/csv"
+LEAD_COLUMNS = ("owner_id", "owner_name", "num_cars", "car_id", "color", "model")
+
+
+def select_lead_rows(
+    min_cars: int | None = None, max_cars: int | None = None
+) -> Select:
+    """
+    Builds the statement that lists the sale opportunities and their cars.
+
+    Owners are read in ID order through the partial index of the sale
+    opportunities, `ix_owner_leads`, and their cars through the index on
+    `car.owner_id`, so no sort is needed. Owners without cars are listed
+    once, with empty car columns.
+
+    :param min_cars: The minimum number of cars of the owners, if any.
+    :param max_cars: The maximum number of cars of the owners, if any.
+    :return: A SELECT statement of the `LEAD_COLUMNS`.
+    """
+    stmt = (
+        select(Owner.id, Owner.name, Owner.num_cars, Car.id, Car.color, Car.model)
+        .outerjoin(Car, Car.owner_id == Owner.id)
+        .order_by(Owner.id, Car.id)
+    )
+    return filter_owners(stmt, True, min_cars, max_cars)
+
+
+def after_lead(owner_id: int, car_id: int | None):
+    """
+    Builds the condition selecting the rows of `select_lead_rows` that follow
+    the given one.
+
+    The row of an owner without cars, whose car ID is NULL, is the only row
+    of that owner, so the rows that follow it are those of the next owners.
+    """
+    if car_id is None:
+        return Owner.id > owner_id
+    return or_(Owner.id > owner_id, and_(Owner.id == owner_id, Car.id > car_id))
+
+
+def format_csv(rows) -> str:
+    """
+    Writes `rows` as CSV lines.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+
+def iter_leads_csv(
+    session: Session, min_cars: int | None = None, max_cars: int | None = None
+) -> Iterator[str]:
+    """
+    Streams the sale opportunities and their cars as CSV.
+
+    Rows are fetched `STREAM_BATCH_SIZE` at a time through a server side
+    cursor and each batch is written as one chunk, so memory stays flat
+    whatever the number of rows. If the replica of a read-only request fails
+    meanwhile, the export goes on with the rows that follow the last one
+    written, read from the primary, see `resume_on_primary`.
+
+    :param session: The session to read with.
+    :param min_cars: The minimum number of cars of the owners, if any.
+    :param max_cars: The maximum number of cars of the owners, if any.
+    :return: An iterator of CSV chunks, starting with the header.
+    """
+    yield format_csv([LEAD_COLUMNS])
+    stmt = select_lead_rows(min_cars, max_cars)
+    last = None
+    while True:
+        query = stmt if last is None else stmt.where(after_lead(*last))
+        try:
+            result = session.execute(
+                query.execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            for rows in result.partitions():
+                yield format_csv(rows)
+                # The owner and car IDs, the columns share the name `id`.
+                last = (rows[-1][0], rows[-1][3])
+            return
+        except DBAPIError:
+            if not resume_on_primary(session):
+                raise
+
+
+@click.command("export-leads")
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, writable=True),
+    help="The CSV file to write, the standard output by default.",
+)
+@click.option("--min-cars", type=click.IntRange(0), help="Minimum number of cars.")
+@click.option("--max-cars", type=click.IntRange(0), help="Maximum number of cars.")
+@with_appcontext
+def export_leads_command(output, min_cars, max_cars):
+    """Export the sale opportunities and their cars as CSV."""
+    file = open(output, "w", newline="") if output else sys.stdout
+    try:
+        for chunk in iter_leads_csv(db.session, min_cars, max_cars):
+            file.write(chunk)
+    finally:
+        if output:
+            file.close()
@@ -0,0 +1,171 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import cached_property
+
+from flask import Flask, current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when every hashing slot is taken, so callers can fail fast."""
+
+    pass
+
+
+class HashingPool:
+    """
+    Runs password hashing on a bounded pool of worker processes.
+
+    At most `workers + max_pending` hashes are running or queued at any time.
+    Submitting past that raises PasswordHasherBusy instead of queueing, so a
+    burst of logins cannot pile up behind the pool. With no workers, hashes
+    run inline on the calling thread but are bounded the same way.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_pending: int,
+        timeout: float,
+        method: str,
+        salt_length: int,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.method = method
+        self.salt_length = salt_length
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        """
+        Schedules `fn(*args)` if a slot is free.
+
+        :raises PasswordHasherBusy: If the pool and its queue are full.
+        :return: A future with the result of the call.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        if not self.workers:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._slots.release()
+            return future
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        try:
+            return self.submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordHasherBusy()
+
+    async def run_async(self, fn, *args):
+        """
+        Awaits `fn(*args)` without blocking the event loop while it runs.
+        """
+        try:
+            future = asyncio.wrap_future(self.submit(fn, *args))
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise PasswordHasherBusy()
+
+    def hash(self, password: str) -> str:
+        return self.run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self.run(check_password_hash, pwhash, password)
+
+    async def hash_async(self, password: str) -> str:
+        return await self.run_async(
+            generate_password_hash, password, self.method, self.salt_length
+        )
+
+    async def verify_async(self, pwhash: str, password: str) -> bool:
+        return await self.run_async(check_password_hash, pwhash, password)
+
+    @cached_property
+    def method_prefix(self) -> str:
+        # werkzeug expands the method with its default parameters, e.g.
+        # "scrypt" is stored as "scrypt:32768:8:1".
+        return generate_password_hash("", self.method, salt_length=1).split("$")[0]
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """
+        Tells whether a stored hash was made with outdated parameters.
+        """
+        method, _, rest = pwhash.partition("$")
+        salt = rest.partition("$")[0]
+        return method != self.method_prefix or len(salt) != self.salt_length
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class PasswordHasher:
+    """
+    Flask extension giving access to the HashingPool of the current app.
+
+    The pool is built on first use from the `PASSWORD_HASH_*` settings of the
+    app, so they can still be changed after `init_app`.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("PASSWORD_HASH_METHOD", "scrypt")
+        app.config.setdefault("PASSWORD_HASH_SALT_LENGTH", 16)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", 0)
+        app.config.setdefault("PASSWORD_HASH_MAX_PENDING", 32)
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10.0)
+        app.extensions["password_hasher"] = {"pool": None, "lock": threading.Lock()}
+
+    @property
+    def pool(self) -> HashingPool:
+        state = current_app.extensions["password_hasher"]
+        with state["lock"]:
+            if state["pool"] is None:
+                config = current_app.config
+                state["pool"] = HashingPool(
+                    workers=config["PASSWORD_HASH_WORKERS"],
+                    max_pending=config["PASSWORD_HASH_MAX_PENDING"],
+                    timeout=config["PASSWORD_HASH_TIMEOUT"],
+                    method=config["PASSWORD_HASH_METHOD"],
+                    salt_length=config["PASSWORD_HASH_SALT_LENGTH"],
+                )
+            return state["pool"]
+
+    def hash(self, password: str) -> str:
+        return self.pool.hash(password)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self.pool.verify(pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        return self.pool.needs_rehash(pwhash)
@@ -0,0 +1,425 @@
+"""
+Idempotency keys of the POST endpoints.
+
+Clients retry a POST that timed out with the same `Idempotency-Key` header.
+The first request claims the key and stores its response, which is replayed
+to every retry without running the view again. A retry arriving while the
+first request is still running waits for its response instead of racing it.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import click
+from flask import Flask, Response, current_app, jsonify, make_response, request
+from flask.cli import AppGroup
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    mimetype: str
+    body: bytes
+
+
+@dataclass
+class IdempotencyState:
+    responses: "ResponseLRU"
+    in_flight: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ResponseLRU:
+    """
+    Thread safe LRU of the stored responses, with a time to live.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope) -> StoredResponse | None:
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None:
+                return None
+            response, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[scope]
+                return None
+            self._entries.move_to_end(scope)
+            return response
+
+    def put(self, scope, response: StoredResponse):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[scope] = (response, time.monotonic() + self.ttl)
+            self._entries.move_to_end(scope)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def key_table():
+    # The models import the extensions, which import this module.
+    from .models import IdempotencyKey
+
+    return IdempotencyKey.__table__
+
+
+def claim_key(
+    session: Session, username: str, key: str, fingerprint: str, lease: float
+) -> bool:
+    """
+    Claims a key for the request about to run, with a single upsert.
+
+    The claim is committed at once, so that retries see it. A key whose
+    response or claim expired is claimed again.
+
+    :param session: The session to write with.
+    :param username: The user who sent the key.
+    :param key: The idempotency key.
+    :param fingerprint: The fingerprint of the request, see `fingerprint`.
+    :param lease: The number of seconds the claim lasts if the request never
+                  completes, e.g. because its worker was killed.
+    :return: Whether the key was claimed.
+    """
+    # Imported on first use, `import app` does not need the dialects.
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    now = utcnow()
+    table = key_table()
+    dialect = (
+        postgresql if session.connection().dialect.name == "postgresql" else sqlite
+    )
+    stmt = dialect.insert(table).values(
+        username=username,
+        key=key,
+        fingerprint=fingerprint,
+        expires_at=now + timedelta(seconds=lease),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.username, table.c.key],
+        set_={
+            "fingerprint": stmt.excluded.fingerprint,
+            "status_code": None,
+            "mimetype": None,
+            "body": None,
+            "expires_at": stmt.excluded.expires_at,
+        },
+        where=table.c.expires_at <= now,
+    ).returning(table.c.key)
+    claimed = session.execute(stmt).first() is not None
+    session.commit()
+    return claimed
+
+
+def read_key(session: Session, username: str, key: str):
+    """
+    Reads a key that has not expired.
+
+    :return: The key, whose `status_code` is None while the request that
+             claimed it is running, or None if there is no such key.
+    """
+    table = key_table()
+    stmt = select(
+        table.c.fingerprint, table.c.status_code, table.c.mimetype, table.c.body
+    ).where(
+        table.c.username == username,
+        table.c.key == key,
+        table.c.expires_at > utcnow(),
+    )
+    row = session.execute(stmt).first()
+    # End the transaction, so the next poll sees the writes committed since.
+    session.commit()
+    return row
+
+
+def store_response(
+    session: Session, username: str, key: str, response: StoredResponse, ttl: float
+):
+    """
+    Stores the response of the request that claimed a key, in the transaction
+    of its write. The caller commits.
+    """
+    table = key_table()
+    stmt = (
+        update(table)
+        .where(table.c.username == username, table.c.key == key)
+        .values(
+            status_code=response.status_code,
+            mimetype=response.mimetype,
+            body=response.body,
+            expires_at=utcnow() + timedelta(seconds=ttl),
+        )
+    )
+    session.execute(stmt)
+
+
+@contextmanager
+def deferred_commits(session: Session):
+    """
+    Turns the commits of `session` into flushes, so that the writes made in
+    the block are committed by the caller, along its own.
+    """
+    session.info["defer_commit"] = True
+    try:
+        yield
+    finally:
+        session.info["defer_commit"] = False
+
+
+def release_key(session: Session, username: str, key: str):
+    """
+    Releases the claim of a request that failed, so that it can be retried.
+    """
+    table = key_table()
+    session.rollback()
+    session.execute(
+        delete(table).where(
+            table.c.username == username,
+            table.c.key == key,
+            table.c.status_code.is_(None),
+        )
+    )
+    session.commit()
+
+
+def purge_keys(session: Session) -> int:
+    """
+    Deletes the expired keys.
+
+    :return: The number of deleted keys.
+    """
+    table = key_table()
+    result = session.execute(delete(table).where(table.c.expires_at <= utcnow()))
+    session.commit()
+    return result.rowcount
+
+
+def fingerprint() -> str:
+    """
+    Hashes the method, path and body of the current request, so that a key
+    reused for another request is detected.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (request.method.encode(), request.path.encode(), request.get_data()):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def replay(response: StoredResponse, request_fingerprint: str):
+    if response.fingerprint != request_fingerprint:
+        return reused_key()
+    replayed = Response(
+        response.body, status=response.status_code, mimetype=response.mimetype
+    )
+    replayed.headers["Idempotent-Replayed"] = "true"
+    return replayed
+
+
+class Idempotency:
+    """
+    Flask extension making POST views idempotent for the clients sending an
+    `Idempotency-Key` header.
+
+    Keys are scoped to the authenticated user. Successful responses are
+    stored in the `idempotency_key` table for `IDEMPOTENCY_TTL` seconds,
+    fronted by a per process LRU of `IDEMPOTENCY_CACHE_SIZE` responses, and
+    replayed without calling the view. Failed requests release their key.
+
+    A retry of a request still running waits for its response: on an event
+    within the process that runs it, by polling its key with exponential
+    backoff otherwise. It is answered with a 409 after waiting
+    `IDEMPOTENCY_WAIT_TIMEOUT` seconds.
+    """
+
+    initial_delay = 0.01
+    max_delay = 0.5
+
+    def __init__(self, app: Flask | None = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("IDEMPOTENCY_TTL", 86400.0)
+        app.config.setdefault("IDEMPOTENCY_LEASE", 60.0)
+        app.config.setdefault("IDEMPOTENCY_CACHE_SIZE", 1024)
+        app.config.setdefault("IDEMPOTENCY_WAIT_TIMEOUT", 10.0)
+        app.extensions["idempotency"] = {"state": None, "lock": threading.Lock()}
+
+    @property
+    def state(self) -> IdempotencyState:
+        extension = current_app.extensions["idempotency"]
+        with extension["lock"]:
+            if extension["state"] is None:
+                extension["state"] = IdempotencyState(
+                    responses=ResponseLRU(
+                        maxsize=current_app.config["IDEMPOTENCY_CACHE_SIZE"],
+                        ttl=current_app.config["IDEMPOTENCY_TTL"],
+                    )
+                )
+            return extension["state"]
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def idempotent(self, view):
+        """
+        Makes a view idempotent per `Idempotency-Key`. Must be applied after
+        `jwt_required`, which identifies the user.
+        """
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return view(*args, **kwargs)
+            if not 0 < len(key) <= MAX_KEY_LENGTH:
+                return jsonify({"msg": f"Invalid {HEADER}"}), 400
+
+            from . import db
+
+            config = current_app.config
+            state = self.state
+            username = get_jwt_identity()
+            scope = (username, key)
+            request_fingerprint = fingerprint()
+            deadline = time.monotonic() + config["IDEMPOTENCY_WAIT_TIMEOUT"]
+            delay = self.initial_delay
+
+            while True:
+                stored = state.responses.get(scope)
+                if stored is not None:
+                    return replay(stored, request_fingerprint)
+
+                with state.lock:
+                    running = state.in_flight.get(scope)
+                    if running is None:
+                        running = state.in_flight[scope] = threading.Event()
+                        owned = True
+                    else:
+                        owned = False
+                if not owned:
+                    # Another thread of this process runs the request.
+                    if not running.wait(max(deadline - time.monotonic(), 0)):
+                        return in_progress()
+                    continue
+
+                try:
+                    if claim_key(
+                        db.session,
+                        username,
+                        key,
+                        request_fingerprint,
+                        config["IDEMPOTENCY_LEASE"],
+                    ):
+                        return self.run(view, args, kwargs, scope, request_fingerprint)
+                    row = read_key(db.session, username, key)
+                finally:
+                    with state.lock:
+                        state.in_flight.pop(scope, None)
+                    running.set()
+
+                if row is not None and row.status_code is not None:
+                    stored = StoredResponse(
+                        row.fingerprint, row.status_code, row.mimetype, row.body
+                    )
+                    state.responses.put(scope, stored)
+                    return replay(stored, request_fingerprint)
+                if row is not None and row.fingerprint != request_fingerprint:
+                    return reused_key()
+
+                # Another process runs the request, or released the key.
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return in_progress()
+                if row is not None:
+                    self.sleep(min(delay, remaining))
+                    delay = min(delay * 2, self.max_delay)
+
+        return wrapper
+
+    def run(self, view, args, kwargs, scope, request_fingerprint: str) -> Response:
+        """
+        Runs the view of a claimed key, then stores its response or, if it
+        failed, releases the key.
+
+        The commits of the view are deferred until its response is stored, so
+        that both commit together: a worker dying in between loses both, and
+        the retry runs the view once more rather than repeating its write.
+        """
+        from . import db
+
+        username, key = scope
+        try:
+            with deferred_commits(db.session):
+                response = make_response(view(*args, **kwargs))
+                if 200 <= response.status_code < 300 and not response.is_streamed:
+                    stored = StoredResponse(
+                        request_fingerprint,
+                        response.status_code,
+                        response.mimetype,
+                        response.get_data(),
+                    )
+                    store_response(
+                        db.session,
+                        username,
+                        key,
+                        stored,
+                        current_app.config["IDEMPOTENCY_TTL"],
+                    )
+                else:
+                    stored = None
+            if stored is not None:
+                db.session.commit()
+        except BaseException:
+            release_key(db.session, username, key)
+            raise
+        if stored is None:
+            release_key(db.session, username, key)
+            return response
+        self.state.responses.put(scope, stored)
+        return response
+
+
+def reused_key():
+    return jsonify({"msg": f"{HEADER} was already used for another request"}), 422
+
+
+def in_progress():
+    return (
+        jsonify({"msg": f"A request with this {HEADER} is still in progress"}),
+        409,
+    )
+
+
+idempotency_cli = AppGroup("idempotency", help="Manage the idempotency keys.")
+
+
+@idempotency_cli.command("purge")
+def purge_command():
+    """Delete the expired idempotency keys."""
+    from . import db
+
+    click.echo(f"Purged {purge_keys(db.session)} expired idempotency keys.")
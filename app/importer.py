@@ -0,0 +1,334 @@
+import csv
+import io
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+
+import click
+from flask.cli import with_appcontext
+from pydantic import ValidationError
+from sqlalchemy import Table, func, insert, literal, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .export import format_csv
+from .models import (
+    MAX_CARS_PER_OWNER,
+    UPSERT,
+    Car,
+    Owner,
+    adjust_car_counts,
+    adjust_fleet_stats,
+    car_count_stats,
+    car_stats,
+    db,
+    owner_stats,
+    record_changes,
+    record_changes_from,
+)
+from .schemas import CarFieldsIn, OwnerSchemaIn
+
+IMPORT_BATCH_SIZE = 5000
+IMPORT_FIELDS = ("owner_ref", "name", "color", "model")
+IMPORT_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+# (line number, record, errors reading the line)
+Record = Tuple[int, Dict[str, Any] | None, list | None]
+
+
+def read_records(file: TextIO, file_format: str) -> Iterator[Record]:
+    """
+    Reads the records of a fleet file one line at a time.
+
+    Every record is a car of an owner, identified by the `owner_ref` of the
+    partner: `{"owner_ref", "name", "color", "model"}`. A record without
+    color and model only creates its owner.
+
+    :param file: The open fleet file.
+    :param file_format: 'csv', with a header line, or 'ndjson'.
+    :return: An iterator of (line number, record, errors) tuples, where either
+             the record or the errors reading the line are None.
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+        missing = set(IMPORT_FIELDS) - set(reader.fieldnames or ())
+        if missing:
+            raise click.ClickException(
+                f"Missing CSV columns: {', '.join(sorted(missing))}"
+            )
+        for row in reader:
+            yield reader.line_num, {k: row[k] or None for k in IMPORT_FIELDS}, None
+        return
+
+    for line_num, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_num, None, [f"Invalid JSON: {e}"]
+            continue
+        if not isinstance(record, dict):
+            yield line_num, None, ["Invalid record: expected a JSON object"]
+            continue
+        yield line_num, {k: record.get(k) for k in IMPORT_FIELDS}, None
+
+
+class OwnerIds:
+    """
+    Hands out the IDs of the imported owners before they are inserted, so
+    their cars can be inserted in the same batch without reading them back.
+
+    On PostgreSQL the IDs are drawn from the sequence of `owner.id`, a batch
+    at a time. Elsewhere they follow the largest existing ID, which assumes
+    nothing else writes owners while the import runs.
+    """
+
+    def __init__(self, session: Session, block_size: int):
+        self.session = session
+        self.block_size = block_size
+        self.postgresql = session.get_bind().dialect.name == "postgresql"
+        self._ids: List[int] = []
+        self._last = None
+
+    def next(self) -> int:
+        if not self.postgresql:
+            if self._last is None:
+                self._last = self.session.scalar(
+                    select(func.coalesce(func.max(Owner.id), 0))
+                )
+            self._last += 1
+            return self._last
+        if not self._ids:
+            self._ids = self.session.scalars(
+                text(
+                    "SELECT nextval(pg_get_serial_sequence('owner', 'id'))"
+                    " FROM generate_series(1, :count)"
+                ),
+                {"count": self.block_size},
+            ).all()[::-1]
+        return self._ids.pop()
+
+
+def copy_rows(connection: Connection, table: Table, columns: tuple, rows: list):
+    """
+    Bulk inserts rows into `table`.
+
+    PostgreSQL loads them with a single COPY, other databases with an
+    executemany INSERT. Like the other bulk INSERTs, it skips the mapper
+    events.
+
+    :param connection: The connection of the current transaction.
+    :param table: The table to insert into.
+    :param columns: The names of the columns of the rows.
+    :param rows: The rows to insert, as tuples of values.
+    """
+    if not rows:
+        return
+    if connection.dialect.name == "postgresql":
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                io.StringIO(format_csv(rows)),
+            )
+        finally:
+            cursor.close()
+    else:
+        connection.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    owners: int = 0
+    cars: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class FleetImporter:
+    """
+    Imports fleet records in batches of `batch_size`.
+
+    Records are validated with `OwnerSchemaIn` and `CarFieldsIn`, and the
+    limit of cars per owner is enforced across the whole file. Each batch is
+    then written in its own transaction: the new owners, already carrying
+    their number of cars, the cars, the counters of the owners of earlier
+    batches and the fleet statistics. Rejected records are written to
+    `rejects` as NDJSON, with their line number and errors.
+    """
+
+    def __init__(self, session: Session, rejects: TextIO, batch_size: int):
+        self.session = session
+        self.rejects = rejects
+        self.batch_size = batch_size
+        self.ids = OwnerIds(session, batch_size)
+        self.owner_ids: Dict[str, int] = {}
+        self.num_cars: Dict[int, int] = {}
+        self.report = ImportReport()
+        self._new_owners: Dict[int, str] = {}
+        self._cars: List[tuple] = []
+
+    def run(self, records: Iterator[Record]) -> ImportReport:
+        start = time.perf_counter()
+        pending = 0
+        for line_num, record, error in records:
+            self.report.rows += 1
+            if error is None:
+                error = self.add(record)
+            if error is not None:
+                self.reject(line_num, record, error)
+            pending += 1
+            if pending == self.batch_size:
+                self.flush()
+                pending = 0
+        self.flush()
+        self.report.seconds = time.perf_counter() - start
+        return self.report
+
+    def add(self, record: Dict[str, Any]) -> list | None:
+        """
+        Validates a record and queues its owner and car.
+
+        :return: The errors of the record, or None if it was accepted.
+        """
+        owner_ref = record["owner_ref"]
+        if owner_ref in (None, ""):
+            return ["owner_ref is required"]
+        owner_ref = str(owner_ref)
+        owner_id = self.owner_ids.get(owner_ref)
+        if owner_id is None:
+            try:
+                owner = OwnerSchemaIn.model_validate({"name": record["name"]})
+            except ValidationError as e:
+                return e.errors(include_url=False, include_context=False)
+
+        car = None
+        if record["color"] is not None or record["model"] is not None:
+            try:
+                # The ID of a new owner is only drawn once the record is valid.
+                car = CarFieldsIn.model_validate(
+                    {"color": record["color"], "model": record["model"]}
+                )
+            except ValidationError as e:
+                return e.errors(include_url=False, include_context=False)
+            if owner_id is not None and self.num_cars[owner_id] >= MAX_CARS_PER_OWNER:
+                return ["An owner cannot have more than 3 cars"]
+
+        if owner_id is None:
+            owner_id = self.ids.next()
+            self.owner_ids[owner_ref] = owner_id
+            self.num_cars[owner_id] = 0
+            self._new_owners[owner_id] = owner.name
+        if car is not None:
+            self.num_cars[owner_id] += 1
+            self._cars.append((owner_id, car.color, car.model))
+        return None
+
+    def reject(self, line_num: int, record: Dict[str, Any] | None, errors: list):
+        self.report.rejected += 1
+        document = {"line": line_num, "record": record, "errors": errors}
+        self.rejects.write(json.dumps(document, default=str) + "\n")
+
+    def flush(self):
+        """
+        Writes the queued owners and cars in one transaction.
+        """
+        if not self._new_owners and not self._cars:
+            return
+        connection = self.session.connection()
+        copy_rows(
+            connection,
+            Owner.__table__,
+            ("id", "name", "sale_opportunity", "num_cars"),
+            [
+                (owner_id, name, True, self.num_cars[owner_id])
+                for owner_id, name in self._new_owners.items()
+            ],
+        )
+        copy_rows(connection, Car.__table__, ("owner_id", "color", "model"), self._cars)
+
+        # The owners of earlier batches are already written, shift their counters.
+        deltas = {}
+        for owner_id, _, _ in self._cars:
+            if owner_id not in self._new_owners:
+                deltas[owner_id] = deltas.get(owner_id, 0) + 1
+        num_cars = adjust_car_counts(connection, deltas)
+
+        stats = []
+        for owner_id in self._new_owners:
+            stats += owner_stats(True, self.num_cars[owner_id], 1)
+        for _, color, model in self._cars:
+            stats += car_stats(color, model, 1)
+        for owner_id, count in num_cars.items():
+            stats += car_count_stats(count - deltas[owner_id], count)
+        adjust_fleet_stats(connection, stats)
+
+        # COPY does not return the IDs of the cars, so every car of the
+        # owners of the batch is recorded, including up to 2 older ones each.
+        record_changes(
+            connection, UPSERT, [("owner", owner_id) for owner_id in self._new_owners]
+        )
+        owner_ids = sorted({owner_id for owner_id, _, _ in self._cars})
+        if owner_ids:
+            cars = Car.__table__
+            record_changes_from(
+                connection,
+                UPSERT,
+                select(literal("car"), cars.c.id).where(cars.c.owner_id.in_(owner_ids)),
+            )
+        self.session.commit()
+
+        self.report.owners += len(self._new_owners)
+        self.report.cars += len(self._cars)
+        self._new_owners, self._cars = {}, []
+
+
+@click.command("import-fleet")
+@click.argument("file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["csv", "ndjson"]),
+    help="The format of the file, guessed from its extension by default.",
+)
+@click.option(
+    "--rejects",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="The NDJSON file of the rejected records, FILE.rejects.ndjson by default.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(1),
+    default=IMPORT_BATCH_SIZE,
+    show_default=True,
+    help="The number of records written per transaction.",
+)
+@with_appcontext
+def import_fleet_command(file, file_format, rejects, batch_size):
+    """Import owners and their cars from a CSV or NDJSON file."""
+    file_format = file_format or IMPORT_FORMATS.get(file.suffix.lower())
+    if file_format is None:
+        raise click.UsageError("Cannot guess the format of FILE, use --format.")
+    rejects = rejects or file.with_name(file.name + ".rejects.ndjson")
+
+    with open(file, newline="", encoding="utf-8") as source, open(
+        rejects, "w", encoding="utf-8"
+    ) as rejected:
+        importer = FleetImporter(db.session, rejected, batch_size)
+        report = importer.run(read_records(source, file_format))
+
+    click.echo(
+        f"Imported {report.owners} owners and {report.cars} cars from"
+        f" {report.rows} records in {report.seconds:.2f}s"
+        f" ({report.rows_per_second:.0f} records/s)."
+    )
+    if report.rejected:
+        click.echo(f"Rejected {report.rejected} records, see {rejects}.")
@@ -0,0 +1,209 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from flask import Flask, Response, current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4"
+
+
+@dataclass
+class RequestTimings:
+    """
+    What a request spent its time on, in seconds.
+    """
+
+    start: float = field(default_factory=time.perf_counter)
+    statements: int = 0
+    db: float = 0.0
+    serialize: float = 0.0
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;dur={self.db * 1000:.3f};desc="{self.statements} statements", '
+            f"serialize;dur={self.serialize * 1000:.3f}, "
+            f"total;dur={total * 1000:.3f}"
+        )
+
+
+def current_timings() -> RequestTimings | None:
+    if not has_request_context():
+        return None
+    return getattr(request, "timings", None)
+
+
+@contextmanager
+def timed(phase: str):
+    """
+    Adds the time spent in the block to the `phase` of the current request.
+    """
+    timings = current_timings()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            setattr(
+                timings, phase, getattr(timings, phase) + time.perf_counter() - start
+            )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def end_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["statement_start"]
+    timings = current_timings()
+    if timings is not None:
+        timings.statements += 1
+        timings.db += elapsed
+
+
+class Histogram:
+    """
+    Prometheus histogram with one series per set of label values.
+
+    Not thread safe, callers hold the lock of the registry.
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, label_names: tuple) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            pairs = ",".join(
+                f'{name}="{value}"' for name, value in zip(label_names, labels)
+            )
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{pairs},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{pairs},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{pairs}}} {total}")
+            lines.append(f"{self.name}_count{{{pairs}}} {count}")
+        return lines
+
+
+class RequestMetrics:
+    """
+    Flask extension measuring where the time of each request goes.
+
+    SQLAlchemy engine events count the statements of a request and the time
+    spent running them, and `timed("serialize")` blocks the time spent
+    serializing. Each response carries a `Server-Timing` header with those
+    timings, and the `/metrics` endpoint exports them as Prometheus
+    histograms by endpoint. Metrics are kept per process, so every worker is
+    scraped on its own. Set `METRICS_ENABLED` to False to turn them off.
+
+    Streamed responses are measured up to their first byte.
+    """
+
+    label_names = ("method", "endpoint")
+
+    def __init__(self, app: Flask | None = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("METRICS_ENABLED", True)
+        app.extensions["metrics"] = {
+            "lock": threading.Lock(),
+            "histograms": {
+                "total": Histogram(
+                    "carford_request_duration_seconds",
+                    "Time spent handling requests.",
+                    LATENCY_BUCKETS,
+                ),
+                "db": Histogram(
+                    "carford_request_db_duration_seconds",
+                    "Time spent running SQL statements by request.",
+                    LATENCY_BUCKETS,
+                ),
+                "serialize": Histogram(
+                    "carford_request_serialization_duration_seconds",
+                    "Time spent serializing responses by request.",
+                    LATENCY_BUCKETS,
+                ),
+                "statements": Histogram(
+                    "carford_request_db_statements",
+                    "SQL statements run by request.",
+                    STATEMENT_BUCKETS,
+                ),
+            },
+        }
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule("/metrics", "metrics", self.export)
+
+    def _start(self):
+        if current_app.config["METRICS_ENABLED"]:
+            request.timings = RequestTimings()
+
+    def _finish(self, response: Response) -> Response:
+        timings = current_timings()
+        if timings is None or request.endpoint == "metrics":
+            return response
+        total = time.perf_counter() - timings.start
+        response.headers["Server-Timing"] = timings.server_timing(total)
+
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        labels = (request.method, rule)
+        state = current_app.extensions["metrics"]
+        histograms = state["histograms"]
+        with state["lock"]:
+            histograms["total"].observe(labels, total)
+            histograms["db"].observe(labels, timings.db)
+            histograms["serialize"].observe(labels, timings.serialize)
+            histograms["statements"].observe(labels, timings.statements)
+        return response
+
+    def export(self):
+        """
+        Exports the request metrics in the Prometheus text format.
+        """
+        state = current_app.extensions["metrics"]
+        with state["lock"]:
+            lines = []
+            for histogram in state["histograms"].values():
+                lines += histogram.render(self.label_names)
+        return Response("\n".join(lines) + "\n", mimetype=PROMETHEUS_MIMETYPE)
@@ -1,34 +1,104 @@
-from typing import List
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from sqlalchemy import (
+    CompoundSelect,
+    Select,
+    case,
+    event,
+    func,
+    insert,
+    inspect,
+    literal,
+    select,
+    true,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import Mapped, mapped_column, validates
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.orm import Mapped, mapped_column
 
-from . import db
+from . import db, password_hasher
+
+MAX_CARS_PER_OWNER = 3
+CAR_LIMIT_CONSTRAINT = "ck_owner_car_limit"
+
+
+class OwnerNotFound(LookupError):
+    pass
+
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys, and cascades deletes, when asked to
+    # on each connection.
+    if "sqlite" in type(dbapi_connection).__module__:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 
 class Owner(db.Model):
+    __table_args__ = (
+        db.CheckConstraint(
+            f"num_cars >= 0 AND num_cars <= {MAX_CARS_PER_OWNER}",
+            name=CAR_LIMIT_CONSTRAINT,
+        ),
+    )
+
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
 
     name: Mapped[str] = mapped_column(db.String(120), nullable=False)
     sale_opportunity: Mapped[bool] = mapped_column(db.Boolean, default=True)
-    cars: Mapped[List["Car"]] = db.relationship("Car", backref="owner", lazy=True)
+    # Maintained by the database on every car write, see `adjust_car_counts`.
+    num_cars: Mapped[int] = mapped_column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    cars: Mapped[List["Car"]] = db.relationship(
+        "Car", backref="owner", lazy=True, passive_deletes="all"
+    )
+    # Bumped by every update, for optimistic locking, see `app.patches`.
+    version: Mapped[int] = mapped_column(
+        db.Integer, nullable=False, default=1, server_default="1"
+    )
+
+    __mapper_args__ = {"version_id_col": version}
 
     @hybrid_property
     def car_count(self):
-        return len(self.cars)
+        return self.num_cars
 
-    @validates("cars")
-    def validate_cars(self, key, cars):
-        if len(cars) > 3:
-            raise ValueError("An owner cannot have more than 3 cars")
-        return cars
+
+# Reads the sale opportunities in ID order without scanning the other owners,
+# see `select_lead_rows`.
+db.Index(
+    "ix_owner_leads",
+    Owner.id,
+    Owner.num_cars,
+    postgresql_where=Owner.sale_opportunity == true(),
+    sqlite_where=Owner.sale_opportunity == true(),
+)
 
 
 class Car(db.Model):
+    # Serve each filter of the car listing in ID order, so that pages are
+    # read straight from an index instead of sorting every matching car.
+    __table_args__ = (
+        db.Index("ix_car_color_id", "color", "id"),
+        db.Index("ix_car_model_id", "model", "id"),
+        db.Index("ix_car_color_model_id", "color", "model", "id"),
+    )
+
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
     owner_id: Mapped[int] = mapped_column(
-        db.Integer, db.ForeignKey("owner.id"), nullable=False
+        db.Integer,
+        db.ForeignKey("owner.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
 
     color: Mapped[str] = mapped_column(
@@ -37,12 +107,391 @@ class Car(db.Model):
     model: Mapped[str] = mapped_column(
         db.Enum("hatch", "sedan", "convertible", name="car_model"), nullable=False
     )
+    # Bumped by every update, for optimistic locking, see `app.patches`.
+    version: Mapped[int] = mapped_column(
+        db.Integer, nullable=False, default=1, server_default="1"
+    )
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+def is_car_limit_violation(error: IntegrityError) -> bool:
+    """
+    Tells whether an IntegrityError was raised by the limit of cars per owner.
+    """
+    return CAR_LIMIT_CONSTRAINT in str(error.orig)
+
+
+def is_foreign_key_violation(error: IntegrityError) -> bool:
+    """
+    Tells whether an IntegrityError was raised by a foreign key, e.g. by a
+    car referencing a missing owner.
+    """
+    return "foreign key" in str(error.orig).lower()
+
+
+def adjust_car_counts(connection: Connection, deltas: Dict[int, int]) -> Dict[int, int]:
+    """
+    Atomically shifts the number of cars of owners.
+
+    Each owner row is updated in place, so concurrent writers are serialized
+    by the row lock and the check constraint on `owner.num_cars` rejects the
+    write that would exceed the limit of cars per owner. All the owners are
+    updated by a single statement.
+
+    :param connection: The connection of the current transaction.
+    :param deltas: The number of cars added (or removed, if negative) by owner ID.
+    :return: The new number of cars by owner ID, for the owners that exist.
+    """
+    deltas = {owner_id: delta for owner_id, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+    table = Owner.__table__
+    if len(deltas) == 1:
+        ((owner_id, delta),) = deltas.items()
+        where, shift = table.c.id == owner_id, delta
+    else:
+        where, shift = table.c.id.in_(sorted(deltas)), case(deltas, value=table.c.id)
+    stmt = (
+        update(table)
+        .where(where)
+        .values(num_cars=table.c.num_cars + shift)
+        .returning(table.c.id, table.c.num_cars)
+    )
+    return dict(connection.execute(stmt).all())
+
+
+class FleetStat(db.Model):
+    """
+    A counter of the fleet statistics, e.g. the number of blue cars.
+
+    Counters are shifted by every write to cars and owners, see
+    `adjust_fleet_stats`, and recomputed from scratch by `flask stats rebuild`.
+    """
+
+    metric: Mapped[str] = mapped_column(db.String(40), primary_key=True)
+    key: Mapped[str] = mapped_column(db.String(20), primary_key=True)
+    count: Mapped[int] = mapped_column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+
+
+StatDelta = Tuple[Tuple[str, str], int]
+
+
+def car_stats(color: str, model: str, delta: int) -> List[StatDelta]:
+    return [(("cars_by_color", color), delta), (("cars_by_model", model), delta)]
+
+
+def owner_stats(sale_opportunity: bool, num_cars: int, delta: int) -> List[StatDelta]:
+    return [
+        (("owners_by_sale_opportunity", str(bool(sale_opportunity)).lower()), delta),
+        (("owners_by_car_count", str(num_cars)), delta),
+    ]
+
+
+def car_count_stats(old: int, new: int) -> List[StatDelta]:
+    """
+    Moves an owner from the bucket of `old` cars to the bucket of `new` cars.
+    """
+    if old == new:
+        return []
+    return [
+        (("owners_by_car_count", str(old)), -1),
+        (("owners_by_car_count", str(new)), 1),
+    ]
+
+
+def adjust_fleet_stats(connection: Connection, deltas: Iterable[StatDelta]):
+    """
+    Atomically shifts counters of the fleet statistics.
+
+    Every counter is shifted by a single upsert, which creates the missing
+    counters. Rows are written in key order, so concurrent writers lock
+    them in the same order.
 
-    @validates("owner_id")
-    def validate_owner_id(self, key, owner_id):
-        if self.query.filter_by(owner_id=owner_id).count() >= 3:
-            raise ValueError("An owner cannot have more than 3 cars")
-        return owner_id
+    :param connection: The connection of the current transaction.
+    :param deltas: The ((metric, key), delta) pairs to add.
+    """
+    totals = defaultdict(int)
+    for key, delta in deltas:
+        totals[key] += delta
+    rows = [
+        {"metric": metric, "key": key, "count": delta}
+        for (metric, key), delta in sorted(totals.items())
+        if delta
+    ]
+    if not rows:
+        return
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    table = FleetStat.__table__
+    stmt = dialect.insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.metric, table.c.key],
+        set_={"count": table.c.count + stmt.excluded["count"]},
+    )
+    connection.execute(stmt)
+
+
+def shift_car_count(connection: Connection, owner_id: int, delta: int) -> int:
+    """
+    Shifts the number of cars of one owner, see `adjust_car_counts`.
+
+    :raises OwnerNotFound: If the owner does not exist.
+    :return: The new number of cars of the owner.
+    """
+    num_cars = adjust_car_counts(connection, {owner_id: delta})
+    if owner_id not in num_cars:
+        raise OwnerNotFound(owner_id)
+    return num_cars[owner_id]
+
+
+# Cars are counted before they are written, so a missing owner is reported
+# as OwnerNotFound rather than as a violation of the foreign key.
+@event.listens_for(Car, "before_insert")
+def count_inserted_car(mapper, connection, car):
+    num_cars = shift_car_count(connection, car.owner_id, 1)
+    adjust_fleet_stats(
+        connection,
+        car_stats(car.color, car.model, 1) + car_count_stats(num_cars - 1, num_cars),
+    )
+
+
+@event.listens_for(Car, "before_update")
+def count_updated_car(mapper, connection, car):
+    state = inspect(car).attrs
+    deltas = []
+    for name in ("color", "model"):
+        history = getattr(state, name).history
+        if history.has_changes() and history.deleted:
+            metric = f"cars_by_{name}"
+            deltas += [
+                ((metric, history.deleted[0]), -1),
+                ((metric, history.added[0]), 1),
+            ]
+
+    history = state.owner_id.history
+    if history.has_changes() and history.deleted:
+        old_owner_id, new_owner_id = history.deleted[0], history.added[0]
+        if new_owner_id is not None:
+            num_cars = shift_car_count(connection, new_owner_id, 1)
+            deltas += car_count_stats(num_cars - 1, num_cars)
+        num_cars = shift_car_count(connection, old_owner_id, -1)
+        deltas += car_count_stats(num_cars + 1, num_cars)
+    adjust_fleet_stats(connection, deltas)
+
+
+@event.listens_for(Car, "after_delete")
+def count_deleted_car(mapper, connection, car):
+    num_cars = shift_car_count(connection, car.owner_id, -1)
+    adjust_fleet_stats(
+        connection,
+        car_stats(car.color, car.model, -1) + car_count_stats(num_cars + 1, num_cars),
+    )
+
+
+@event.listens_for(Owner, "after_insert")
+def count_inserted_owner(mapper, connection, owner):
+    adjust_fleet_stats(
+        connection, owner_stats(owner.sale_opportunity, owner.num_cars, 1)
+    )
+
+
+@event.listens_for(Owner, "after_update")
+def count_updated_owner(mapper, connection, owner):
+    history = inspect(owner).attrs.sale_opportunity.history
+    if history.has_changes() and history.deleted:
+        metric = "owners_by_sale_opportunity"
+        adjust_fleet_stats(
+            connection,
+            [
+                ((metric, str(bool(history.deleted[0])).lower()), -1),
+                ((metric, str(bool(history.added[0])).lower()), 1),
+            ],
+        )
+
+
+def count_cars_of_owners(connection: Connection, owner_ids) -> List[StatDelta]:
+    """
+    Counts the cars that deleting owners cascades to, by color and model.
+
+    The owners are locked, so concurrent writes cannot add cars to them
+    before they are deleted.
+
+    :param connection: The connection of the current transaction.
+    :param owner_ids: A SELECT of the IDs of the owners.
+    :return: The ((metric, key), delta) pairs removing the cars from the
+             statistics.
+    """
+    table = Car.__table__
+    stmt = (
+        select(table.c.color, table.c.model, func.count())
+        .where(table.c.owner_id.in_(owner_ids.with_for_update()))
+        .group_by(table.c.color, table.c.model)
+    )
+    stats = []
+    for color, model, count in connection.execute(stmt):
+        stats += car_stats(color, model, -count)
+    return stats
+
+
+@event.listens_for(Owner, "before_delete")
+def count_deleted_owner(mapper, connection, owner):
+    # The cars of the owner are deleted by the database, see `Car.owner_id`,
+    # so they are counted before. Their number also gives the current value
+    # of `num_cars`, which is maintained outside of the ORM.
+    table = Owner.__table__
+    owner_ids = select(table.c.id).where(table.c.id == owner.id)
+    stats = count_cars_of_owners(connection, owner_ids)
+    num_cars = -sum(delta for (metric, _), delta in stats if metric == "cars_by_color")
+    adjust_fleet_stats(
+        connection, stats + owner_stats(owner.sale_opportunity, num_cars, -1)
+    )
+
+
+class Change(db.Model):
+    """
+    An entry of the change feed: an owner or a car was written (`upsert`) or
+    deleted (`delete`).
+
+    Entries are written in the transaction of the change, see
+    `record_changes`, without a sequence. Writers take no lock for the feed:
+    sequences are assigned to the committed entries by the readers of the
+    feed, see `app.changes.sequence_changes`, so a client that read the feed
+    up to `seq` will never see a lower `seq` afterwards.
+    """
+
+    __table_args__ = (
+        db.Index("ix_change_seq", "seq", unique=True),
+        db.Index("ix_change_entity_entity_id_seq", "entity", "entity_id", "seq"),
+    )
+
+    id: Mapped[int] = mapped_column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True
+    )
+    seq: Mapped[Optional[int]] = mapped_column(db.BigInteger)
+    entity: Mapped[str] = mapped_column(db.String(5), nullable=False)
+    entity_id: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    op: Mapped[str] = mapped_column(db.String(6), nullable=False)
+    changed_at: Mapped[datetime] = mapped_column(
+        db.DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+# The entries left to sequence.
+db.Index(
+    "ix_change_unsequenced",
+    Change.id,
+    postgresql_where=Change.seq.is_(None),
+    sqlite_where=Change.seq.is_(None),
+)
+
+
+class ChangeHorizon(db.Model):
+    """
+    The highest sequence of the deleted entries dropped by the compaction of
+    the change feed, see `app.changes.compact_changes`. Clients that read the
+    feed before it may have missed deletions.
+    """
+
+    id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    seq: Mapped[int] = mapped_column(db.BigInteger, nullable=False)
+
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+
+def record_changes(connection: Connection, op: str, changes: Iterable[Tuple[str, int]]):
+    """
+    Appends entries to the change feed with a single INSERT.
+
+    :param connection: The connection of the transaction of the change.
+    :param op: `UPSERT` or `DELETE`.
+    :param changes: The (entity, ID) pairs of the changed owners and cars.
+    """
+    rows = [{"entity": entity, "entity_id": id, "op": op} for entity, id in changes]
+    if rows:
+        connection.execute(insert(Change.__table__).values(rows))
+
+
+def record_changes_from(
+    connection: Connection, op: str, changes: Select | CompoundSelect
+):
+    """
+    Appends entries to the change feed with a single INSERT ... SELECT.
+
+    :param connection: The connection of the transaction of the change.
+    :param op: `UPSERT` or `DELETE`.
+    :param changes: A SELECT of the entity and the ID of the changed owners
+                    and cars.
+    """
+    rows = changes.subquery()
+    connection.execute(
+        insert(Change.__table__).from_select(
+            ["entity", "entity_id", "op"], select(*rows.c, literal(op))
+        )
+    )
+
+
+def has_column_changes(entity) -> bool:
+    # Objects are flushed as updated when only a relationship changed.
+    state = inspect(entity)
+    return any(
+        state.attrs[key].history.has_changes() for key in state.mapper.columns.keys()
+    )
+
+
+@event.listens_for(Owner, "after_insert")
+@event.listens_for(Car, "after_insert")
+def record_inserted_entity(mapper, connection, entity):
+    record_changes(connection, UPSERT, [(mapper.local_table.name, entity.id)])
+
+
+@event.listens_for(Owner, "after_update")
+@event.listens_for(Car, "after_update")
+def record_updated_entity(mapper, connection, entity):
+    if has_column_changes(entity):
+        record_changes(connection, UPSERT, [(mapper.local_table.name, entity.id)])
+
+
+@event.listens_for(Car, "after_delete")
+def record_deleted_car(mapper, connection, car):
+    record_changes(connection, DELETE, [("car", car.id)])
+
+
+@event.listens_for(Owner, "before_delete")
+def record_deleted_owner(mapper, connection, owner):
+    # The cars of the owner are deleted by the database, so they are
+    # recorded along with it.
+    table = Car.__table__
+    record_changes_from(
+        connection,
+        DELETE,
+        union_all(
+            select(literal("car"), table.c.id).where(table.c.owner_id == owner.id),
+            select(literal("owner"), literal(owner.id)),
+        ),
+    )
+
+
+class IdempotencyKey(db.Model):
+    """
+    An `Idempotency-Key` sent by a user, with the response replayed to the
+    retries of the request, see `app.idempotency`.
+
+    The response is NULL while the first request is in progress.
+    """
+
+    username: Mapped[str] = mapped_column(db.String(30), primary_key=True)
+    key: Mapped[str] = mapped_column(db.String(255), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(db.String(32), nullable=False)
+    status_code: Mapped[Optional[int]] = mapped_column(db.Integer)
+    mimetype: Mapped[Optional[str]] = mapped_column(db.String(100))
+    body: Mapped[Optional[bytes]] = mapped_column(db.LargeBinary)
+    expires_at: Mapped[datetime] = mapped_column(
+        db.DateTime(timezone=True), nullable=False, index=True
+    )
 
 
 class User(db.Model):
@@ -52,7 +501,7 @@ class User(db.Model):
     password_hash: Mapped[str] = mapped_column(db.String(256), nullable=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, salt_length=10)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
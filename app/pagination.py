@@ -0,0 +1,75 @@
+import base64
+import binascii
+import json
+from typing import Any, Sequence, Tuple
+
+from sqlalchemy import Select
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Encodes the primary key of the last row of a page into an opaque cursor.
+
+    :param last_id: The ID of the last row returned.
+    :return: A URL safe cursor string.
+    """
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    :param cursor: The opaque cursor sent by the client.
+    :return: The ID after which the next page starts.
+    :raises InvalidCursor: If the cursor was not created by `encode_cursor`.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise InvalidCursor("Invalid cursor")
+    return last_id
+
+
+def paginate(stmt: Select, column, after_id: int | None, limit: int) -> Select:
+    """
+    Restricts a statement to the page that starts right after `after_id`.
+
+    The page is located through the primary key instead of an OFFSET, so every
+    page costs the same index range scan. One extra row is fetched to know if
+    there is a next page, see `split_page`.
+
+    :param stmt: The SELECT statement to paginate.
+    :param column: The unique, ordered column used as key, usually the ID.
+    :param after_id: The key of the last row of the previous page, if any.
+    :param limit: The maximum number of rows of the page.
+    :return: The paginated SELECT statement.
+    """
+    if after_id is not None:
+        stmt = stmt.where(column > after_id)
+    return stmt.order_by(None).order_by(column).limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], limit: int) -> Tuple[Sequence[Any], str | None]:
+    """
+    Splits the rows fetched by a `paginate` statement into a page and a cursor.
+
+    :param rows: The rows returned by the paginated statement.
+    :param limit: The limit given to `paginate`.
+    :return: The rows of the page and the cursor of the next page, if any.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(page[-1].id)
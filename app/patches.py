@@ -0,0 +1,240 @@
+"""
+Partial updates with optimistic locking.
+
+Owners and cars carry a version, bumped by every update. A PATCH updates the
+given fields with a single UPDATE ... RETURNING, without loading the entity,
+and only when the version is still one of the versions listed by the client
+in `If-Match`. A client that lost the race gets a 412 instead of silently
+overwriting the other write, and no row is locked while the client decides.
+"""
+
+from typing import Any, Dict, List
+
+from sqlalchemy import Table, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.datastructures import ETags
+
+from .models import (
+    Car,
+    Owner,
+    UPSERT,
+    OwnerNotFound,
+    adjust_car_counts,
+    adjust_fleet_stats,
+    car_count_stats,
+    car_stats,
+    db,
+    is_foreign_key_violation,
+    record_changes,
+)
+
+
+class VersionConflict(Exception):
+    pass
+
+
+def entity_tag(version: int) -> str:
+    """
+    Returns the value of the ETag header of an entity at `version`.
+    """
+    return f'"{version}"'
+
+
+def if_match_versions(if_match: ETags) -> List[int] | None:
+    """
+    Reads the versions accepted by an `If-Match` header.
+
+    Weak tags never match, per RFC 9110, nor do tags that are not versions.
+
+    :param if_match: The parsed `If-Match` header of the request.
+    :return: The accepted versions, or None when any version is accepted,
+             i.e. without the header or with `If-Match: *`.
+    """
+    if not if_match or if_match.star_tag:
+        return None
+    return sorted(int(tag) for tag in if_match.as_set() if tag.isdigit())
+
+
+def row_exists(connection: Connection, table: Table, entity_id: int) -> bool:
+    stmt = select(table.c.id).where(table.c.id == entity_id)
+    return connection.execute(stmt).first() is not None
+
+
+def check_conflict(connection: Connection, table: Table, entity_id: int):
+    """
+    Tells why a versioned UPDATE matched no row.
+
+    :raises VersionConflict: If the row exists, so its version did not match.
+    """
+    if row_exists(connection, table, entity_id):
+        raise VersionConflict(entity_id)
+
+
+def update_owner_fields(
+    owner_id: int,
+    values: Dict[str, Any],
+    versions: List[int] | None = None,
+    session: Session | None = None,
+):
+    """
+    Updates fields of an owner with a single UPDATE ... RETURNING.
+
+    :param owner_id: The ID of the owner to update.
+    :param values: The new value of each field to update.
+    :param versions: The versions the owner may be at, see `if_match_versions`.
+    :param session: The session to write with, `db.session` by default.
+    :raises VersionConflict: If the owner is at another version.
+    :return: The updated owner, without its cars, or None if it does not exist.
+    """
+    if session is None:
+        session = db.session
+    table = Owner.__table__
+    connection = session.connection()
+    stmt = (
+        update(table)
+        .where(table.c.id == owner_id)
+        .values(**values, version=table.c.version + 1)
+        .returning(table.c.id, table.c.name, table.c.version)
+    )
+    if versions is not None:
+        stmt = stmt.where(table.c.version.in_(versions))
+    owner = connection.execute(stmt).first()
+    if owner is None:
+        if versions is not None:
+            check_conflict(connection, table, owner_id)
+        return None
+    record_changes(connection, UPSERT, [("owner", owner_id)])
+    session.commit()
+    return owner
+
+
+def update_returning_previous(
+    connection: Connection,
+    table: Table,
+    entity_id: int,
+    values: Dict[str, Any],
+    versions: List[int] | None,
+):
+    """
+    Updates a versioned row, returning its new and previous values.
+
+    On PostgreSQL the previous values are read by a subquery of the UPDATE
+    itself, joined on the version, so a row updated concurrently is skipped
+    rather than written over values that are no longer current. SQLite cannot
+    return the columns of a joined subquery, so they are read beforehand,
+    without a lock, and the UPDATE only applies if the version is unchanged.
+
+    Without `versions` the client set no precondition, so an update skipped
+    because of a concurrent one is retried against the version it wrote.
+
+    :return: The new and the previous values of the row, or None if no row
+             matched.
+    """
+    while True:
+        rows = try_update_returning_previous(
+            connection, table, entity_id, values, versions
+        )
+        if rows is not None or versions is not None:
+            return rows
+        if not row_exists(connection, table, entity_id):
+            return None
+
+
+def try_update_returning_previous(
+    connection: Connection,
+    table: Table,
+    entity_id: int,
+    values: Dict[str, Any],
+    versions: List[int] | None,
+):
+    """
+    Runs a single attempt of `update_returning_previous`.
+
+    :return: The new and the previous values of the row, or None if no row
+             matched or the row was updated concurrently.
+    """
+    current = table.alias("current")
+    previous = select(*current.c).where(current.c.id == entity_id)
+    if versions is not None:
+        previous = previous.where(current.c.version.in_(versions))
+    stmt = update(table).values(**values, version=table.c.version + 1)
+
+    if connection.dialect.name == "postgresql":
+        previous = previous.subquery("previous")
+        stmt = stmt.where(
+            table.c.id == previous.c.id, table.c.version == previous.c.version
+        ).returning(
+            *table.c,
+            *(column.label(f"previous_{column.name}") for column in previous.c),
+        )
+        row = connection.execute(stmt).first()
+        if row is None:
+            return None
+        row = row._mapping
+        return (
+            {column.name: row[column.name] for column in table.c},
+            {column.name: row[f"previous_{column.name}"] for column in table.c},
+        )
+
+    before = connection.execute(previous).first()
+    if before is None:
+        return None
+    stmt = stmt.where(table.c.id == entity_id, table.c.version == before.version)
+    after = connection.execute(stmt.returning(*table.c)).first()
+    if after is None:
+        # The row was updated between the two statements.
+        return None
+    return dict(after._mapping), dict(before._mapping)
+
+
+def update_car_fields(
+    car_id: int,
+    values: Dict[str, Any],
+    versions: List[int] | None = None,
+    session: Session | None = None,
+):
+    """
+    Updates fields of a car with a single UPDATE ... RETURNING.
+
+    The previous owner, color and model returned along the new ones shift
+    the counters of the owners and the fleet statistics in the same
+    transaction, see `update_returning_previous`.
+
+    :param car_id: The ID of the car to update.
+    :param values: The new value of each field to update.
+    :param versions: The versions the car may be at, see `if_match_versions`.
+    :param session: The session to write with, `db.session` by default.
+    :raises VersionConflict: If the car is at another version.
+    :raises OwnerNotFound: If the new owner does not exist.
+    :raises IntegrityError: If the new owner already has 3 cars.
+    :return: The updated car, or None if it does not exist.
+    """
+    if session is None:
+        session = db.session
+    table = Car.__table__
+    connection = session.connection()
+    try:
+        rows = update_returning_previous(connection, table, car_id, values, versions)
+    except IntegrityError as e:
+        if is_foreign_key_violation(e):
+            raise OwnerNotFound(values["owner_id"]) from e
+        raise
+    if rows is None:
+        if versions is not None:
+            check_conflict(connection, table, car_id)
+        return None
+    car, previous = rows
+
+    stats = car_stats(previous["color"], previous["model"], -1)
+    stats += car_stats(car["color"], car["model"], 1)
+    if car["owner_id"] != previous["owner_id"]:
+        old_owner_id, new_owner_id = previous["owner_id"], car["owner_id"]
+        num_cars = adjust_car_counts(connection, {new_owner_id: 1, old_owner_id: -1})
+        stats += car_count_stats(num_cars[new_owner_id] - 1, num_cars[new_owner_id])
+        stats += car_count_stats(num_cars[old_owner_id] + 1, num_cars[old_owner_id])
+    adjust_fleet_stats(connection, stats)
+    record_changes(connection, UPSERT, [("car", car_id)])
+    session.commit()
+    return car
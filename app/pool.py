@@ -0,0 +1,65 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that keeps track of the time spent waiting for connections.
+
+    The wait covers everything between asking the pool for a connection and
+    getting one: waiting for a connection to be checked in, opening a new
+    overflow connection, or timing out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_time += elapsed
+
+
+def pool_status(engine: Engine) -> dict:
+    """
+    Reports the state of the connection pool of an engine.
+
+    :param engine: The engine whose pool is reported.
+    :return: A dict with the pool class and, for queue pools, the number of
+             checked out, idle and overflow connections and the cumulative
+             time spent waiting for a connection.
+    """
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update(
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            wait_time_seconds=round(pool.wait_time, 6),
+        )
+    return status
@@ -0,0 +1,158 @@
+from typing import Iterable
+
+from sqlalchemy import Delete, Select, false, select, true
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
+
+from .models import Car, Owner
+
+CAR_COLUMNS = (Car.id, Car.owner_id, Car.color, Car.model, Car.version)
+
+
+def owner_loader_options(
+    include_cars: bool, many: bool = True, car_fields: Iterable[str] | None = None
+) -> list:
+    """
+    Returns the loader options used to fetch the cars of owners.
+
+    Listings load the cars of every owner with a single extra SELECT ... IN
+    query, while single owner lookups join the cars in the same statement.
+    When cars are not requested, touching the relationship raises instead of
+    silently issuing one query per owner.
+
+    :param include_cars: Whether the cars of each owner will be serialized.
+    :param many: Whether the query returns a listing or a single owner.
+    :param car_fields: The only columns of the cars to load, if given.
+    :return: A list of loader options to pass to `.options()`.
+    """
+    if not include_cars:
+        return [raiseload(Owner.cars)]
+    option = selectinload(Owner.cars) if many else joinedload(Owner.cars)
+    if car_fields is not None:
+        option = option.load_only(*(getattr(Car, field) for field in car_fields))
+    return [option]
+
+
+def select_owners(
+    include_cars: bool = True,
+    owner_fields: Iterable[str] | None = None,
+    car_fields: Iterable[str] | None = None,
+) -> Select:
+    """
+    Builds the statement that lists owners ordered by ID.
+
+    Given fields, only their columns are loaded, see `OwnerListQuery.fields`.
+    The other attributes of the owners are left unloaded, so they must not
+    be serialized.
+
+    :param include_cars: Whether the cars of each owner are eagerly loaded.
+    :param owner_fields: The only columns of the owners to load, if given.
+    :param car_fields: The only columns of the cars to load, if given.
+    :return: A SELECT statement of Owner entities.
+    """
+    stmt = select(Owner).options(
+        *owner_loader_options(include_cars, many=True, car_fields=car_fields)
+    )
+    if owner_fields is not None:
+        stmt = stmt.options(
+            load_only(*(getattr(Owner, field) for field in owner_fields))
+        )
+    return stmt.order_by(Owner.id)
+
+
+def select_owner(owner_id: int, include_cars: bool = True) -> Select:
+    """
+    Builds the statement that fetches a single owner.
+
+    :param owner_id: The ID of the owner to fetch.
+    :param include_cars: Whether the cars of the owner are eagerly loaded.
+    :return: A SELECT statement of Owner entities.
+    """
+    return (
+        select(Owner)
+        .options(*owner_loader_options(include_cars, many=False))
+        .where(Owner.id == owner_id)
+    )
+
+
+def select_cars(fields: Iterable[str] | None = None) -> Select:
+    """
+    Builds the statement that lists cars ordered by ID.
+
+    :param fields: The only columns of the cars to load, if given.
+    :return: A SELECT statement of Car entities.
+    """
+    stmt = select(Car)
+    if fields is not None:
+        stmt = stmt.options(load_only(*(getattr(Car, field) for field in fields)))
+    return stmt.order_by(Car.id)
+
+
+def select_car_rows(fields: Iterable[str] | None = None) -> Select:
+    """
+    Builds the statement that lists the columns of cars ordered by ID.
+
+    Listings that only serialize cars read plain Row tuples, which skips
+    building ORM entities and tracking them in the session.
+
+    :param fields: The only columns to select, every column by default.
+    :return: A SELECT statement of the car columns.
+    """
+    columns = CAR_COLUMNS
+    if fields is not None:
+        columns = [column for column in CAR_COLUMNS if column.key in fields]
+    return select(*columns).order_by(Car.id)
+
+
+def filter_cars(
+    stmt: Select | Delete,
+    owner_id: int | None = None,
+    color: str | None = None,
+    model: str | None = None,
+) -> Select | Delete:
+    """
+    Restricts a statement on cars to the given owner, color and model.
+
+    Each combination is served by an index of the car table, see `Car`.
+
+    :param stmt: The SELECT or DELETE statement of cars to filter.
+    :param owner_id: The ID of the owner of the cars, if any.
+    :param color: The color of the cars, if any.
+    :param model: The model of the cars, if any.
+    :return: The filtered statement.
+    """
+    if owner_id is not None:
+        stmt = stmt.where(Car.owner_id == owner_id)
+    if color is not None:
+        stmt = stmt.where(Car.color == color)
+    if model is not None:
+        stmt = stmt.where(Car.model == model)
+    return stmt
+
+
+def filter_owners(
+    stmt: Select | Delete,
+    sale_opportunity: bool | None = None,
+    min_cars: int | None = None,
+    max_cars: int | None = None,
+) -> Select | Delete:
+    """
+    Restricts a statement on owners to the given sale opportunity flag and
+    range of numbers of cars.
+
+    The flag is compared with a literal rather than a bound parameter, so the
+    partial index of the sale opportunities, `ix_owner_leads`, matches it.
+
+    :param stmt: The SELECT or DELETE statement of owners to filter.
+    :param sale_opportunity: Whether the owners are sale opportunities, if given.
+    :param min_cars: The minimum number of cars of the owners, if any.
+    :param max_cars: The maximum number of cars of the owners, if any.
+    :return: The filtered statement.
+    """
+    if sale_opportunity is not None:
+        flag = true() if sale_opportunity else false()
+        stmt = stmt.where(Owner.sale_opportunity == flag)
+    if min_cars is not None:
+        stmt = stmt.where(Owner.num_cars >= min_cars)
+    if max_cars is not None:
+        stmt = stmt.where(Owner.num_cars <= max_cars)
+    return stmt
@@ -0,0 +1,129 @@
+"""
+Readiness of the database.
+
+`python -m app.readiness` waits for the database to accept connections,
+retrying with exponential backoff until it does or the timeout expires. The
+container entrypoint runs it before migrating, instead of sleeping for a
+fixed time. The `/ready` endpoint reports whether the app can reach the
+database, for orchestrators' readiness probes.
+
+Usage:
+    python -m app.readiness [--timeout SECONDS] [--initial-delay SECONDS]
+        [--max-delay SECONDS]
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from flask import jsonify
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+
+class DatabaseUnavailable(RuntimeError):
+    pass
+
+
+def check_database(engine: Engine) -> bool:
+    """
+    Tells whether the database answers a trivial query.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except exc.DBAPIError:
+        return False
+
+
+def wait_for_database(
+    engine: Engine,
+    timeout: float = 60.0,
+    initial_delay: float = 0.1,
+    max_delay: float = 5.0,
+    sleep=time.sleep,
+) -> int:
+    """
+    Waits until the database answers a trivial query.
+
+    The delay between attempts starts at `initial_delay` and doubles up to
+    `max_delay`, with jitter, so a database that is up quickly is detected
+    quickly while a slow one is not hammered.
+
+    :param engine: The engine of the database.
+    :param timeout: The number of seconds to wait at most.
+    :param initial_delay: The number of seconds before the second attempt.
+    :param max_delay: The largest number of seconds between two attempts.
+    :param sleep: The function used to wait between attempts.
+    :raises DatabaseUnavailable: If the database is still unreachable after
+                                 `timeout` seconds.
+    :return: The number of attempts made.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempts = 0
+    while True:
+        attempts += 1
+        if check_database(engine):
+            return attempts
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DatabaseUnavailable(
+                f"The database is unreachable after {attempts} attempts"
+            )
+        sleep(min(delay * random.uniform(0.5, 1.0), remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def ready():
+    """
+    Report whether the app can serve requests.
+
+    :return: A JSON response with status 200 when the database answers, or 503.
+    """
+    from app import db
+
+    if check_database(db.engine):
+        return jsonify({"status": "ready"}), 200
+    return jsonify({"msg": "Database unavailable"}), 503
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.readiness", description=__doc__
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--initial-delay", type=float, default=0.1)
+    parser.add_argument("--max-delay", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    from app.config import get_settings
+
+    url = get_settings().get_sql_alch_dbconnstr()
+    connect_args = {}
+    if url.startswith("postgresql"):
+        # Bound each attempt, the host may not even resolve yet.
+        connect_args["connect_timeout"] = max(int(args.max_delay), 1)
+    engine = create_engine(url, poolclass=NullPool, connect_args=connect_args)
+    start = time.monotonic()
+    try:
+        attempts = wait_for_database(
+            engine, args.timeout, args.initial_delay, args.max_delay
+        )
+    except DatabaseUnavailable as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        engine.dispose()
+    print(
+        f"The database is ready after {attempts} attempts"
+        f" in {time.monotonic() - start:.2f}s."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
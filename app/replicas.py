@@ -0,0 +1,161 @@
+import itertools
+import threading
+import time
+from functools import partial, wraps
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event, exc
+from sqlalchemy.engine import Engine
+
+REPLICA_BIND_PREFIX = "replica"
+REPLICA_RETRY_AFTER = 30.0
+
+
+class ReplicaRouter:
+    """
+    Picks the read replica used by a request.
+
+    Replicas are used round-robin. A replica raising a connection error is
+    skipped for `REPLICA_RETRY_AFTER` seconds, after which it is tried again.
+    """
+
+    def __init__(self, engines: dict[str, Engine]):
+        self.engines = sorted(engines.items())
+        self._down_until = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        for key, engine in self.engines:
+            event.listen(engine, "handle_error", partial(self._handle_error, key))
+
+    def choose(self) -> Engine | None:
+        now = time.monotonic()
+        with self._lock:
+            healthy = [
+                engine
+                for key, engine in self.engines
+                if self._down_until.get(key, 0) <= now
+            ]
+            if not healthy:
+                return None
+            return healthy[next(self._counter) % len(healthy)]
+
+    def mark_down(self, key: str):
+        with self._lock:
+            self._down_until[key] = time.monotonic() + REPLICA_RETRY_AFTER
+
+    def _handle_error(self, key, context):
+        if context.is_disconnect or isinstance(
+            context.sqlalchemy_exception, exc.OperationalError
+        ):
+            self.mark_down(key)
+            if has_request_context():
+                request.replica_failed = True
+
+
+def get_router() -> ReplicaRouter | None:
+    """
+    Returns the ReplicaRouter of the current app, if it has replica binds.
+    """
+    if "replicas" not in current_app.extensions:
+        engines = current_app.extensions["sqlalchemy"].engines
+        replicas = {
+            key: engine
+            for key, engine in engines.items()
+            if key and key.startswith(REPLICA_BIND_PREFIX)
+        }
+        current_app.extensions["replicas"] = (
+            ReplicaRouter(replicas) if replicas else None
+        )
+    return current_app.extensions["replicas"]
+
+
+class RoutingSession(Session):
+    """
+    Session sending the reads of read-only requests to a replica.
+
+    A read-only request, see `read_only`, runs its SELECT statements on the
+    replica chosen for it. Everything else goes to the primary, and so does
+    every statement that follows a write in the same session, so a request
+    always reads its own writes.
+
+    While `info["defer_commit"]` is set, commits only flush, leaving the
+    caller to commit, see `app.idempotency.deferred_commits`.
+    """
+
+    def commit(self):
+        if self.info.get("defer_commit"):
+            self.flush()
+        else:
+            super().commit()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if clause is not None and not isinstance(clause, Select):
+            self.info["wrote"] = True
+        elif (
+            isinstance(clause, Select)
+            and bind is None
+            and not self._flushing
+            and not self.info.get("wrote")
+        ):
+            replica = (
+                getattr(request, "replica_engine", None)
+                if has_request_context()
+                else None
+            )
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def track_flushes(session, flush_context):
+    session.info["wrote"] = True
+
+
+def read_only(view):
+    """
+    Marks a view whose queries can be served by a read replica.
+
+    If the replica fails while the view runs, the transaction is rolled back
+    and the view runs once more against the primary.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = get_router()
+        session = current_app.extensions["sqlalchemy"].session
+        session.info["wrote"] = False
+        request.replica_engine = router.choose() if router is not None else None
+        request.replica_failed = False
+        response = view(*args, **kwargs)
+        if request.replica_engine is not None and request.replica_failed:
+            session.rollback()
+            request.replica_engine = None
+            response = view(*args, **kwargs)
+        return response
+
+    return wrapper
+
+
+def resume_on_primary(session: Session) -> bool:
+    """
+    Moves a read-only request whose replica failed to the primary.
+
+    Streamed responses fetch their rows after `read_only` has returned, so
+    they call this on a database error to go on from the primary.
+
+    :param session: The session of the request, rolled back if the request
+                    moves to the primary.
+    :return: Whether the request moved, False if the error did not come from
+             the replica of a read-only request.
+    """
+    if not has_request_context():
+        return False
+    if getattr(request, "replica_engine", None) is None or not getattr(
+        request, "replica_failed", False
+    ):
+        return False
+    session.rollback()
+    request.replica_engine = None
+    return True
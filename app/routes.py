@@ -1,12 +1,68 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from pydantic import ValidationError
-from .models import Owner, Car, db
-from .schemas import CarSchemaOut, OwnerSchemaIn, CarSchemaIn, OwnerSchemaOut
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from . import idempotency, response_cache
+from .batch import create_cars, create_owners, delete_cars, delete_owners
+from .changes import ChangesCompacted, read_changes
+from .export import CSV_MIMETYPE, iter_leads_csv
+from .models import Owner, OwnerNotFound, Car, db, is_car_limit_violation
+from .pagination import paginate, split_page
+from .patches import (
+    VersionConflict,
+    entity_tag,
+    if_match_versions,
+    update_car_fields,
+    update_owner_fields,
+)
+from .pool import pool_status
+from .replicas import read_only
+from .queries import (
+    filter_cars,
+    select_car_rows,
+    select_cars,
+    select_owner,
+    select_owners,
+)
+from .schemas import (
+    BatchSchemaIn,
+    CarSchemaOut,
+    OwnerSchemaIn,
+    CarSchemaIn,
+    CarDeleteQuery,
+    CarListQuery,
+    CarPatchIn,
+    ChangesQuery,
+    LeadsQuery,
+    OwnerDeleteQuery,
+    OwnerListQuery,
+    OwnerPatchIn,
+    OwnerSchemaOut,
+    OwnerSummarySchemaOut,
+    StatsSchemaOut,
+)
+from .serialization import json_page
+from .stats import read_stats
+from .streaming import ndjson_response, wants_ndjson
 from flask_jwt_extended import jwt_required
 from flask_pydantic import validate
 
 main = Blueprint("main", __name__)
 
+
+@main.after_request
+def invalidate_cached_responses(response):
+    """
+    Invalidates the cached listings after every successful write.
+    """
+    if (
+        request.method in ("POST", "PUT", "PATCH", "DELETE")
+        and response.status_code < 400
+    ):
+        response_cache.invalidate()
+    return response
+
+
 """
 Owners routes
 """
@@ -14,12 +70,14 @@ Owners routes
 
 @main.route("/owners", methods=["POST"])
 @jwt_required()
+@idempotency.idempotent
 @validate(on_success_status=201)
 def add_owner(body: OwnerSchemaIn):
     """
     Add a new owner.
 
-    This endpoint creates a new owner with the provided name.
+    This endpoint creates a new owner with the provided name. Retries sent
+    with the same `Idempotency-Key` header replay the first response.
 
     :param body: The OwnerSchemaIn containing the owner's name.
     :return: A JSON response with the created owner's details or an error message.
@@ -35,23 +93,60 @@ def add_owner(body: OwnerSchemaIn):
         return jsonify({"msg": "Internal server error"}), 500
 
 
+@main.route("/owners/batch", methods=["POST"])
+@jwt_required()
+@validate()
+def add_owners_batch(body: BatchSchemaIn):
+    """
+    Add many owners at once.
+
+    This endpoint validates every owner of the batch on its own and creates
+    the valid ones in a single transaction.
+
+    :param body: The BatchSchemaIn containing the owners to create.
+    :return: A JSON response with the result of each owner, in request order.
+    """
+    try:
+        results, status = create_owners(body.root)
+        return jsonify({"results": results}), status
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
 @main.route("/owners", methods=["GET"])
 @jwt_required()
+@response_cache.cached
+@read_only
 @validate(on_success_status=200)
-def get_all_owners():
+def get_all_owners(query: OwnerListQuery):
     """
     Retrieve all owners.
 
-    This endpoint retrieves all owners from the database.
-
-    :return: A JSON response with a list of all owners or an error message.
+    This endpoint retrieves a page of owners from the database, ordered by ID.
+    The cars of the owners are embedded unless `include` is given without
+    `cars`, and are fetched with a fixed number of queries regardless of the
+    number of owners. Reads are served by a replica when one is configured,
+    and pages are cached until the next write, see ResponseCache. Every
+    owner is streamed as NDJSON when `stream` is set or the client accepts
+    `application/x-ndjson`.
+
+    Given `fields`, only the requested columns are read and returned, and the
+    cars are only fetched if one of their fields is requested.
+
+    :param query: The OwnerListQuery with the page, the relations to embed
+                  and the fields to return.
+    :return: A JSON response with a page of owners and the cursor of the next
+             page, or an error message.
     """
     try:
-        owners = db.session.query(Owner).all()
-        owners_data = [
-            OwnerSchemaOut.model_validate(owner).model_dump() for owner in owners
-        ]
-        return jsonify({"data": owners_data})
+        schema = query.output_schema
+        stmt = select_owners(query.include_cars, query.owner_fields, query.car_fields)
+        if wants_ndjson(query.stream):
+            return ndjson_response(stmt, schema, Owner.id)
+        stmt = paginate(stmt, Owner.id, query.after_id, query.limit)
+        owners, next_cursor = split_page(db.session.scalars(stmt).all(), query.limit)
+        return json_page(schema, owners, next_cursor)
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
@@ -72,21 +167,66 @@ def update_owner(owner_id: int, body: OwnerSchemaIn):
     :return: A JSON response with the updated owner's details or an error message.
     """
     try:
-        owner = db.session.query(Owner).get(owner_id)
+        owner = db.session.execute(select_owner(owner_id)).unique().scalar_one_or_none()
 
         if not owner:
             return jsonify({"msg": "Owner not found"}), 404
 
         owner.name = body.name
+        # Serialize before committing so the expired owner and its cars
+        # are not reloaded afterwards, but after flushing so the response
+        # has the bumped version.
+        db.session.flush()
+        response = OwnerSchemaOut.model_validate(owner)
         db.session.commit()
 
-        return OwnerSchemaOut.model_validate(owner)
+        return response
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({"msg": "Owner was modified by another request"}), 409
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
         return jsonify({"msg": "Internal server error"}), 500
 
 
+@main.route("/owners/<int:owner_id>", methods=["PATCH"])
+@jwt_required()
+@validate(on_success_status=200)
+def patch_owner(owner_id: int, body: OwnerPatchIn):
+    """
+    Partially update an owner.
+
+    This endpoint updates the given fields of an owner with a single UPDATE
+    statement, without loading it. When an `If-Match` header is sent, the
+    owner is only updated if its version is one of the listed entity tags,
+    as returned in the `ETag` header.
+
+    :param owner_id: The ID of the owner to update.
+    :param body: The OwnerPatchIn containing the fields to update.
+    :return: A JSON response with the updated owner's details, without its
+             cars, and its ETag, or an error message.
+    """
+    try:
+        owner = update_owner_fields(
+            owner_id, body.values, if_match_versions(request.if_match)
+        )
+
+        if not owner:
+            return jsonify({"msg": "Owner not found"}), 404
+
+        response = OwnerSummarySchemaOut.model_validate(owner)
+        return response, {"ETag": entity_tag(owner.version)}
+    except VersionConflict:
+        db.session.rollback()
+        return jsonify({"msg": "Owner was modified by another request"}), 412
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
 @main.route("/owners/<int:owner_id>", methods=["DELETE"])
 @jwt_required()
 @validate()
@@ -94,24 +234,44 @@ def delete_owner(owner_id: int):
     """
     Delete an owner.
 
-    This endpoint deletes an owner based on the provided owner ID.
+    This endpoint deletes an owner based on the provided owner ID, without
+    loading it, see `delete_owners`. Its cars are deleted by the database
+    along with it.
 
     :param owner_id: The ID of the owner to delete.
     :return: A JSON response with a success message or an error message.
     """
     try:
-        owner = db.session.query(Owner).get(owner_id)
-
-        if not owner:
+        if not delete_owners(owner_id=owner_id):
             return jsonify({"msg": "Owner not found"}), 404
 
-        db.session.delete(owner)
-        db.session.commit()
-
         return jsonify({"msg": "Owner deleted!"}), 200
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/owners", methods=["DELETE"])
+@jwt_required()
+@validate()
+def delete_owners_by_filter(query: OwnerDeleteQuery):
+    """
+    Delete the owners matching a filter.
+
+    This endpoint deletes every owner matching the given sale opportunity
+    flag and range of numbers of cars, along with their cars, with a single
+    DELETE statement. At least one filter is required.
+
+    :param query: The OwnerDeleteQuery with the filters of the owners.
+    :return: A JSON response with the number of deleted owners or an error message.
+    """
+    try:
+        deleted = delete_owners(query.sale_opportunity, query.min_cars, query.max_cars)
+        return jsonify({"msg": "Owners deleted!", "deleted": deleted}), 200
+    except Exception as e:
+        db.session.rollback()
         return jsonify({"msg": "Internal server error"}), 500
 
 
@@ -122,12 +282,14 @@ Cars routes
 
 @main.route("/cars", methods=["POST"])
 @jwt_required()
+@idempotency.idempotent
 @validate(on_success_status=201)
 def add_car(body: CarSchemaIn):
     """
     Add a new car.
 
     This endpoint creates a new car with the provided owner ID, color, and model.
+    Retries sent with the same `Idempotency-Key` header replay the first response.
 
     :param body: The CarSchemaIn containing the car's details.
     :return: A JSON response with the created car's details or an error message.
@@ -137,27 +299,80 @@ def add_car(body: CarSchemaIn):
         db.session.add(car)
         db.session.commit()
         return CarSchemaOut.model_validate(car)
+    except OwnerNotFound:
+        db.session.rollback()
+        return jsonify({"msg": "Owner not found"}), 404
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_car_limit_violation(e):
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 400
+        return jsonify({"msg": "Internal server error"}), 500
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
         return jsonify({"msg": "Internal server error"}), 500
 
 
+@main.route("/cars/batch", methods=["POST"])
+@jwt_required()
+@validate()
+def add_cars_batch(body: BatchSchemaIn):
+    """
+    Add many cars at once.
+
+    This endpoint validates every car of the batch on its own, checks the
+    limit of cars per owner for the whole batch and creates the valid cars
+    in a single transaction.
+
+    :param body: The BatchSchemaIn containing the cars to create.
+    :return: A JSON response with the result of each car, in request order.
+    """
+    try:
+        results, status = create_cars(body.root)
+        return jsonify({"results": results}), status
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_car_limit_violation(e):
+            # Another request added cars to the same owners meanwhile.
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 409
+        return jsonify({"msg": "Internal server error"}), 500
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
 @main.route("/cars", methods=["GET"])
 @jwt_required()
+@response_cache.cached
+@read_only
 @validate(on_success_status=200)
-def get_all_cars():
+def get_all_cars(query: CarListQuery):
     """
     Retrieve all cars.
 
-    This endpoint retrieves all cars from the database.
+    This endpoint retrieves a page of cars from the database, ordered by ID,
+    optionally restricted to an owner, a color and a model. Reads are served
+    by a replica when one is configured, and pages are cached until the next
+    write, see ResponseCache. Every car is streamed as NDJSON when `stream`
+    is set or the client accepts `application/x-ndjson`.
 
-    :return: A JSON response with a list of all cars or an error message.
+    Given `fields`, only the requested columns are read and returned.
+
+    :param query: The CarListQuery with the filters, the page and the fields
+                  to return.
+    :return: A JSON response with a page of cars and the cursor of the next
+             page, or an error message.
     """
     try:
-        cars = db.session.query(Car).all()
-        response = [CarSchemaOut.model_validate(car).model_dump() for car in cars]
-        return jsonify({"data": response})
+        if wants_ndjson(query.stream):
+            stmt = select_cars(query.car_fields)
+            stmt = filter_cars(stmt, query.owner_id, query.color, query.model)
+            return ndjson_response(stmt, query.output_schema, Car.id)
+        stmt = select_car_rows(query.car_fields)
+        stmt = filter_cars(stmt, query.owner_id, query.color, query.model)
+        stmt = paginate(stmt, Car.id, query.after_id, query.limit)
+        cars, next_cursor = split_page(db.session.execute(stmt).all(), query.limit)
+        return json_page(query.output_schema, cars, next_cursor)
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
@@ -178,7 +393,7 @@ def update_car(car_id: int, body: CarSchemaIn):
     :return: A JSON response with the updated car's details or an error message.
     """
     try:
-        car = db.session.query(Car).get(car_id)
+        car = db.session.get(Car, car_id)
 
         if not car:
             return jsonify({"msg": "Car not found"}), 404
@@ -189,9 +404,64 @@ def update_car(car_id: int, body: CarSchemaIn):
         db.session.commit()
 
         return CarSchemaOut.model_validate(car)
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({"msg": "Car was modified by another request"}), 409
+    except OwnerNotFound:
+        db.session.rollback()
+        return jsonify({"msg": "Owner not found"}), 404
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_car_limit_violation(e):
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 400
+        return jsonify({"msg": "Internal server error"}), 500
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars/<int:car_id>", methods=["PATCH"])
+@jwt_required()
+@validate(on_success_status=200)
+def patch_car(car_id: int, body: CarPatchIn):
+    """
+    Partially update a car.
+
+    This endpoint updates the given fields of a car with a single UPDATE
+    statement, without loading it. When an `If-Match` header is sent, the
+    car is only updated if its version is one of the listed entity tags,
+    as returned in the `ETag` header.
+
+    :param car_id: The ID of the car to update.
+    :param body: The CarPatchIn containing the fields to update.
+    :return: A JSON response with the updated car's details and its ETag, or
+             an error message.
+    """
+    try:
+        car = update_car_fields(
+            car_id, body.values, if_match_versions(request.if_match)
+        )
+
+        if not car:
+            return jsonify({"msg": "Car not found"}), 404
+
+        return CarSchemaOut.model_validate(car), {"ETag": entity_tag(car["version"])}
+    except VersionConflict:
+        db.session.rollback()
+        return jsonify({"msg": "Car was modified by another request"}), 412
+    except OwnerNotFound:
+        db.session.rollback()
+        return jsonify({"msg": "Owner not found"}), 404
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_car_limit_violation(e):
+            return jsonify({"msg": "An owner cannot have more than 3 cars"}), 400
+        return jsonify({"msg": "Internal server error"}), 500
     except ValidationError as e:
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({"msg": "Internal server error"}), 500
 
 
@@ -208,7 +478,7 @@ def delete_car(car_id: int):
     :return: A JSON response with a success message or an error message.
     """
     try:
-        car = db.session.query(Car).get(car_id)
+        car = db.session.get(Car, car_id)
 
         if not car:
             return jsonify({"msg": "Car not found"}), 404
@@ -221,3 +491,153 @@ def delete_car(car_id: int):
         return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
     except Exception as e:
         return jsonify({"msg": "Internal server error"}), 500
+
+
+@main.route("/cars", methods=["DELETE"])
+@jwt_required()
+@validate()
+def delete_cars_by_filter(query: CarDeleteQuery):
+    """
+    Delete the cars matching a filter.
+
+    This endpoint deletes every car matching the given owner, color and
+    model with a single DELETE statement. At least one filter is required.
+
+    :param query: The CarDeleteQuery with the filters of the cars.
+    :return: A JSON response with the number of deleted cars or an error message.
+    """
+    try:
+        deleted = delete_cars(query.owner_id, query.color, query.model)
+        return jsonify({"msg": "Cars deleted!", "deleted": deleted}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Change feed routes
+"""
+
+
+@main.route("/changes", methods=["GET"])
+@jwt_required()
+@response_cache.cached
+@read_only
+@validate(on_success_status=200)
+def get_changes(query: ChangesQuery):
+    """
+    Retrieve the changes of owners and cars.
+
+    This endpoint returns the owners and cars created, updated or deleted
+    after the `since` sequence, oldest first, with their current state, so
+    clients only fetch what changed since their last sync. Each owner or car
+    appears once, at the sequence of its latest change.
+
+    :param query: The ChangesQuery with the sequence to read from.
+    :return: A JSON response with a page of changes and the `since` of the
+             next page, a 410 if the changes since `since` were compacted,
+             or an error message.
+    """
+    try:
+        return read_changes(db.session, query.since, query.limit)
+    except ChangesCompacted:
+        return (
+            jsonify({"msg": "Changes were compacted, list owners and cars again"}),
+            410,
+        )
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Export routes
+"""
+
+
+@main.route("/leads/export", methods=["GET"])
+@jwt_required()
+@read_only
+@validate()
+def export_leads(query: LeadsQuery):
+    """
+    Export the sale opportunities as CSV.
+
+    This endpoint streams one CSV line per car of every owner that is a sale
+    opportunity, and one line with empty car columns per such owner without
+    cars, optionally restricted to a range of numbers of cars. Rows are read
+    through a server side cursor, so the export does not hold the whole
+    result in memory.
+
+    :param query: The LeadsQuery with the range of numbers of cars.
+    :return: A streamed CSV response or an error message.
+    """
+    try:
+        chunks = iter_leads_csv(db.session, query.min_cars, query.max_cars)
+        return Response(
+            stream_with_context(chunks),
+            mimetype=CSV_MIMETYPE,
+            headers={"Content-Disposition": "attachment; filename=leads.csv"},
+        )
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Statistics routes
+"""
+
+
+@main.route("/stats", methods=["GET"])
+@jwt_required()
+@response_cache.cached
+@read_only
+@validate()
+def get_stats():
+    """
+    Retrieve the fleet statistics.
+
+    This endpoint returns the number of cars by color and by model, and the
+    number of owners by sale opportunity and by number of cars. The counters
+    are kept up to date by every write, so reading them costs the same
+    whatever the size of the fleet.
+
+    :return: A JSON response with the fleet statistics or an error message.
+    """
+    try:
+        return StatsSchemaOut(**read_stats(db.session))
+    except ValidationError as e:
+        return jsonify({"msg": "Validation error", "errors": e.errors()}), 400
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
+
+
+"""
+Database routes
+"""
+
+
+@main.route("/pool", methods=["GET"])
+@jwt_required()
+@validate()
+def get_pool_status():
+    """
+    Report the database connection pools.
+
+    This endpoint reports, for each database engine, the number of checked
+    out, idle and overflow connections and the cumulative time requests
+    spent waiting for a connection.
+
+    :return: A JSON response with the status of each pool or an error message.
+    """
+    try:
+        engines = db.engines
+        data = {
+            key or "default": pool_status(engine) for key, engine in engines.items()
+        }
+        return jsonify({"data": data})
+    except Exception as e:
+        return jsonify({"msg": "Internal server error"}), 500
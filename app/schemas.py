@@ -1,7 +1,24 @@
 import string
-from typing import List
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Type
 from flask_pydantic.exceptions import JsonBodyParsingError
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    RootModel,
+    create_model,
+    field_validator,
+    model_validator,
+)
+from pydantic_core import PydanticCustomError
+
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, decode_cursor
+
+OWNER_RELATIONS = {"cars"}
+OWNER_FIELDS = ("id", "name", "version")
+CAR_FIELDS = ("id", "owner_id", "color", "model", "version")
+MAX_BATCH_SIZE = 1000
 
 
 class OwnerSchemaIn(BaseModel):
@@ -17,24 +34,282 @@ class OwnerSchemaIn(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
-class OwnerSchemaOut(BaseModel):
+class OwnerSummarySchemaOut(BaseModel):
     """
-    Schema for output representation of owner data.
+    Schema for output representation of owner data without related cars.
 
     Attributes:
         id (int): The ID of the owner.
         name (str): The name of the owner.
-        cars (List["CarSchemaOut"]): A list of cars owned by the owner.
+        version (int): The version of the owner, to send back in `If-Match`.
     """
 
     id: int
     name: str
+    version: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class OwnerSchemaOut(OwnerSummarySchemaOut):
+    """
+    Schema for output representation of owner data.
+
+    Attributes:
+        id (int): The ID of the owner.
+        name (str): The name of the owner.
+        version (int): The version of the owner.
+        cars (List["CarSchemaOut"]): A list of cars owned by the owner.
+    """
+
     cars: List["CarSchemaOut"]
 
     model_config = ConfigDict(from_attributes=True)
 
 
-class CarSchemaIn(BaseModel):
+class ListQuery(BaseModel):
+    """
+    Schema for the query parameters shared by listings.
+
+    Attributes:
+        cursor (str | None): The opaque cursor returned as `next_cursor` by the
+                             previous page. The first page is returned when omitted.
+        limit (int): The maximum number of items of the page, between 1 and 1000.
+        stream (bool): Whether to stream every item as NDJSON instead of a page.
+    """
+
+    cursor: Optional[str] = None
+    limit: int = Field(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    stream: bool = False
+
+    @field_validator("cursor")
+    def validate_cursor(cls, value):
+        """
+        Validates that the cursor was issued by a previous page.
+
+        Raises:
+            PydanticCustomError: If the cursor cannot be decoded.
+        """
+        if value is not None:
+            try:
+                decode_cursor(value)
+            except InvalidCursor:
+                raise PydanticCustomError("invalid_cursor", "Invalid cursor")
+        return value
+
+    @property
+    def after_id(self) -> int | None:
+        return None if self.cursor is None else decode_cursor(self.cursor)
+
+
+def split_fields(value: str) -> List[str]:
+    return [item for item in value.split(",") if item]
+
+
+def check_fields(value: str | None, allowed) -> str | None:
+    """
+    Validates that every field of a `fields` query parameter can be returned.
+
+    Raises:
+        PydanticCustomError: If an unknown field is requested.
+    """
+    if value is None:
+        return value
+    unknown = set(split_fields(value)) - set(allowed)
+    if unknown:
+        raise PydanticCustomError(
+            "unknown_field",
+            "Unknown fields: {fields}",
+            {"fields": ", ".join(sorted(unknown))},
+        )
+    return value
+
+
+def select_fields(requested, allowed: Tuple[str, ...]) -> FrozenSet[str]:
+    # The ID is always returned, pages need it for their cursor.
+    return frozenset(field for field in allowed if field == "id" or field in requested)
+
+
+@lru_cache
+def pruned_schema(
+    schema: Type[BaseModel],
+    fields: FrozenSet[str],
+    car_fields: FrozenSet[str] | None = None,
+) -> Type[BaseModel]:
+    """
+    Builds a copy of an output schema restricted to some of its fields.
+
+    Schemas are cached, so that each set of fields is built once and shares
+    the serializers cached for it, see `app.serialization.list_adapter`.
+
+    :param schema: The output schema to restrict.
+    :param fields: The fields to keep.
+    :param car_fields: The fields of the embedded cars, when `fields` has
+                       `cars`.
+    :return: A schema with the kept fields, in the order of `schema`.
+    """
+    definitions = {}
+    for name, field in schema.model_fields.items():
+        if name not in fields:
+            continue
+        annotation = field.annotation
+        if name == "cars":
+            annotation = List[pruned_schema(CarSchemaOut, car_fields)]
+        definitions[name] = (annotation, ...)
+    return create_model(
+        f"Sparse{schema.__name__}",
+        __config__=ConfigDict(from_attributes=True),
+        **definitions,
+    )
+
+
+class CarListQuery(ListQuery):
+    """
+    Schema for the query parameters of the car listing.
+
+    Attributes:
+        cursor (str | None): The cursor of the page to return.
+        limit (int): The maximum number of cars of the page.
+        stream (bool): Whether to stream every car as NDJSON.
+        owner_id (int | None): Only list the cars of this owner.
+        color (str | None): Only list cars of this color.
+        model (str | None): Only list cars of this model.
+        fields (str | None): Comma separated fields of the cars to return,
+                             among 'owner_id', 'color', 'model' and 'version'.
+                             The ID is always returned. Every field is
+                             returned when omitted.
+    """
+
+    owner_id: Optional[int] = Field(default=None, ge=1)
+    color: Optional[str] = Field(default=None, pattern="^(yellow|blue|gray)$")
+    model: Optional[str] = Field(default=None, pattern="^(hatch|sedan|convertible)$")
+    fields: Optional[str] = None
+
+    @field_validator("fields")
+    def validate_fields(cls, value):
+        return check_fields(value, CAR_FIELDS)
+
+    @property
+    def car_fields(self) -> FrozenSet[str] | None:
+        """
+        The fields of the cars to return, or None for every field.
+        """
+        if self.fields is None:
+            return None
+        return select_fields(split_fields(self.fields), CAR_FIELDS)
+
+    @property
+    def output_schema(self) -> Type[BaseModel]:
+        if self.fields is None:
+            return CarSchemaOut
+        return pruned_schema(CarSchemaOut, self.car_fields)
+
+
+class OwnerListQuery(ListQuery):
+    """
+    Schema for the query parameters of the owner listing.
+
+    Attributes:
+        cursor (str | None): The cursor of the page to return.
+        limit (int): The maximum number of owners of the page.
+        stream (bool): Whether to stream every owner as NDJSON.
+        include (str | None): Comma separated relations to embed. Only 'cars'
+                              is supported. When omitted the cars are embedded.
+        fields (str | None): Comma separated fields of the owners to return,
+                             among 'name', 'version' and 'cars', and of their
+                             cars, as 'cars.<field>'. The IDs are always
+                             returned, and the cars are only embedded when
+                             one of their fields is requested. Every field is
+                             returned when omitted.
+    """
+
+    include: Optional[str] = None
+    fields: Optional[str] = None
+
+    @field_validator("include")
+    def validate_include(cls, value):
+        """
+        Validates that every requested relation can be embedded.
+
+        Raises:
+            PydanticCustomError: If an unknown relation is requested.
+        """
+        if value is None:
+            return value
+        unknown = {item for item in value.split(",") if item} - OWNER_RELATIONS
+        if unknown:
+            raise PydanticCustomError(
+                "unknown_relation",
+                "Unknown relations: {relations}",
+                {"relations": ", ".join(sorted(unknown))},
+            )
+        return value
+
+    @field_validator("fields")
+    def validate_fields(cls, value):
+        return check_fields(
+            value,
+            OWNER_FIELDS + ("cars",) + tuple(f"cars.{field}" for field in CAR_FIELDS),
+        )
+
+    @property
+    def include_cars(self) -> bool:
+        if self.include is not None and "cars" not in self.include.split(","):
+            return False
+        return self.fields is None or self.car_fields is not None
+
+    @property
+    def owner_fields(self) -> FrozenSet[str] | None:
+        """
+        The fields of the owners to return, or None for every field.
+        """
+        if self.fields is None:
+            return None
+        return select_fields(split_fields(self.fields), OWNER_FIELDS)
+
+    @property
+    def car_fields(self) -> FrozenSet[str] | None:
+        """
+        The fields of the embedded cars to return, or None when `fields` is
+        omitted or requests no car field.
+        """
+        if self.fields is None:
+            return None
+        requested = split_fields(self.fields)
+        if "cars" in requested:
+            return frozenset(CAR_FIELDS)
+        prefix = "cars."
+        car_fields = [
+            field[len(prefix) :] for field in requested if field.startswith(prefix)
+        ]
+        return select_fields(car_fields, CAR_FIELDS) if car_fields else None
+
+    @property
+    def output_schema(self) -> Type[BaseModel]:
+        if self.fields is None:
+            return OwnerSchemaOut if self.include_cars else OwnerSummarySchemaOut
+        fields = self.owner_fields
+        if self.include_cars:
+            fields |= {"cars"}
+        return pruned_schema(OwnerSchemaOut, fields, self.car_fields)
+
+
+class CarFieldsIn(BaseModel):
+    """
+    Schema for input validation of the fields of a car, without its owner.
+
+    Attributes:
+        color (str): The color of the car, must be one of 'yellow', 'blue', or 'gray'.
+        model (str): The model of the car, must be one of 'hatch', 'sedan', or 'convertible'.
+    """
+
+    color: str = Field(pattern="^(yellow|blue|gray)$")
+    model: str = Field(pattern="^(hatch|sedan|convertible)$")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CarSchemaIn(CarFieldsIn):
     """
     Schema for input validation of car data.
 
@@ -45,8 +320,6 @@ class CarSchemaIn(BaseModel):
     """
 
     owner_id: int
-    color: str = Field(pattern="^(yellow|blue|gray)$")
-    model: str = Field(pattern="^(hatch|sedan|convertible)$")
 
     @field_validator("owner_id")
     def validate_owner_id(cls, value):
@@ -63,6 +336,56 @@ class CarSchemaIn(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class PatchSchemaIn(BaseModel):
+    """
+    Schema for the body of partial updates.
+
+    Only the given fields are updated. At least one of them is required.
+    """
+
+    @model_validator(mode="after")
+    def validate_fields(self):
+        """
+        Validates that at least one field is given.
+
+        Raises:
+            PydanticCustomError: If no field is given.
+        """
+        if not self.values:
+            raise PydanticCustomError("missing_field", "At least one field is required")
+        return self
+
+    @property
+    def values(self) -> Dict[str, Any]:
+        return self.model_dump(exclude_none=True)
+
+
+class OwnerPatchIn(PatchSchemaIn):
+    """
+    Schema for the partial update of an owner.
+
+    Attributes:
+        name (str | None): The new name of the owner, between 1 and 100 characters.
+    """
+
+    name: Optional[str] = Field(default=None, min_length=1, max_length=100)
+
+
+class CarPatchIn(PatchSchemaIn):
+    """
+    Schema for the partial update of a car.
+
+    Attributes:
+        owner_id (int | None): The ID of the new owner of the car.
+        color (str | None): The new color of the car.
+        model (str | None): The new model of the car.
+    """
+
+    owner_id: Optional[int] = Field(default=None, ge=1)
+    color: Optional[str] = Field(default=None, pattern="^(yellow|blue|gray)$")
+    model: Optional[str] = Field(default=None, pattern="^(hatch|sedan|convertible)$")
+
+
 class CarSchemaOut(BaseModel):
     """
     Schema for output representation of car data.
@@ -72,16 +395,169 @@ class CarSchemaOut(BaseModel):
         owner_id (int): The ID of the owner.
         color (str): The color of the car.
         model (str): The model of the car.
+        version (int): The version of the car, to send back in `If-Match`.
     """
 
     id: int
     owner_id: int
     color: str
     model: str
+    version: int
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class StatsSchemaOut(BaseModel):
+    """
+    Schema for output representation of the fleet statistics.
+
+    Attributes:
+        cars_by_color (Dict[str, int]): The number of cars of each color.
+        cars_by_model (Dict[str, int]): The number of cars of each model.
+        owners_by_sale_opportunity (Dict[str, int]): The number of owners that
+                                                     are ('true') or are not
+                                                     ('false') sale opportunities.
+        owners_by_car_count (Dict[str, int]): The number of owners having
+                                              '0' to '3' cars.
+    """
+
+    cars_by_color: Dict[str, int]
+    cars_by_model: Dict[str, int]
+    owners_by_sale_opportunity: Dict[str, int]
+    owners_by_car_count: Dict[str, int]
+
+
+class ChangesQuery(BaseModel):
+    """
+    Schema for the query parameters of the change feed.
+
+    Attributes:
+        since (int): The `next_since` of the previous page, 0 to read the
+                     whole feed.
+        limit (int): The maximum number of entries of the page, between 1 and 1000.
+    """
+
+    since: int = Field(default=0, ge=0)
+    limit: int = Field(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+
+
+class ChangeSchemaOut(BaseModel):
+    """
+    Schema for output representation of an entry of the change feed.
+
+    Attributes:
+        seq (int): The sequence of the entry.
+        entity (str): 'owner' or 'car'.
+        id (int): The ID of the owner or car.
+        op (str): 'upsert' if the owner or car was created or updated,
+                  'delete' if it was deleted.
+        data (OwnerSummarySchemaOut | CarSchemaOut | None): The current owner
+                                                            or car, unless deleted.
+    """
+
+    seq: int
+    entity: str
+    id: int
+    op: str
+    data: OwnerSummarySchemaOut | CarSchemaOut | None
+
+
+class ChangesPageOut(BaseModel):
+    """
+    Schema for output representation of a page of the change feed.
+
+    Attributes:
+        data (List[ChangeSchemaOut]): The entries, ordered by sequence.
+        next_since (int): The `since` of the next page.
+        has_more (bool): Whether the next page has entries already.
+    """
+
+    data: List[ChangeSchemaOut]
+    next_since: int
+    has_more: bool
+
+
+class LeadsQuery(BaseModel):
+    """
+    Schema for the query parameters of the export of sale opportunities.
+
+    Attributes:
+        min_cars (int | None): Only export owners having at least this many cars.
+        max_cars (int | None): Only export owners having at most this many cars.
+    """
+
+    min_cars: Optional[int] = Field(default=None, ge=0, le=3)
+    max_cars: Optional[int] = Field(default=None, ge=0, le=3)
+
+
+class DeleteQuery(BaseModel):
+    """
+    Schema for the filters of bulk deletes.
+
+    At least one filter is required, so that a bare DELETE on a listing
+    cannot wipe the whole table.
+    """
+
+    @model_validator(mode="after")
+    def validate_filters(self):
+        """
+        Validates that at least one filter is given.
+
+        Raises:
+            PydanticCustomError: If no filter is given.
+        """
+        if all(value is None for value in self.model_dump().values()):
+            raise PydanticCustomError(
+                "missing_filter", "At least one filter is required"
+            )
+        return self
+
+
+class CarDeleteQuery(DeleteQuery):
+    """
+    Schema for the filters of the bulk delete of cars.
+
+    Attributes:
+        owner_id (int | None): Only delete the cars of this owner.
+        color (str | None): Only delete cars of this color.
+        model (str | None): Only delete cars of this model.
+    """
+
+    owner_id: Optional[int] = Field(default=None, ge=1)
+    color: Optional[str] = Field(default=None, pattern="^(yellow|blue|gray)$")
+    model: Optional[str] = Field(default=None, pattern="^(hatch|sedan|convertible)$")
+
+
+class OwnerDeleteQuery(DeleteQuery):
+    """
+    Schema for the filters of the bulk delete of owners.
+
+    Attributes:
+        sale_opportunity (bool | None): Only delete owners that are, or are
+                                        not, sale opportunities.
+        min_cars (int | None): Only delete owners having at least this many cars.
+        max_cars (int | None): Only delete owners having at most this many cars.
+    """
+
+    sale_opportunity: Optional[bool] = None
+    min_cars: Optional[int] = Field(default=None, ge=0, le=3)
+    max_cars: Optional[int] = Field(default=None, ge=0, le=3)
+
+
+class BatchSchemaIn(RootModel[List[Dict[str, Any]]]):
+    """
+    Schema for the body of batch endpoints.
+
+    The items are validated one by one by the batch endpoint, so that invalid
+    items are reported without rejecting the whole batch.
+
+    Attributes:
+        root (List[Dict[str, Any]]): The raw items, between 1 and 1000 of them.
+    """
+
+    root: List[Dict[str, Any]] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
 class UserSchema(BaseModel):
     """
     Schema for input validation of user data.
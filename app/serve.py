@@ -0,0 +1,129 @@
+"""
+Production server for the API.
+
+Runs the app created by `create_app` on gunicorn, preloaded once in the
+master process and served by prefork workers. Send SIGHUP to the master to
+gracefully replace the workers, or SIGTERM to drain them and stop.
+
+Usage:
+    python -m app.serve [--bind HOST:PORT] [--workers N] [--threads N]
+"""
+
+import argparse
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from app.config import get_serve_settings
+
+
+def available_cpus() -> int:
+    """
+    Returns the number of CPUs this process may run on.
+
+    Unlike `os.cpu_count`, this honours CPU affinity, e.g. container limits
+    set through cpusets.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def post_fork(server, worker):
+    """
+    Resets the per process state inherited from the preloaded app.
+
+    Connections opened by the master while loading the app must never be used
+    by two processes, so the pools of every engine are discarded without
+    closing the sockets, which still belong to the master. The password
+    hashing pool is rebuilt lazily by each worker as well.
+    """
+    from app import db
+
+    app = server.app.application
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    app.extensions["password_hasher"]["pool"] = None
+
+
+class Server(BaseApplication):
+    def __init__(self, application, options: dict):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    settings = get_serve_settings()
+    parser = argparse.ArgumentParser(prog="python -m app.serve", description=__doc__)
+    parser.add_argument(
+        "--bind",
+        default=f"{settings.serve_host}:{settings.serve_port}",
+        help="Address to listen on (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.serve_workers or available_cpus(),
+        help="Number of worker processes (default: one per available CPU).",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=settings.serve_threads,
+        help="Number of threads per worker (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=settings.serve_max_requests,
+        help="Gracefully restart a worker after this many requests, 0 disables it.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=settings.serve_timeout,
+        help="Seconds before a silent worker is killed and restarted.",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=settings.serve_graceful_timeout,
+        help="Seconds given to workers to finish their requests on restart.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    from app import create_app
+
+    app = create_app(migrations=False)
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread" if args.threads > 1 else "sync",
+        "preload_app": True,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+    Server(app, options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from typing import Dict
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import String, case, cast, delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from .models import MAX_CARS_PER_OWNER, Car, FleetStat, Owner, db
+
+STAT_KEYS = {
+    "cars_by_color": Car.__table__.c.color.type.enums,
+    "cars_by_model": Car.__table__.c.model.type.enums,
+    "owners_by_sale_opportunity": ["true", "false"],
+    "owners_by_car_count": [str(i) for i in range(MAX_CARS_PER_OWNER + 1)],
+}
+
+
+def read_stats(session: Session) -> Dict[str, Dict[str, int]]:
+    """
+    Reads the fleet statistics.
+
+    The counters are read from the `fleet_stat` table, which has one row per
+    counter whatever the size of the fleet. Counters that were never written
+    are reported as zero.
+
+    :param session: The session to read with.
+    :return: The count of each key, by metric.
+    """
+    stats = {metric: dict.fromkeys(keys, 0) for metric, keys in STAT_KEYS.items()}
+    for stat in session.scalars(select(FleetStat)):
+        if stat.metric in stats:
+            stats[stat.metric][stat.key] = stat.count
+    return stats
+
+
+def count_stats(session: Session) -> list:
+    """
+    Computes the counters of the fleet statistics from the cars and owners.
+
+    :return: The rows of the `fleet_stat` table.
+    """
+    sale_key = case((Owner.sale_opportunity, "true"), else_="false")
+    queries = {
+        "cars_by_color": select(cast(Car.color, String), func.count()).group_by(
+            Car.color
+        ),
+        "cars_by_model": select(cast(Car.model, String), func.count()).group_by(
+            Car.model
+        ),
+        "owners_by_sale_opportunity": select(sale_key, func.count()).group_by(sale_key),
+        "owners_by_car_count": select(
+            cast(Owner.num_cars, String), func.count()
+        ).group_by(Owner.num_cars),
+    }
+    return [
+        {"metric": metric, "key": key, "count": count}
+        for metric, query in queries.items()
+        for key, count in session.execute(query)
+    ]
+
+
+def rebuild_stats(session: Session) -> list:
+    """
+    Recomputes the fleet statistics from scratch, in the current transaction.
+
+    On PostgreSQL the statistics table is locked first, so writes running
+    concurrently either shift the counters before the rebuild reads them, or
+    wait for it to commit and shift the rebuilt counters.
+
+    :param session: The session to write with. It is not committed.
+    :return: The rows written to the `fleet_stat` table.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("LOCK TABLE fleet_stat IN SHARE ROW EXCLUSIVE MODE"))
+    session.execute(delete(FleetStat))
+    rows = count_stats(session)
+    if rows:
+        session.execute(insert(FleetStat.__table__), rows)
+    return rows
+
+
+stats_cli = AppGroup("stats", help="Manage the fleet statistics.")
+
+
+@stats_cli.command("rebuild")
+def rebuild_command():
+    """Recompute the fleet statistics from the cars and owners."""
+    rows = rebuild_stats(db.session)
+    db.session.commit()
+    click.echo(f"Rebuilt {len(rows)} fleet statistics.")
@@ -0,0 +1,66 @@
+from typing import Type
+
+from flask import Response, request, stream_with_context
+from pydantic import BaseModel
+from sqlalchemy import Select
+from sqlalchemy.exc import DBAPIError
+
+from . import db
+from .replicas import resume_on_primary
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 1000
+
+
+def wants_ndjson(stream: bool = False, accept_mimetypes=None) -> bool:
+    """
+    Tells whether the client asked for a streamed NDJSON listing.
+
+    :param stream: The value of the `stream` query parameter.
+    :param accept_mimetypes: The parsed Accept header, the one of the current
+                             request by default.
+    :return: True if `stream` is set or NDJSON is the preferred media type.
+    """
+    if stream:
+        return True
+    if accept_mimetypes is None:
+        accept_mimetypes = request.accept_mimetypes
+    best = accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(stmt: Select, schema: Type[BaseModel], column) -> Response:
+    """
+    Streams every entity selected by `stmt` as one JSON document per line.
+
+    Rows are fetched in batches of `STREAM_BATCH_SIZE` through a server side
+    cursor, where the driver supports it, and serialized one at a time, so the
+    memory used by the response does not grow with the size of the table.
+
+    The rows are fetched while the response is sent, after `read_only` has
+    returned. If the replica of the request fails meanwhile, the stream goes
+    on with the rows that follow the last one sent, read from the primary.
+
+    :param stmt: The SELECT statement of the entities to stream.
+    :param schema: The schema used to serialize each entity.
+    :param column: The unique column `stmt` is ordered by, usually the ID.
+    :return: A streamed response with the NDJSON media type.
+    """
+
+    def generate():
+        last_key = None
+        while True:
+            query = stmt if last_key is None else stmt.where(column > last_key)
+            try:
+                entities = db.session.scalars(
+                    query.execution_options(yield_per=STREAM_BATCH_SIZE)
+                )
+                for entity in entities:
+                    yield schema.model_validate(entity).model_dump_json() + "\n"
+                    last_key = getattr(entity, column.key)
+                return
+            except DBAPIError:
+                if not resume_on_primary(db.session):
+                    raise
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
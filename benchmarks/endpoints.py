@@ -0,0 +1,393 @@
+"""
+Latency and SQL statements per request of every endpoint.
+
+Seeds an in-memory SQLite database with the given number of owners, cars and
+users, drives each endpoint through the Flask test client and records the
+p50 and p95 latency and the number of SQL statements of its requests. The
+response cache is disabled, so every request does its actual work.
+
+The results are compared with a baseline file. The run fails when an
+endpoint issues more statements than in the baseline, or when its p95
+latency grows past the baseline by more than `--latency-threshold`.
+Latencies are only compared with a baseline recorded with the same volumes.
+
+Usage:
+    python -m benchmarks.endpoints [--owners N] [--cars-per-owner N]
+        [--users N] [--iterations N] [--baseline PATH]
+        [--latency-threshold RATIO] [--update-baseline]
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import event
+
+from app import create_app, db, password_hasher
+from app.models import Car, Owner, User
+from app.stats import rebuild_stats
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "endpoints.json"
+PASSWORD = "b3nchP@ssword"
+
+
+@dataclass
+class Volumes:
+    owners: int = 1000
+    cars_per_owner: int = 2
+    users: int = 100
+    iterations: int = 50
+
+    def __post_init__(self):
+        # Each owner must have room for the car added by `POST /main/cars`.
+        if not 0 <= self.cars_per_owner <= 2:
+            raise ValueError("cars_per_owner must be between 0 and 2")
+        if self.owners < self.iterations or self.users < 1:
+            raise ValueError("owners must be at least iterations, users at least 1")
+
+
+@dataclass
+class Case:
+    """
+    An endpoint and the request to send on each iteration `i`.
+    """
+
+    name: str
+    method: str
+    path: Callable[[int], str]
+    status: int
+    body: Callable[[int], Any] | None = None
+    headers: Dict[str, str] | None = None
+
+
+def seed(volumes: Volumes) -> Dict[str, int]:
+    """
+    Seeds the benchmark data with bulk INSERTs.
+
+    Besides the owners and their cars, owners without cars are added for the
+    endpoints consuming rows: one per iteration for `DELETE /main/owners`
+    and one per iteration for `POST /main/cars/batch`.
+
+    :return: The first ID of each group of owners.
+    """
+    pwhash = password_hasher.hash(PASSWORD)
+    db.session.execute(
+        db.insert(User),
+        [
+            {"username": f"user{i}", "password_hash": pwhash}
+            for i in range(volumes.users)
+        ],
+    )
+    total = volumes.owners + 2 * volumes.iterations
+    db.session.execute(
+        db.insert(Owner),
+        [
+            {
+                "name": f"Owner {i}",
+                "num_cars": volumes.cars_per_owner if i < volumes.owners else 0,
+            }
+            for i in range(total)
+        ],
+    )
+    db.session.execute(
+        db.insert(Car),
+        [
+            {"owner_id": owner_id, "color": "blue", "model": "sedan"}
+            for owner_id in range(1, volumes.owners + 1)
+            for _ in range(volumes.cars_per_owner)
+        ],
+    )
+    rebuild_stats(db.session)
+    db.session.commit()
+    return {
+        "disposable_owner": volumes.owners + 1,
+        "batch_owner": volumes.owners + volumes.iterations + 1,
+    }
+
+
+def build_cases(volumes: Volumes, ids: Dict[str, int]) -> List[Case]:
+    cars = volumes.owners * volumes.cars_per_owner
+    car = {"color": "gray", "model": "hatch"}
+    cases = [
+        Case("GET /main/owners", "GET", lambda i: "/main/owners", 200),
+        Case(
+            "GET /main/owners?include=",
+            "GET",
+            lambda i: "/main/owners?include=",
+            200,
+        ),
+        Case(
+            "GET /main/owners?fields=name",
+            "GET",
+            lambda i: "/main/owners?fields=name",
+            200,
+        ),
+        Case("GET /main/cars", "GET", lambda i: "/main/cars", 200),
+        Case(
+            "GET /main/cars gzip",
+            "GET",
+            lambda i: "/main/cars",
+            200,
+            headers={"Accept-Encoding": "gzip"},
+        ),
+        Case("GET /main/cars?stream=1", "GET", lambda i: "/main/cars?stream=1", 200),
+        Case("GET /main/pool", "GET", lambda i: "/main/pool", 200),
+        Case("GET /main/stats", "GET", lambda i: "/main/stats", 200),
+        Case("GET /main/changes", "GET", lambda i: "/main/changes", 200),
+        Case(
+            "POST /auth/register",
+            "POST",
+            lambda i: "/auth/register",
+            201,
+            lambda i: {"username": f"bench{i}", "password": PASSWORD},
+        ),
+        Case(
+            "POST /auth/login",
+            "POST",
+            lambda i: "/auth/login",
+            200,
+            lambda i: {"username": f"user{i % volumes.users}", "password": PASSWORD},
+        ),
+        Case(
+            "POST /main/owners",
+            "POST",
+            lambda i: "/main/owners",
+            201,
+            lambda i: {"name": f"New owner {i}"},
+        ),
+        Case(
+            "POST /main/owners/batch",
+            "POST",
+            lambda i: "/main/owners/batch",
+            201,
+            lambda i: [{"name": f"Batch owner {i}.{j}"} for j in range(100)],
+        ),
+        Case(
+            "PUT /main/owners/<id>",
+            "PUT",
+            lambda i: f"/main/owners/{i + 1}",
+            200,
+            lambda i: {"name": f"Renamed owner {i}"},
+        ),
+        Case(
+            "PATCH /main/owners/<id>",
+            "PATCH",
+            lambda i: f"/main/owners/{i + 1}",
+            200,
+            lambda i: {"name": f"Patched owner {i}"},
+        ),
+        Case(
+            "DELETE /main/owners/<id>",
+            "DELETE",
+            lambda i: f"/main/owners/{ids['disposable_owner'] + i}",
+            200,
+        ),
+        Case(
+            "POST /main/cars",
+            "POST",
+            lambda i: "/main/cars",
+            201,
+            lambda i: {"owner_id": i + 1, **car},
+        ),
+        Case(
+            "POST /main/cars/batch",
+            "POST",
+            lambda i: "/main/cars/batch",
+            201,
+            lambda i: [{"owner_id": ids["batch_owner"] + i, **car}] * 3,
+        ),
+    ]
+    if cars >= volumes.iterations:
+        cases += [
+            Case(
+                "PUT /main/cars/<id>",
+                "PUT",
+                lambda i: f"/main/cars/{i + 1}",
+                200,
+                lambda i: {
+                    "owner_id": i // volumes.cars_per_owner + 1,
+                    "color": "yellow",
+                    "model": "convertible",
+                },
+            ),
+            Case(
+                "PATCH /main/cars/<id>",
+                "PATCH",
+                lambda i: f"/main/cars/{i + 1}",
+                200,
+                lambda i: {"color": "blue"},
+            ),
+            Case(
+                "DELETE /main/cars/<id>",
+                "DELETE",
+                lambda i: f"/main/cars/{i + 1}",
+                200,
+            ),
+        ]
+    cases += [
+        Case(
+            "DELETE /main/cars?owner_id=",
+            "DELETE",
+            lambda i: f"/main/cars?owner_id={volumes.owners - i}",
+            200,
+        ),
+        Case(
+            "DELETE /main/owners?max_cars=",
+            "DELETE",
+            lambda i: "/main/owners?max_cars=0",
+            200,
+        ),
+    ]
+    return cases
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of `values`.
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(len(ordered) * percent / 100), 1)
+    return ordered[rank - 1]
+
+
+def run(volumes: Volumes) -> dict:
+    """
+    Runs every case `volumes.iterations` times on a freshly seeded database.
+
+    :return: The volumes and, by endpoint, the p50 and p95 latency in
+             milliseconds and the largest number of statements of a request.
+    """
+    app = create_app(start_db=False)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    app.config["JWT_SECRET_KEY"] = "benchmark-secret-of-at-least-32-bytes"
+    app.config["RESPONSE_CACHE_SIZE"] = 0
+    db.init_app(app)
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        db.create_all()
+        ids = seed(volumes)
+        client = app.test_client()
+        response = client.post(
+            "/auth/login", json={"username": "user0", "password": PASSWORD}
+        )
+        headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+
+        endpoints = {}
+        for case in build_cases(volumes, ids):
+            latencies, counts = [], []
+            for i in range(volumes.iterations):
+                kwargs = {"headers": {**headers, **(case.headers or {})}}
+                if case.body is not None:
+                    kwargs["json"] = case.body(i)
+                statements.clear()
+                start = time.perf_counter()
+                response = client.open(case.path(i), method=case.method, **kwargs)
+                response.get_data()
+                latencies.append((time.perf_counter() - start) * 1000)
+                counts.append(len(statements))
+                if response.status_code != case.status:
+                    raise RuntimeError(
+                        f"{case.name} answered {response.status_code}"
+                        f" instead of {case.status}: {response.get_data(as_text=True)}"
+                    )
+            endpoints[case.name] = {
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p95_ms": round(percentile(latencies, 95), 3),
+                "statements": max(counts),
+            }
+
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+        db.session.remove()
+        db.drop_all()
+
+    return {"volumes": volumes.__dict__, "endpoints": endpoints}
+
+
+def compare(results: dict, baseline: dict, latency_threshold: float | None) -> list:
+    """
+    Lists the regressions of `results` against `baseline`.
+
+    :param results: The results of `run`.
+    :param baseline: Previous results of `run`.
+    :param latency_threshold: The tolerated p95 growth, e.g. 0.5 for +50%, or
+                              None to only compare statement counts.
+    :return: A message for each regression.
+    """
+    failures = []
+    same_volumes = results["volumes"] == baseline["volumes"]
+    for name, base in baseline["endpoints"].items():
+        current = results["endpoints"].get(name)
+        if current is None:
+            failures.append(f"{name}: missing from the results")
+            continue
+        if current["statements"] > base["statements"]:
+            failures.append(
+                f"{name}: {current['statements']} statements per request,"
+                f" {base['statements']} in the baseline"
+            )
+        if latency_threshold is not None and same_volumes:
+            limit = base["p95_ms"] * (1 + latency_threshold)
+            if current["p95_ms"] > limit:
+                failures.append(
+                    f"{name}: p95 of {current['p95_ms']:.2f} ms,"
+                    f" above {limit:.2f} ms ({base['p95_ms']:.2f} ms in the baseline)"
+                )
+    return failures
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict:
+    return json.loads(path.read_text())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    defaults = Volumes()
+    parser.add_argument("--owners", type=int, default=defaults.owners)
+    parser.add_argument("--cars-per-owner", type=int, default=defaults.cars_per_owner)
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--iterations", type=int, default=defaults.iterations)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--latency-threshold", type=float, default=0.5)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    volumes = Volumes(
+        owners=args.owners,
+        cars_per_owner=args.cars_per_owner,
+        users=args.users,
+        iterations=args.iterations,
+    )
+    results = run(volumes)
+
+    print(f"{'endpoint':<28} {'p50 ms':>8} {'p95 ms':>8} {'statements':>11}")
+    for name, result in results["endpoints"].items():
+        print(
+            f"{name:<28} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}"
+            f" {result['statements']:>11}"
+        )
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    failures = compare(results, load_baseline(args.baseline), args.latency_threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Per row cost of serializing the owner and car listings.
+
+Compares the previous path, which validated each ORM entity into a model,
+dumped it to a dict and encoded the whole list with `jsonify`, with the
+single pass serialization of `app.serialization` used by the listings now.
+
+Two costs are reported: serializing entities that are already loaded, and
+the whole listing, from the query to the JSON bytes, where the car listing
+now reads Row tuples instead of ORM entities.
+
+Usage:
+    python -m benchmarks.serialization [--rows N] [--repeat N]
+"""
+
+import argparse
+import time
+
+from flask import jsonify
+
+from app import create_app, db
+from app.models import Car, Owner
+from app.queries import select_car_rows, select_cars, select_owners
+from app.schemas import CarSchemaOut, OwnerSchemaOut
+from app.serialization import json_page
+
+
+def seed(rows: int):
+    owners = [{"name": f"Owner {i}"} for i in range(rows)]
+    db.session.execute(db.insert(Owner), owners)
+    db.session.execute(
+        db.insert(Car),
+        [
+            {"owner_id": i + 1, "color": "blue", "model": "sedan"}
+            for i in range(rows)
+            for _ in range(i % 4)
+        ],
+    )
+    db.session.commit()
+
+
+def legacy(schema, rows) -> bytes:
+    data = [schema.model_validate(row).model_dump() for row in rows]
+    return jsonify({"data": data, "next_cursor": None}).get_data()
+
+
+def single_pass(schema, rows) -> bytes:
+    return json_page(schema, rows, None).get_data()
+
+
+def load(stmt, entities: bool = True):
+    db.session.expunge_all()
+    result = db.session.execute(stmt)
+    return result.scalars().all() if entities else result.all()
+
+
+def best_of(repeat: int, fn, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    app = create_app(start_db=False)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    db.init_app(app)
+
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        seed(args.rows)
+        cases = [
+            ("cars", CarSchemaOut, select_cars(), select_car_rows(), False),
+            ("owners", OwnerSchemaOut, select_owners(), select_owners(), True),
+        ]
+
+        print(
+            f"{'listing':<24} {'rows':>6} {'before µs/row':>14}"
+            f" {'after µs/row':>13} {'speedup':>8}"
+        )
+        for name, schema, before_stmt, after_stmt, entities in cases:
+            loaded = load(before_stmt)
+            count = len(loaded)
+            timings = {
+                "serialize": (
+                    best_of(args.repeat, legacy, schema, loaded),
+                    best_of(args.repeat, single_pass, schema, loaded),
+                ),
+                "load + serialize": (
+                    best_of(args.repeat, lambda: legacy(schema, load(before_stmt))),
+                    best_of(
+                        args.repeat,
+                        lambda: single_pass(schema, load(after_stmt, entities)),
+                    ),
+                ),
+            }
+            for step, (before, after) in timings.items():
+                print(
+                    f"{name + ' ' + step:<24} {count:>6} {before / count * 1e6:>14.2f}"
+                    f" {after / count * 1e6:>13.2f} {before / after:>7.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Cold start time of the app.
+
+Runs each startup step in a fresh interpreter, the way a container, a CLI
+call or a test worker starts, and records the p50 and p95 time of the step
+and the number of modules it imports. The database is configured but never
+connected to.
+
+The results are compared with a baseline file. The run fails when a step
+imports more modules than in the baseline, or when its p95 time grows past
+the baseline by more than `--time-threshold`.
+
+Usage:
+    python -m benchmarks.startup [--iterations N] [--baseline PATH]
+        [--time-threshold RATIO] [--update-baseline]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+from benchmarks.endpoints import percentile
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "startup.json"
+ROOT = Path(__file__).parent.parent
+
+# The settings required to build the app, used when they are not set.
+SETTINGS = {
+    "DATABASE_DRIVER": "postgresql",
+    "DATABASE_HOST": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_USER": "benchmark",
+    "DATABASE_PASSWORD": "benchmark",
+    "DATABASE_DBNAME": "benchmark",
+    "JWT_SECRET_KEY": "benchmark-secret-of-at-least-32-bytes",
+}
+
+STEPS: Dict[str, str] = {
+    "import app": "import app",
+    "create_app() for servers": (
+        "from app import create_app\ncreate_app(migrations=False)"
+    ),
+    "create_app() for the CLI": "from app import create_app\ncreate_app()",
+}
+
+PROBE = """
+import json, sys, time
+modules = len(sys.modules)
+start = time.perf_counter()
+exec(compile(sys.argv[1], "<step>", "exec"))
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "modules": len(sys.modules) - modules}))
+"""
+
+
+def measure(step: str) -> dict:
+    """
+    Runs a startup step in a fresh interpreter.
+
+    :param step: The Python code of the step.
+    :return: The time taken by the step in milliseconds and the number of
+             modules it imported.
+    """
+    env = {**SETTINGS, **os.environ}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, step],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run(iterations: int) -> dict:
+    """
+    Measures every step `iterations` times.
+
+    :return: The number of iterations and, by step, the p50 and p95 time in
+             milliseconds and the largest number of imported modules.
+    """
+    steps = {}
+    for name, step in STEPS.items():
+        samples = [measure(step) for _ in range(iterations)]
+        times = [sample["ms"] for sample in samples]
+        steps[name] = {
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+            "modules": max(sample["modules"] for sample in samples),
+        }
+    return {"iterations": iterations, "steps": steps}
+
+
+def compare(results: dict, baseline: dict, time_threshold: float | None) -> list:
+    """
+    Lists the regressions of `results` against `baseline`.
+
+    :param results: The results of `run`.
+    :param baseline: Previous results of `run`.
+    :param time_threshold: The tolerated p95 growth, e.g. 0.5 for +50%, or
+                           None to only compare module counts.
+    :return: A message for each regression.
+    """
+    failures = []
+    for name, base in baseline["steps"].items():
+        current = results["steps"].get(name)
+        if current is None:
+            failures.append(f"{name}: missing from the results")
+            continue
+        if current["modules"] > base["modules"]:
+            failures.append(
+                f"{name}: {current['modules']} modules imported,"
+                f" {base['modules']} in the baseline"
+            )
+        if time_threshold is not None:
+            limit = base["p95_ms"] * (1 + time_threshold)
+            if current["p95_ms"] > limit:
+                failures.append(
+                    f"{name}: p95 of {current['p95_ms']:.2f} ms,"
+                    f" above {limit:.2f} ms ({base['p95_ms']:.2f} ms in the baseline)"
+                )
+    return failures
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict:
+    return json.loads(path.read_text())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--time-threshold", type=float, default=0.5)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args.iterations)
+
+    print(f"{'step':<28} {'p50 ms':>8} {'p95 ms':>8} {'modules':>8}")
+    for name, result in results["steps"].items():
+        print(
+            f"{name:<28} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}"
+            f" {result['modules']:>8}"
+        )
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    failures = compare(results, load_baseline(args.baseline), args.time_threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,13 +9,9 @@ fi
 export DATABASE_HOST=carford-db
 export DATABASE_USER=tester
 
-sleep 10
-
-if [ ! -d migrations ]; then
-    poetry run flask db init
-    poetry run flask db migrate
-fi
+# Wait for the database to accept connections, with exponential backoff.
+poetry run python -m app.readiness --timeout 60 || exit 1
 
 poetry run flask db upgrade
 
-exec poetry run flask run --host=0.0.0.0 --port=5000
\ No newline at end of file
+exec poetry run python -m app.serve
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""maintain the number of cars of each owner
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 13:20:12.511204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('owner') as batch_op:
+        batch_op.add_column(
+            sa.Column('num_cars', sa.Integer(), server_default='0', nullable=False)
+        )
+    op.execute(
+        'UPDATE owner SET num_cars = '
+        '(SELECT count(*) FROM car WHERE car.owner_id = owner.id)'
+    )
+    with op.batch_alter_table('owner') as batch_op:
+        batch_op.create_check_constraint(
+            'ck_owner_car_limit', 'num_cars >= 0 AND num_cars <= 3'
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('owner') as batch_op:
+        batch_op.drop_constraint('ck_owner_car_limit', type_='check')
+        batch_op.drop_column('num_cars')
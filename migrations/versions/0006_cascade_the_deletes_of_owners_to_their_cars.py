@@ -0,0 +1,38 @@
+"""cascade the deletes of owners to their cars
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 13:48:20.636782
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# The foreign key of the initial schema is unnamed. PostgreSQL names it
+# car_owner_id_fkey, while on SQLite batch mode names it after this convention.
+naming_convention = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+
+def foreign_key_name():
+    if op.get_bind().dialect.name == 'postgresql':
+        return 'car_owner_id_fkey'
+    return 'fk_car_owner_id_owner'
+
+
+def upgrade():
+    with op.batch_alter_table('car', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(foreign_key_name(), type_='foreignkey')
+        batch_op.create_foreign_key(foreign_key_name(), 'owner', ['owner_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('car', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(foreign_key_name(), type_='foreignkey')
+        batch_op.create_foreign_key(foreign_key_name(), 'owner', ['owner_id'], ['id'])
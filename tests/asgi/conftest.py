@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+
+
+class SyncResponse:
+    """
+    The parts of a Flask test response the tests read, built from a Quart one.
+    """
+
+    def __init__(self, status_code: int, headers, data: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.mimetype = headers.get("Content-Type", "").split(";")[0]
+        self.data = data
+
+    @property
+    def json(self):
+        return json.loads(self.data)
+
+    def get_data(self, as_text: bool = False):
+        return self.data.decode() if as_text else self.data
+
+
+class SyncClient:
+    """
+    Runs the requests of the Flask test suite against the ASGI app.
+    """
+
+    def __init__(self, app, loop):
+        self._client = app.test_client()
+        self._loop = loop
+
+    def open(self, path, method, **kwargs):
+        async def send():
+            response = await self._client.open(path, method=method, **kwargs)
+            return SyncResponse(
+                response.status_code, response.headers, await response.get_data()
+            )
+
+        return self._loop.run_until_complete(send())
+
+    def get(self, path, **kwargs):
+        return self.open(path, "GET", **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open(path, "POST", **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.open(path, "PUT", **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.open(path, "PATCH", **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.open(path, "DELETE", **kwargs)
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    return tmp_path / "test.db"
+
+
+@pytest.fixture
+def app(database_path):
+    """
+    Flask app on the database file of the ASGI app, for the tests that seed
+    or check rows through `db.session`.
+    """
+    app = create_app(start_db=False)
+
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    app.config["JWT_SECRET_KEY"] = "asecret"
+    app.config["RESPONSE_CACHE_SIZE"] = 0
+
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def asgi_app(app, database_path):
+    from app.asgi import create_app as create_asgi_app, database
+
+    asgi_app = create_asgi_app(start_db=False)
+
+    asgi_app.config["TESTING"] = True
+    asgi_app.config["SQLALCHEMY_ASYNC_DATABASE_URI"] = (
+        f"sqlite+aiosqlite:///{database_path}"
+    )
+    asgi_app.config["JWT_SECRET_KEY"] = "asecret"
+
+    database.init_app(asgi_app)
+
+    loop = asyncio.new_event_loop()
+    asgi_app.loop = loop
+    yield asgi_app
+    loop.run_until_complete(database.dispose(asgi_app))
+    loop.close()
+
+
+@pytest.fixture
+def client(asgi_app):
+    return SyncClient(asgi_app, asgi_app.loop)
+
+
+@pytest.fixture(scope="function")
+def query_counter(asgi_app):
+    from app.asgi import database
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = database.get_engine(asgi_app).sync_engine
+    event.listen(engine, "before_cursor_execute", count_statement)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count_statement)
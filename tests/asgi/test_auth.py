@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("aiosqlite")
+
+from tests.test_auth import (
+    test_login,
+    test_login_rehashes_outdated_password,
+    test_register,
+)
+
+
+def test_login_when_hashing_pool_is_busy(asgi_app, client):
+    from app.asgi import password_hasher
+
+    async def exhaust_pool():
+        async with asgi_app.app_context():
+            pool = password_hasher.pool
+            while pool._slots.acquire(blocking=False):
+                pass
+
+    asgi_app.loop.run_until_complete(exhaust_pool())
+
+    data = {"username": "testuser", "password": "pasSword123@"}
+    response = client.post("/auth/register", json=data)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_jwt_errors_match_flask(client):
+    response = client.get("/main/cars")
+    assert response.status_code == 401
+    assert response.json["msg"] == "Missing Authorization Header"
+
+    response = client.get("/main/cars", headers={"Authorization": "Bearer abc"})
+    assert response.status_code == 422
+    assert response.json["msg"] == "Not enough segments"
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("aiosqlite")
+
+from tests.test_cars import (
+    test_add_car,
+    test_add_cars_batch,
+    test_car_limit_per_owner,
+    test_delete_car,
+    test_delete_cars_by_filter,
+    test_get_all_cars,
+    test_get_all_cars_invalid_page,
+    test_get_all_cars_ndjson_stream,
+    test_get_all_cars_pagination,
+    test_get_all_cars_sparse_fields,
+    test_patch_car,
+    test_update_car,
+)
@@ -0,0 +1,6 @@
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("aiosqlite")
+
+from tests.test_export import test_export_leads
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("aiosqlite")
+
+from tests.test_owners import (
+    test_add_owner,
+    test_add_owners_batch,
+    test_delete_owner,
+    test_delete_owner_cascades_to_cars,
+    test_delete_owners_by_filter,
+    test_get_all_owners,
+    test_get_all_owners_ndjson_stream,
+    test_get_all_owners_query_count_is_constant,
+    test_get_all_owners_sparse_fields,
+    test_get_all_owners_without_cars,
+    test_owner_car_count,
+    test_patch_owner,
+    test_update_owner,
+)
@@ -1,5 +1,7 @@
 import pytest
 import requests
+from sqlalchemy import event
+
 from app import create_app, db, migrate
 from werkzeug.security import generate_password_hash
 
@@ -62,3 +64,35 @@ def create_car(client, jwt_token, create_owner):
     assert response.status_code == 201
     car_id = response.json["id"]
     return car_id
+
+
+@pytest.fixture(scope="function")
+def query_counter(app):
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", count_statement)
+
+
+@pytest.fixture(scope="function")
+def concurrent_update(app):
+    """
+    Bumps the version of a row right before the next UPDATE of its table, as
+    a request committing between the read and the write of another would.
+    """
+    pending = []
+
+    def bump_version(conn, cursor, statement, parameters, context, executemany):
+        if pending and statement.startswith(f"UPDATE {pending[0][0]} "):
+            table, row_id = pending.pop()
+            cursor.execute(
+                f"UPDATE {table} SET version = version + 1 WHERE id = ?", (row_id,)
+            )
+
+    event.listen(db.engine, "before_cursor_execute", bump_version)
+    yield lambda table, row_id: pending.append((table, row_id))
+    event.remove(db.engine, "before_cursor_execute", bump_version)
@@ -1,7 +1,8 @@
 from werkzeug.security import generate_password_hash
 
+from app.hashing import HashingPool
 from app.models import User
-from app import db
+from app import db, password_hasher
 
 
 def test_register(client):
@@ -38,3 +39,45 @@ def test_login(client):
     response = client.post("/auth/login", json=data)
     assert response.status_code == 409
     assert response.json["msg"] == "Wrong credentials"
+
+
+def test_login_rehashes_outdated_password(client):
+    password = "pasSword123@"
+    user = User(
+        username="testuser",
+        password_hash=generate_password_hash(password, method="pbkdf2:sha256:1000"),
+    )
+    db.session.add(user)
+    db.session.commit()
+
+    data = {"username": "testuser", "password": password}
+    response = client.post("/auth/login", json=data)
+    assert response.status_code == 200
+    assert user.password_hash.startswith("scrypt:")
+    assert not password_hasher.needs_rehash(user.password_hash)
+
+    response = client.post("/auth/login", json=data)
+    assert response.status_code == 200
+
+
+def test_login_when_hashing_pool_is_busy(app, client):
+    pool = password_hasher.pool
+    while pool._slots.acquire(blocking=False):
+        pass
+
+    data = {"username": "testuser", "password": "pasSword123@"}
+    response = client.post("/auth/register", json=data)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_hashing_pool_workers():
+    pool = HashingPool(
+        workers=1, max_pending=0, timeout=30, method="scrypt", salt_length=16
+    )
+    try:
+        pwhash = pool.hash("pasSword123@")
+        assert pool.verify(pwhash, "pasSword123@")
+        assert not pool.verify(pwhash, "wr0ngp4Ssw@rd")
+    finally:
+        pool.shutdown()
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+from benchmarks import startup
+from benchmarks.endpoints import Volumes, compare, load_baseline, run
+
+
+def test_statements_per_request_match_baseline():
+    baseline = load_baseline()
+    results = run(Volumes(owners=20, cars_per_owner=2, users=2, iterations=3))
+    assert results["endpoints"].keys() == baseline["endpoints"].keys()
+    assert compare(results, baseline, latency_threshold=None) == []
+
+
+def test_compare_reports_regressions():
+    baseline = {
+        "volumes": {"owners": 1},
+        "endpoints": {
+            "GET /main/cars": {"p50_ms": 1.0, "p95_ms": 2.0, "statements": 1}
+        },
+    }
+    results = {
+        "volumes": {"owners": 1},
+        "endpoints": {
+            "GET /main/cars": {"p50_ms": 1.0, "p95_ms": 3.5, "statements": 2}
+        },
+    }
+    assert len(compare(results, baseline, latency_threshold=0.5)) == 2
+    assert len(compare(results, baseline, latency_threshold=1.0)) == 1
+
+    results["volumes"] = {"owners": 2}
+    assert len(compare(results, baseline, latency_threshold=0.5)) == 1
+
+
+def test_import_has_no_side_effects():
+    # Importing the package must neither read the settings nor build an app.
+    env = {k: v for k, v in os.environ.items() if k not in startup.SETTINGS}
+    code = (
+        "import sys, app\n"
+        "heavy = ['alembic', 'pydantic_settings', 'app.config', 'app.routes']\n"
+        "print([name for name in heavy if name in sys.modules], hasattr(app, 'app'))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=startup.ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert output.strip() == "[] False"
+
+
+def test_startup_compare_reports_regressions():
+    baseline = startup.load_baseline()
+    assert baseline["steps"].keys() == startup.STEPS.keys()
+    results = {
+        "steps": {
+            name: {**step, "p95_ms": 2.0 * step["p95_ms"]}
+            for name, step in baseline["steps"].items()
+        }
+    }
+    assert startup.compare(results, baseline, time_threshold=None) == []
+    assert len(startup.compare(results, baseline, time_threshold=0.5)) == 3
+
+    results["steps"]["import app"]["modules"] += 1
+    assert len(startup.compare(results, baseline, time_threshold=None)) == 1
@@ -0,0 +1,53 @@
+from app.cache import ResponseStore
+
+
+def test_unchanged_listing_is_not_modified(
+    client, jwt_token, create_car, query_counter
+):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.get("/main/cars", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    query_counter.clear()
+    response = client.get("/main/cars", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert query_counter == []
+
+    response = client.get("/main/cars", headers={**headers, "If-None-Match": '"x"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+
+
+def test_writes_invalidate_cached_listings(client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.get("/main/owners", headers=headers)
+    etag = response.headers["ETag"]
+
+    client.put(
+        f"/main/owners/{create_owner}", json={"name": "Renamed"}, headers=headers
+    )
+
+    response = client.get("/main/owners", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json["data"][0]["name"] == "Renamed"
+
+
+def test_response_store_eviction_and_versions():
+    store = ResponseStore(maxsize=2, ttl=60)
+    for path in ("a", "b", "c"):
+        store.put((store.version, path), path.encode(), "text/plain")
+    assert store.get((0, "a")) is None
+    assert store.get((0, "c")).body == b"c"
+
+    stale_key = (store.version, "d")
+    store.invalidate()
+    store.put(stale_key, b"d", "text/plain")
+    assert store.get(stale_key) is None
+    assert store.get((0, "c")) is None
+
+    expired = ResponseStore(maxsize=2, ttl=0)
+    expired.put((0, "a"), b"a", "text/plain")
+    assert expired.get((0, "a")) is None
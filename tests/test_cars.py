@@ -1,3 +1,14 @@
+import json
+
+from app import db
+from app.models import Car
+from app.pagination import paginate
+from app.queries import filter_cars, select_car_rows, select_cars
+from app.schemas import CarSchemaOut
+from app.serialization import dump_list
+from tests.test_stats import counted_stats
+
+
 def test_add_car(client, jwt_token, create_owner):
     owner_id = create_owner
     headers = {"Authorization": f"Bearer {jwt_token}"}
@@ -26,6 +37,90 @@ def test_update_car(client, jwt_token, create_owner, create_car):
     assert response.status_code == 200
 
 
+def test_patch_car(client, jwt_token, create_owner, create_car, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    url = f"/main/cars/{create_car}"
+
+    response = client.patch(url, json={"color": "gray"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json == {
+        "id": create_car,
+        "owner_id": create_owner,
+        "color": "gray",
+        "model": "sedan",
+        "version": 2,
+    }
+    assert response.headers["ETag"] == '"2"'
+
+    stale = {**headers, "If-Match": '"1"'}
+    response = client.patch(url, json={"model": "hatch"}, headers=stale)
+    assert response.status_code == 412
+
+    response = client.post("/main/owners", json={"name": "Buyer"}, headers=headers)
+    buyer_id = response.json["id"]
+    query_counter.clear()
+    response = client.patch(
+        url,
+        json={"owner_id": buyer_id, "model": "hatch"},
+        headers={**headers, "If-Match": '"2"'},
+    )
+    assert response.status_code == 200
+    assert response.json["version"] == 3
+    assert sum(s.startswith("UPDATE car") for s in query_counter) == 1
+    assert not any(s.startswith("SELECT") and "FROM owner" in s for s in query_counter)
+
+    stats, rebuilt = counted_stats()
+    assert stats == rebuilt
+    assert stats["cars_by_color"]["gray"] == 1
+    assert stats["cars_by_model"] == {"hatch": 1, "sedan": 0, "convertible": 0}
+    assert stats["owners_by_car_count"]["0"] == 1
+
+    response = client.patch(url, json={"owner_id": 999}, headers=headers)
+    assert response.status_code == 404
+    response = client.patch("/main/cars/999", json={"color": "blue"}, headers=headers)
+    assert response.status_code == 404
+    for _ in range(3):
+        car = {"owner_id": create_owner, "color": "blue", "model": "sedan"}
+        client.post("/main/cars", json=car, headers=headers)
+    response = client.patch(url, json={"owner_id": create_owner}, headers=headers)
+    assert response.status_code == 400
+    assert counted_stats()[0] == counted_stats()[1]
+
+
+def test_patch_car_racing_another_update(
+    client, jwt_token, create_car, concurrent_update
+):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    url = f"/main/cars/{create_car}"
+
+    concurrent_update("car", create_car)
+    response = client.patch(url, json={"color": "gray"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json["color"] == "gray"
+    assert response.json["version"] == 3
+
+    concurrent_update("car", create_car)
+    response = client.patch(
+        url, json={"color": "yellow"}, headers={**headers, "If-Match": '"3"'}
+    )
+    assert response.status_code == 412
+    assert db.session.get(Car, create_car).color == "gray"
+
+
+def test_put_car_racing_another_update(
+    client, jwt_token, create_owner, create_car, concurrent_update
+):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    url = f"/main/cars/{create_car}"
+    car = {"owner_id": create_owner, "color": "gray", "model": "hatch"}
+
+    concurrent_update("car", create_car)
+    response = client.put(url, json=car, headers=headers)
+    assert response.status_code == 409
+    response = client.put(url, json=car, headers=headers)
+    assert response.status_code == 200
+
+
 def test_get_all_cars(client, jwt_token, create_owner):
     headers = {"Authorization": f"Bearer {jwt_token}"}
     response = client.get("/main/cars", headers=headers)
@@ -41,3 +136,211 @@ def test_delete_car(client, jwt_token, create_car):
         headers=headers,
     )
     assert response.status_code == 200
+
+
+def test_delete_cars_by_filter(client, jwt_token, create_owner, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    for color in ("blue", "blue", "gray"):
+        car = {"owner_id": create_owner, "color": color, "model": "sedan"}
+        client.post("/main/cars", json=car, headers=headers)
+
+    response = client.delete("/main/cars?color=red", headers=headers)
+    assert response.status_code == 400
+
+    query_counter.clear()
+    response = client.delete(
+        f"/main/cars?owner_id={create_owner}&color=blue", headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json["deleted"] == 2
+    assert sum(s.startswith("DELETE") for s in query_counter) == 1
+    assert db.session.scalars(db.select(Car.color)).all() == ["gray"]
+
+    stats, rebuilt = counted_stats()
+    assert stats == rebuilt
+    assert stats["owners_by_car_count"]["1"] == 1
+
+
+def test_get_all_cars_pagination(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    for i in range(3):
+        response = client.post(
+            "/main/owners", json={"name": f"Owner {i}"}, headers=headers
+        )
+        for _ in range(2):
+            client.post(
+                "/main/cars",
+                json={
+                    "owner_id": response.json["id"],
+                    "color": "gray",
+                    "model": "hatch",
+                },
+                headers=headers,
+            )
+
+    car_ids = []
+    cursor = None
+    while True:
+        url = "/main/cars?limit=4" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json["data"]) <= 4
+        car_ids += [car["id"] for car in response.json["data"]]
+        cursor = response.json["next_cursor"]
+        if cursor is None:
+            break
+
+    assert car_ids == sorted(car_ids)
+    assert len(car_ids) == 6
+
+
+def test_get_all_cars_invalid_page(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.get("/main/cars?cursor=not-a-cursor", headers=headers)
+    assert response.status_code == 400
+    response = client.get("/main/cars?limit=0", headers=headers)
+    assert response.status_code == 400
+
+
+def test_get_all_cars_ndjson_stream(client, jwt_token, create_car):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.get("/main/cars?stream=1", headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["id"] == create_car
+
+    headers["Accept"] = "application/x-ndjson"
+    response = client.get("/main/cars", headers=headers)
+    assert response.mimetype == "application/x-ndjson"
+
+
+def test_get_all_cars_sparse_fields(client, jwt_token, create_car, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    query_counter.clear()
+    response = client.get("/main/cars?fields=color,model", headers=headers)
+    assert response.status_code == 200
+    assert response.json["data"] == [
+        {"id": create_car, "color": "blue", "model": "sedan"}
+    ]
+    assert "owner_id" not in query_counter[0] and "version" not in query_counter[0]
+
+    response = client.get("/main/cars?fields=color&stream=1", headers=headers)
+    lines = response.get_data(as_text=True).splitlines()
+    assert json.loads(lines[0]) == {"id": create_car, "color": "blue"}
+
+    response = client.get("/main/cars?fields=wheels", headers=headers)
+    assert response.status_code == 400
+
+
+def test_add_cars_batch(client, jwt_token, create_owner, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    car = {"owner_id": create_owner, "color": "blue", "model": "sedan"}
+    query_counter.clear()
+    response = client.post(
+        "/main/cars/batch",
+        json=[
+            car,
+            {**car, "color": "red"},
+            car,
+            {**car, "owner_id": 999},
+            car,
+            car,
+        ],
+        headers=headers,
+    )
+    assert response.status_code == 207
+    statuses = [result["status"] for result in response.json["results"]]
+    assert statuses == [201, 400, 201, 404, 201, 400]
+    assert response.json["results"][0]["data"]["owner_id"] == create_owner
+    assert [s.split()[0] for s in query_counter].count("SELECT") == 1
+
+    response = client.get("/main/cars", headers=headers)
+    assert len(response.json["data"]) == 3
+
+
+def test_car_limit_per_owner(client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    car = {"owner_id": create_owner, "color": "blue", "model": "sedan"}
+    for _ in range(3):
+        assert client.post("/main/cars", json=car, headers=headers).status_code == 201
+
+    response = client.post("/main/cars", json=car, headers=headers)
+    assert response.status_code == 400
+    assert response.json["msg"] == "An owner cannot have more than 3 cars"
+
+    response = client.post(
+        "/main/cars", json={**car, "owner_id": create_owner + 1}, headers=headers
+    )
+    assert response.status_code == 404
+
+    other_owner = client.post("/main/owners", json={"name": "Other"}, headers=headers)
+    response = client.post(
+        "/main/cars", json={**car, "owner_id": other_owner.json["id"]}, headers=headers
+    )
+    response = client.put(
+        f"/main/cars/{response.json['id']}", json=car, headers=headers
+    )
+    assert response.status_code == 400
+
+
+def test_dump_list_matches_model_dump(app, create_car):
+    expected = [
+        CarSchemaOut.model_validate(car).model_dump()
+        for car in db.session.scalars(select_cars())
+    ]
+    rows = db.session.execute(select_car_rows()).all()
+    assert json.loads(dump_list(CarSchemaOut, rows)) == expected
+    entities = db.session.scalars(select_cars()).all()
+    assert json.loads(dump_list(CarSchemaOut, entities)) == expected
+
+
+def test_get_all_cars_filters(client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    other_owner = client.post("/main/owners", json={"name": "Other"}, headers=headers)
+    cars = [
+        (create_owner, "blue", "sedan"),
+        (create_owner, "gray", "sedan"),
+        (other_owner.json["id"], "blue", "hatch"),
+        (other_owner.json["id"], "blue", "sedan"),
+    ]
+    for owner_id, color, model in cars:
+        client.post(
+            "/main/cars",
+            json={"owner_id": owner_id, "color": color, "model": model},
+            headers=headers,
+        )
+
+    def listed(query):
+        response = client.get(f"/main/cars?{query}", headers=headers)
+        assert response.status_code == 200
+        return [(c["owner_id"], c["color"], c["model"]) for c in response.json["data"]]
+
+    assert listed(f"owner_id={create_owner}") == cars[:2]
+    assert listed("color=blue") == [cars[0], cars[2], cars[3]]
+    assert listed("model=sedan&limit=1") == [cars[0]]
+    assert listed("color=blue&model=sedan") == [cars[0], cars[3]]
+    assert listed(f"owner_id={create_owner}&color=yellow") == []
+
+    response = client.get("/main/cars?color=red", headers=headers)
+    assert response.status_code == 400
+    response = client.get("/main/cars?owner_id=0", headers=headers)
+    assert response.status_code == 400
+
+
+def test_car_filters_use_indexes(app):
+    def query_plan(**filters):
+        stmt = filter_cars(select_car_rows(), **filters)
+        stmt = paginate(stmt, Car.id, 10, 100)
+        sql = stmt.compile(db.engine, compile_kwargs={"literal_binds": True})
+        rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return " ".join(row[-1] for row in rows)
+
+    assert "USING INDEX ix_car_owner_id" in query_plan(owner_id=1)
+    assert "USING INDEX ix_car_color_id" in query_plan(color="blue")
+    assert "USING INDEX ix_car_color_model_id" in query_plan(
+        color="blue", model="sedan"
+    )
+    assert "USING INDEX ix_car_model_id" in query_plan(model="sedan")
+    assert "TEMP B-TREE" not in query_plan(color="blue")
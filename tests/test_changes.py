@@ -0,0 +1,144 @@
+from sqlalchemy import select
+
+from app import db
+from app.changes import changes_cli
+from app.models import Change
+
+
+def read_feed(client, headers, since=0, limit=100):
+    response = client.get(f"/main/changes?since={since}&limit={limit}", headers=headers)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_changes_follow_every_write(client, jwt_token, create_car):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    feed = read_feed(client, headers)
+    assert [(c["entity"], c["id"], c["op"]) for c in feed["data"]] == [
+        ("owner", 1, "upsert"),
+        ("car", create_car, "upsert"),
+    ]
+    assert feed["data"][1]["data"] == {
+        "id": create_car,
+        "owner_id": 1,
+        "color": "blue",
+        "model": "sedan",
+        "version": 1,
+    }
+    since = feed["next_since"]
+
+    client.patch(f"/main/cars/{create_car}", json={"color": "gray"}, headers=headers)
+    client.put("/main/owners/1", json={"name": "Renamed"}, headers=headers)
+    client.post(
+        "/main/cars/batch",
+        json=[{"owner_id": 1, "color": "yellow", "model": "hatch"}],
+        headers=headers,
+    )
+    feed = read_feed(client, headers, since)
+    assert [(c["entity"], c["id"], c["op"]) for c in feed["data"]] == [
+        ("car", create_car, "upsert"),
+        ("owner", 1, "upsert"),
+        ("car", create_car + 1, "upsert"),
+    ]
+    assert feed["data"][0]["data"]["color"] == "gray"
+    assert feed["data"][1]["data"] == {"id": 1, "name": "Renamed", "version": 2}
+    seqs = [c["seq"] for c in feed["data"]]
+    assert seqs == sorted(seqs) and seqs[0] > since
+    since = feed["next_since"]
+
+    client.delete("/main/owners/1", headers=headers)
+    feed = read_feed(client, headers, since)
+    assert sorted((c["entity"], c["id"], c["op"]) for c in feed["data"]) == [
+        ("car", create_car, "delete"),
+        ("car", create_car + 1, "delete"),
+        ("owner", 1, "delete"),
+    ]
+    assert all(c["data"] is None for c in feed["data"])
+
+    # Each owner and car appears once, at its latest change.
+    feed = read_feed(client, headers)
+    assert len(feed["data"]) == 3
+    assert read_feed(client, headers, feed["next_since"])["data"] == []
+
+
+def test_changes_of_bulk_writes(client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    client.post(
+        "/main/owners/batch", json=[{"name": "A"}, {"name": "B"}], headers=headers
+    )
+    client.post(
+        "/main/cars/batch",
+        json=[{"owner_id": 2, "color": "blue", "model": "sedan"}] * 2,
+        headers=headers,
+    )
+    since = read_feed(client, headers)["next_since"]
+
+    client.delete("/main/cars?color=blue&owner_id=2", headers=headers)
+    client.delete("/main/owners?max_cars=0", headers=headers)
+    feed = read_feed(client, headers, since)
+    assert sorted((c["entity"], c["id"], c["op"]) for c in feed["data"]) == [
+        ("car", 1, "delete"),
+        ("car", 2, "delete"),
+        ("owner", 1, "delete"),
+        ("owner", 2, "delete"),
+        ("owner", 3, "delete"),
+    ]
+
+
+def test_changes_are_sequenced_when_read(client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    assert db.session.scalars(select(Change.seq)).all() == [None]
+    since = read_feed(client, headers)["next_since"]
+    assert since == 1
+
+    # An entry inserted before the ones already read, by a transaction that
+    # commits after they were read, is returned after them.
+    db.session.add(Change(id=0, entity="owner", entity_id=create_owner, op="upsert"))
+    db.session.commit()
+    feed = read_feed(client, headers, since)
+    assert [change["seq"] for change in feed["data"]] == [2]
+    assert db.session.get(Change, 0).seq == 2
+
+
+def test_changes_pages(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    client.post(
+        "/main/owners/batch",
+        json=[{"name": f"Owner {i}"} for i in range(5)],
+        headers=headers,
+    )
+    ids, since = [], 0
+    while True:
+        feed = read_feed(client, headers, since, limit=2)
+        ids += [change["id"] for change in feed["data"]]
+        since = feed["next_since"]
+        if not feed["has_more"]:
+            break
+    assert ids == [1, 2, 3, 4, 5]
+
+    response = client.get("/main/changes?since=-1", headers=headers)
+    assert response.status_code == 400
+
+
+def test_compacted_changes(app, client, jwt_token, create_car):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    client.put("/main/owners/1", json={"name": "Renamed"}, headers=headers)
+    since = read_feed(client, headers)["next_since"]
+    client.delete(f"/main/cars/{create_car}", headers=headers)
+    client.post("/main/owners", json={"name": "Other"}, headers=headers)
+    head = read_feed(client, headers, since)["next_since"]
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(changes_cli, ["compact"])
+    assert "Dropped 2 superseded and 0 deleted entries." in result.output
+    assert read_feed(client, headers, since)["next_since"] == head
+
+    result = runner.invoke(changes_cli, ["compact", "--retention", "-1"])
+    assert "Dropped 0 superseded and 1 deleted entries." in result.output
+    assert db.session.query(Change).count() == 2
+
+    response = client.get(f"/main/changes?since={since}", headers=headers)
+    assert response.status_code == 410
+    feed = read_feed(client, headers)
+    assert [change["data"]["name"] for change in feed["data"]] == ["Renamed", "Other"]
+    assert read_feed(client, headers, head)["data"] == []
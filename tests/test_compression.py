@@ -0,0 +1,115 @@
+import gzip
+import json
+import sys
+import zlib
+
+import pytest
+
+from app.compression import BrotliCompressor, available_encodings, compress
+
+
+def seed_owners(client, headers, count=50):
+    client.post(
+        "/main/owners/batch",
+        json=[{"name": f"Owner {i}"} for i in range(count)],
+        headers=headers,
+    )
+
+
+def test_listing_is_compressed_as_negotiated(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_owners(client, headers)
+    plain = client.get("/main/owners?limit=50", headers=headers)
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+
+    response = client.get(
+        "/main/owners?limit=50", headers={**headers, "Accept-Encoding": "gzip"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(plain.data)
+    assert gzip.decompress(response.data) == plain.data
+
+    response = client.get(
+        "/main/owners?limit=50",
+        headers={**headers, "Accept-Encoding": "gzip;q=0.5, deflate"},
+    )
+    assert response.headers["Content-Encoding"] == "deflate"
+    assert zlib.decompress(response.data) == plain.data
+
+    response = client.get(
+        "/main/owners?limit=50", headers={**headers, "Accept-Encoding": "gzip;q=0"}
+    )
+    assert "Content-Encoding" not in response.headers
+
+
+def test_small_responses_are_not_compressed(app, client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Accept-Encoding": "gzip"}
+    response = client.get("/main/owners", headers=headers)
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+    response = client.post("/main/owners", json={"name": "Other"}, headers=headers)
+    assert "Content-Encoding" not in response.headers
+
+    app.config["COMPRESSION_MIN_SIZE"] = 0
+    response = client.post("/main/owners", json={"name": "Third"}, headers=headers)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data))["name"] == "Third"
+
+    app.config["COMPRESSION_ENABLED"] = False
+    response = client.post("/main/owners", json={"name": "Fourth"}, headers=headers)
+    assert "Content-Encoding" not in response.headers
+
+
+def test_cached_listing_is_compressed_once(client, jwt_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Accept-Encoding": "gzip"}
+    seed_owners(client, headers)
+    calls = []
+    # The `compression` extension shadows its module in the `app` package.
+    monkeypatch.setattr(
+        sys.modules["app.compression"],
+        "compress",
+        lambda *args: calls.append(args) or compress(*args),
+    )
+
+    first = client.get("/main/owners?limit=50", headers=headers)
+    second = client.get("/main/owners?limit=50", headers=headers)
+    assert second.data == first.data
+    assert len(calls) == 1
+
+    etag = first.headers["ETag"]
+    assert etag.endswith('-gzip"')
+    response = client.get(
+        "/main/owners?limit=50", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+    plain = client.get(
+        "/main/owners?limit=50", headers={**headers, "Accept-Encoding": "identity"}
+    )
+    assert plain.headers["ETag"] != etag
+    assert gzip.decompress(first.data) == plain.data
+    assert len(calls) == 1
+
+
+def test_streamed_listing_is_compressed(client, jwt_token, create_car):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Accept-Encoding": "gzip"}
+    seed_owners(client, headers, 5)
+    response = client.get("/main/owners?stream=1", headers=headers)
+    assert response.is_streamed
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2, 3, 4, 5, 6]
+
+    response = client.get("/main/leads/export", headers=headers)
+    assert gzip.decompress(response.data).startswith(b"owner_id,owner_name")
+
+
+def test_brotli_is_preferred():
+    brotli = pytest.importorskip("brotli")
+    assert available_encodings()[0] == "br"
+    assert brotli.decompress(BrotliCompressor(4).flush()) == b""
@@ -0,0 +1,68 @@
+import csv
+import io
+
+from app import db
+from app.export import export_leads_command, select_lead_rows
+from app.models import Owner
+
+
+def seed_leads(client, headers):
+    ids = {}
+    for name, cars in (("Lead", 2), ("Empty", 0), ("Customer", 1)):
+        owner_id = client.post("/main/owners", json={"name": name}, headers=headers)
+        ids[name] = owner_id.json["id"]
+        for color in ("blue", "gray")[:cars]:
+            car = {"owner_id": ids[name], "color": color, "model": "sedan"}
+            client.post("/main/cars", json=car, headers=headers)
+    db.session.get(Owner, ids["Customer"]).sale_opportunity = False
+    db.session.commit()
+    return ids
+
+
+def test_export_leads(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    ids = seed_leads(client, headers)
+
+    response = client.get("/main/leads/export", headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert "leads.csv" in response.headers["Content-Disposition"]
+    assert list(csv.reader(io.StringIO(response.get_data(as_text=True)))) == [
+        ["owner_id", "owner_name", "num_cars", "car_id", "color", "model"],
+        [str(ids["Lead"]), "Lead", "2", "1", "blue", "sedan"],
+        [str(ids["Lead"]), "Lead", "2", "2", "gray", "sedan"],
+        [str(ids["Empty"]), "Empty", "0", "", "", ""],
+    ]
+
+    response = client.get("/main/leads/export?min_cars=1", headers=headers)
+    assert response.get_data(as_text=True).count("Lead") == 2
+    assert "Empty" not in response.get_data(as_text=True)
+
+    response = client.get("/main/leads/export?max_cars=4", headers=headers)
+    assert response.status_code == 400
+
+
+def test_export_leads_command(app, client, jwt_token, tmp_path):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_leads(client, headers)
+    output = tmp_path / "leads.csv"
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(export_leads_command, ["--output", str(output)])
+    assert result.exit_code == 0
+    assert len(output.read_text().splitlines()) == 4
+
+    result = runner.invoke(export_leads_command, ["--max-cars", "0"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[1:] == ["2,Empty,0,,,"]
+
+
+def test_export_leads_uses_partial_index(app):
+    sql = select_lead_rows(min_cars=1).compile(
+        db.engine, compile_kwargs={"literal_binds": True}
+    )
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    plan = " ".join(row[-1] for row in rows)
+    assert "USING INDEX ix_owner_leads" in plan
+    assert "INDEX ix_car_owner_id" in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,180 @@
+import sys
+import threading
+from datetime import timedelta
+
+import pytest
+
+from app import db, idempotency
+from app.idempotency import (
+    ResponseLRU,
+    StoredResponse,
+    claim_key,
+    fingerprint,
+    idempotency_cli,
+    store_response,
+    utcnow,
+)
+from app.models import Car, IdempotencyKey, Owner
+
+
+def test_retried_owner_is_created_once(client, jwt_token, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Idempotency-Key": "k1"}
+    first = client.post("/main/owners", json={"name": "Once"}, headers=headers)
+    assert first.status_code == 201
+    assert "Idempotent-Replayed" not in first.headers
+
+    query_counter.clear()
+    retry = client.post("/main/owners", json={"name": "Once"}, headers=headers)
+    assert retry.status_code == 201
+    assert retry.json == first.json
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert query_counter == []
+
+    # Another process only has the stored response.
+    client.application.extensions["idempotency"]["state"] = None
+    query_counter.clear()
+    retry = client.post("/main/owners", json={"name": "Once"}, headers=headers)
+    assert retry.json == first.json
+    assert query_counter and all("idempotency_key" in s for s in query_counter)
+    assert db.session.query(Owner).count() == 1
+
+    response = client.post("/main/owners", json={"name": "Other"}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_failed_request_releases_its_key(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Idempotency-Key": "car"}
+    car = {"owner_id": 1, "color": "blue", "model": "sedan"}
+    response = client.post("/main/cars", json=car, headers=headers)
+    assert response.status_code == 404
+    assert db.session.query(IdempotencyKey).count() == 0
+
+    client.post(
+        "/main/owners",
+        json={"name": "Late"},
+        headers={"Authorization": headers["Authorization"]},
+    )
+    response = client.post("/main/cars", json=car, headers=headers)
+    assert response.status_code == 201
+    response = client.post("/main/cars", json=car, headers=headers)
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert db.session.query(Car).count() == 1
+
+    response = client.post(
+        "/main/cars", json=car, headers={**headers, "Idempotency-Key": ""}
+    )
+    assert response.status_code == 400
+
+
+def test_write_commits_with_its_response(client, jwt_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Idempotency-Key": "crash"}
+
+    def crash(*args):
+        raise RuntimeError("worker died")
+
+    # The `idempotency` extension shadows its module in the `app` package.
+    module = sys.modules["app.idempotency"]
+    store = module.store_response
+    monkeypatch.setattr(module, "store_response", crash)
+    with pytest.raises(RuntimeError):
+        client.post("/main/owners", json={"name": "Once"}, headers=headers)
+    assert db.session.query(Owner).count() == 0
+    assert db.session.query(IdempotencyKey).count() == 0
+
+    monkeypatch.setattr(module, "store_response", store)
+    response = client.post("/main/owners", json={"name": "Once"}, headers=headers)
+    assert response.status_code == 201
+    retry = client.post("/main/owners", json={"name": "Once"}, headers=headers)
+    assert retry.json == response.json
+    assert db.session.query(Owner).count() == 1
+
+
+def test_retry_waits_for_the_request_of_another_process(
+    app, client, jwt_token, monkeypatch
+):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Idempotency-Key": "slow"}
+    with app.test_request_context("/main/owners", method="POST", json={"name": "Slow"}):
+        request_fingerprint = fingerprint()
+    assert claim_key(db.session, "testuser", "slow", request_fingerprint, 60)
+    stored = StoredResponse(request_fingerprint, 201, "application/json", b'{"id":7}')
+    sleeps = []
+
+    def complete_meanwhile(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            store_response(db.session, "testuser", "slow", stored, 60)
+            db.session.commit()
+
+    monkeypatch.setattr(idempotency, "sleep", complete_meanwhile)
+    response = client.post("/main/owners", json={"name": "Slow"}, headers=headers)
+    assert response.status_code == 201
+    assert response.json == {"id": 7}
+    assert sleeps == [0.01, 0.02]
+    assert db.session.query(Owner).count() == 0
+
+    assert claim_key(db.session, "testuser", "stuck", request_fingerprint, 60)
+    app.config["IDEMPOTENCY_WAIT_TIMEOUT"] = 0.05
+    monkeypatch.setattr(idempotency, "sleep", lambda seconds: None)
+    response = client.post(
+        "/main/owners",
+        json={"name": "Slow"},
+        headers={**headers, "Idempotency-Key": "stuck"},
+    )
+    assert response.status_code == 409
+
+
+def test_retry_waits_for_the_request_of_the_same_process(
+    client, jwt_token, query_counter
+):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Idempotency-Key": "twin"}
+    state = client.application.extensions["idempotency"]
+    with client.application.test_request_context(
+        "/main/owners", method="POST", json={"name": "Twin"}
+    ):
+        request_fingerprint = fingerprint()
+        running = idempotency.state.in_flight[("testuser", "twin")] = threading.Event()
+    stored = StoredResponse(request_fingerprint, 201, "application/json", b'{"id":3}')
+
+    def complete():
+        state["state"].responses.put(("testuser", "twin"), stored)
+        running.set()
+
+    timer = threading.Timer(0.05, complete)
+    timer.start()
+    query_counter.clear()
+    response = client.post("/main/owners", json={"name": "Twin"}, headers=headers)
+    timer.join()
+    assert response.json == {"id": 3}
+    assert query_counter == []
+
+
+def test_expired_keys(app, client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}", "Idempotency-Key": "old"}
+    client.post("/main/owners", json={"name": "Old"}, headers=headers)
+    key = db.session.get(IdempotencyKey, ("testuser", "old"))
+    key.expires_at = utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    app.extensions["idempotency"]["state"] = None
+
+    response = client.post("/main/owners", json={"name": "Old"}, headers=headers)
+    assert "Idempotent-Replayed" not in response.headers
+    assert db.session.query(Owner).count() == 2
+
+    key = db.session.get(IdempotencyKey, ("testuser", "old"))
+    key.expires_at = utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    result = app.test_cli_runner().invoke(idempotency_cli, ["purge"])
+    assert "Purged 1 expired idempotency keys." in result.output
+    assert db.session.query(IdempotencyKey).count() == 0
+
+
+def test_response_lru_eviction():
+    responses = ResponseLRU(maxsize=2, ttl=60)
+    for key in ("a", "b", "c"):
+        responses.put(key, StoredResponse(key, 201, "application/json", b""))
+    assert responses.get("a") is None
+    assert responses.get("c").fingerprint == "c"
+
+    expired = ResponseLRU(maxsize=2, ttl=0)
+    expired.put("a", StoredResponse("a", 201, "application/json", b""))
+    assert expired.get("a") is None
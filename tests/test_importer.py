@@ -0,0 +1,80 @@
+import json
+
+from app import db
+from app.importer import import_fleet_command
+from app.models import Car, Owner
+from app.stats import count_stats, read_stats
+
+
+def test_import_fleet_csv(app, tmp_path):
+    fleet = tmp_path / "fleet.csv"
+    fleet.write_text(
+        "owner_ref,name,color,model\n"
+        "a,Alice,blue,sedan\n"
+        "a,Alice,gray,hatch\n"
+        "b,Bob,,\n"
+        "c,,blue,sedan\n"
+        "a,,yellow,convertible\n"
+        "d,Dan,red,sedan\n"
+        "b,,gray,sedan\n"
+        "a,,blue,hatch\n"
+        ",Nobody,blue,sedan\n"
+    )
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(import_fleet_command, [str(fleet), "--batch-size", "4"])
+    assert result.exit_code == 0, result.output
+    assert "Imported 2 owners and 4 cars from 9 records" in result.output
+    assert "records/s" in result.output
+    assert "Rejected 4 records" in result.output
+
+    owners = db.session.scalars(db.select(Owner).order_by(Owner.id)).all()
+    assert [(owner.name, owner.num_cars) for owner in owners] == [
+        ("Alice", 3),
+        ("Bob", 1),
+    ]
+    assert db.session.query(Car).count() == 4
+    assert read_stats(db.session)["owners_by_car_count"] == {
+        "0": 0,
+        "1": 1,
+        "2": 0,
+        "3": 1,
+    }
+    counted = {
+        (row["metric"], row["key"]): row["count"] for row in count_stats(db.session)
+    }
+    for metric, counts in read_stats(db.session).items():
+        for key, count in counts.items():
+            assert counted.get((metric, key), 0) == count
+
+    rejects = tmp_path / "fleet.csv.rejects.ndjson"
+    lines = [json.loads(line) for line in rejects.read_text().splitlines()]
+    assert [line["line"] for line in lines] == [5, 7, 9, 10]
+    assert lines[2]["errors"] == ["An owner cannot have more than 3 cars"]
+    assert lines[3]["errors"] == ["owner_ref is required"]
+
+
+def test_import_fleet_ndjson(app, client, jwt_token, create_owner, tmp_path):
+    fleet = tmp_path / "fleet.ndjson"
+    records = [
+        {"owner_ref": 1, "name": "Alice", "color": "blue", "model": "sedan"},
+        {"owner_ref": 1, "color": "gray", "model": "hatch"},
+        {"owner_ref": 2, "name": "", "color": "gray", "model": "hatch"},
+    ]
+    fleet.write_text(
+        "\n".join(json.dumps(record) for record in records) + "\nnot json\n"
+    )
+    rejects = tmp_path / "rejects.ndjson"
+
+    result = app.test_cli_runner().invoke(
+        import_fleet_command, [str(fleet), "--rejects", str(rejects)]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Imported 1 owners and 2 cars from 4 records" in result.output
+    assert len(rejects.read_text().splitlines()) == 2
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.get("/main/owners", headers=headers)
+    imported = response.json["data"][-1]
+    assert imported["id"] == create_owner + 1
+    assert [car["color"] for car in imported["cars"]] == ["blue", "gray"]
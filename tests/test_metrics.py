@@ -0,0 +1,51 @@
+import re
+
+from app.metrics import Histogram
+
+
+def test_server_timing_header(client, jwt_token, create_car):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.get("/main/owners", headers=headers)
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert re.fullmatch(
+        r'db;dur=[\d.]+;desc="2 statements", serialize;dur=[\d.]+, total;dur=[\d.]+',
+        timing,
+    )
+
+
+def test_metrics_endpoint(client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    client.get("/main/cars", headers=headers)
+    client.get("/main/cars", headers=headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    text = response.get_data(as_text=True)
+    assert "# TYPE carford_request_duration_seconds histogram" in text
+    labels = 'method="GET",endpoint="/main/cars"'
+    assert f"carford_request_duration_seconds_count{{{labels}}} 2" in text
+    # The second listing is served by the response cache.
+    assert f'carford_request_db_statements_bucket{{{labels},le="0"}} 1' in text
+    assert f'carford_request_db_statements_bucket{{{labels},le="1"}} 2' in text
+    assert 'endpoint="/main/owners"' in text
+
+
+def test_metrics_disabled(app, client):
+    app.config["METRICS_ENABLED"] = False
+    response = client.post("/auth/login", json={})
+    assert "Server-Timing" not in response.headers
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "Latency.", (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(("GET",), value)
+    assert histogram.render(("method",))[2:] == [
+        'latency_bucket{method="GET",le="0.1"} 2',
+        'latency_bucket{method="GET",le="1.0"} 3',
+        'latency_bucket{method="GET",le="+Inf"} 4',
+        'latency_sum{method="GET"} 2.65',
+        'latency_count{method="GET"} 4',
+    ]
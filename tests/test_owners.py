@@ -1,3 +1,20 @@
+import json
+
+from app import db, response_cache
+from app.models import Car, Owner
+from tests.test_stats import counted_stats
+
+
+def seed_owners(count):
+    for i in range(count):
+        owner = Owner(name=f"Owner {i}")
+        db.session.add(owner)
+        db.session.flush()
+        db.session.add(Car(owner_id=owner.id, color="blue", model="sedan"))
+    db.session.commit()
+    response_cache.invalidate()
+
+
 def test_add_owner(client, jwt_token):
     headers = {"Authorization": f"Bearer {jwt_token}"}
     response = client.post("/main/owners", json={"name": "New Owner"}, headers=headers)
@@ -13,6 +30,58 @@ def test_update_owner(client, jwt_token, create_owner):
     assert response.status_code == 200
 
 
+def test_patch_owner(client, jwt_token, create_owner, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    url = f"/main/owners/{create_owner}"
+
+    query_counter.clear()
+    response = client.patch(url, json={"name": "Renamed"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json == {"id": create_owner, "name": "Renamed", "version": 2}
+    assert response.headers["ETag"] == '"2"'
+    assert [s.split()[0] for s in query_counter] == ["UPDATE", "INSERT"]
+
+    response = client.put(url, json={"name": "Replaced"}, headers=headers)
+    assert response.json["version"] == 3
+
+    stale = {**headers, "If-Match": '"2"'}
+    response = client.patch(url, json={"name": "Stale"}, headers=stale)
+    assert response.status_code == 412
+    response = client.patch(
+        url, json={"name": "Weak"}, headers={**headers, "If-Match": 'W/"3"'}
+    )
+    assert response.status_code == 412
+
+    current = {**headers, "If-Match": '"2", "3"'}
+    response = client.patch(url, json={"name": "Fresh"}, headers=current)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"4"'
+    assert db.session.get(Owner, create_owner).name == "Fresh"
+
+    response = client.patch(url, json={}, headers=headers)
+    assert response.status_code == 400
+    response = client.patch("/main/owners/999", json={"name": "X"}, headers=current)
+    assert response.status_code == 404
+
+
+def test_owner_updates_racing_another_update(
+    client, jwt_token, create_owner, concurrent_update
+):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    url = f"/main/owners/{create_owner}"
+
+    concurrent_update("owner", create_owner)
+    response = client.patch(url, json={"name": "Patched"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json["version"] == 3
+
+    concurrent_update("owner", create_owner)
+    response = client.put(url, json={"name": "Updated"}, headers=headers)
+    assert response.status_code == 409
+    response = client.put(url, json={"name": "Updated"}, headers=headers)
+    assert response.status_code == 200
+
+
 def test_get_all_owners(client, jwt_token, create_owner):
     headers = {"Authorization": f"Bearer {jwt_token}"}
     response = client.get("/main/owners", headers=headers)
@@ -25,3 +94,165 @@ def test_delete_owner(client, jwt_token, create_owner):
     headers = {"Authorization": f"Bearer {jwt_token}"}
     response = client.delete(f"/main/owners/{owner_id}", headers=headers)
     assert response.status_code == 200
+    response = client.delete(f"/main/owners/{owner_id}", headers=headers)
+    assert response.status_code == 404
+
+
+def test_delete_owner_cascades_to_cars(client, jwt_token, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_owners(2)
+    db.session.expunge_all()
+
+    query_counter.clear()
+    response = client.delete("/main/owners/1", headers=headers)
+    assert response.status_code == 200
+    deletes = [s for s in query_counter if s.startswith(("DELETE", "UPDATE car"))]
+    assert len(deletes) == 1
+    assert deletes[0].startswith("DELETE FROM owner WHERE owner.id = ? RETURNING")
+    assert not any(s.startswith("SELECT owner.") for s in query_counter)
+    assert db.session.scalars(db.select(Car.owner_id)).all() == [2]
+
+    stats, rebuilt = counted_stats()
+    assert stats == rebuilt
+    assert stats["cars_by_color"]["blue"] == 1
+
+
+def test_delete_owners_by_filter(client, jwt_token, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_owners(3)
+    db.session.add(Owner(name="Empty"))
+    db.session.get(Owner, 1).sale_opportunity = False
+    db.session.commit()
+
+    response = client.delete("/main/owners", headers=headers)
+    assert response.status_code == 400
+
+    query_counter.clear()
+    response = client.delete(
+        "/main/owners?sale_opportunity=true&min_cars=1", headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json["deleted"] == 2
+    assert sum(s.startswith("DELETE") for s in query_counter) == 1
+
+    remaining = db.session.scalars(db.select(Owner.name).order_by(Owner.id)).all()
+    assert remaining == ["Owner 0", "Empty"]
+    assert db.session.query(Car).count() == 1
+    stats, rebuilt = counted_stats()
+    assert stats == rebuilt
+
+
+def test_get_all_owners_query_count_is_constant(client, jwt_token, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+
+    seed_owners(2)
+    query_counter.clear()
+    response = client.get("/main/owners?include=cars", headers=headers)
+    assert response.status_code == 200
+    few_owners_queries = len(query_counter)
+
+    seed_owners(20)
+    query_counter.clear()
+    response = client.get("/main/owners?include=cars", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json["data"]) == 22
+    assert all(len(owner["cars"]) == 1 for owner in response.json["data"])
+    assert len(query_counter) == few_owners_queries == 2
+
+
+def test_get_all_owners_without_cars(client, jwt_token, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_owners(3)
+
+    query_counter.clear()
+    response = client.get("/main/owners?include=", headers=headers)
+    assert response.status_code == 200
+    assert len(query_counter) == 1
+    assert all("cars" not in owner for owner in response.json["data"])
+
+    response = client.get("/main/owners?include=wheels", headers=headers)
+    assert response.status_code == 400
+
+
+def test_get_all_owners_sparse_fields(client, jwt_token, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_owners(3)
+
+    query_counter.clear()
+    response = client.get("/main/owners?fields=name", headers=headers)
+    assert response.status_code == 200
+    assert response.json["data"][0] == {"id": 1, "name": "Owner 0"}
+    assert len(query_counter) == 1
+    assert "num_cars" not in query_counter[0] and "version" not in query_counter[0]
+
+    query_counter.clear()
+    response = client.get("/main/owners?fields=cars.color&limit=2", headers=headers)
+    assert response.json["data"][0] == {"id": 1, "cars": [{"id": 1, "color": "blue"}]}
+    assert response.json["next_cursor"] is not None
+    assert len(query_counter) == 2
+    assert "car.model" not in query_counter[1]
+
+    response = client.get("/main/owners?fields=version,cars", headers=headers)
+    owner = response.json["data"][0]
+    assert set(owner) == {"id", "version", "cars"}
+    assert set(owner["cars"][0]) == {"id", "owner_id", "color", "model", "version"}
+
+    response = client.get("/main/owners?fields=name,cars&include=", headers=headers)
+    assert "cars" not in response.json["data"][0]
+
+    response = client.get("/main/owners?fields=name&stream=1", headers=headers)
+    lines = response.get_data(as_text=True).splitlines()
+    assert json.loads(lines[0]) == {"id": 1, "name": "Owner 0"}
+
+    response = client.get("/main/owners?fields=name,cars.wheels", headers=headers)
+    assert response.status_code == 400
+
+
+def test_get_all_owners_ndjson_stream(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_owners(5)
+    response = client.get("/main/owners?stream=1", headers=headers)
+    assert response.status_code == 200
+    owners = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [owner["name"] for owner in owners] == [f"Owner {i}" for i in range(5)]
+    assert all(len(owner["cars"]) == 1 for owner in owners)
+
+
+def test_add_owners_batch(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.post(
+        "/main/owners/batch",
+        json=[{"name": "First"}, {"name": ""}, {"name": "Second"}],
+        headers=headers,
+    )
+    assert response.status_code == 207
+    results = response.json["results"]
+    assert [result["status"] for result in results] == [201, 400, 201]
+    assert results[2]["data"] == {
+        "id": results[0]["data"]["id"] + 1,
+        "name": "Second",
+        "version": 1,
+        "cars": [],
+    }
+
+    response = client.post("/main/owners/batch", json=[], headers=headers)
+    assert response.status_code == 400
+
+
+def test_owner_car_count(client, jwt_token, create_car):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    seed_owners(2)
+    db.session.add(Owner(name="Without cars"))
+    db.session.commit()
+    client.delete(f"/main/cars/{create_car}", headers=headers)
+
+    owners_without_cars = db.session.scalars(
+        db.select(Owner.name).where(Owner.car_count == 0).order_by(Owner.car_count)
+    ).all()
+    assert sorted(owners_without_cars) == ["Test Owner", "Without cars"]
+    assert [owner.car_count for owner in db.session.scalars(db.select(Owner))] == [
+        0,
+        1,
+        1,
+        0,
+    ]
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from app.config import Settings
+from app.pool import InstrumentedQueuePool, pool_status
+
+
+def test_engine_options_from_settings():
+    settings = Settings(
+        database_driver="postgresql",
+        database_host="db",
+        database_port=5432,
+        database_user="tester",
+        database_password="postgres",
+        database_dbname="test-db",
+        jwt_secret_key="asecret",
+        database_pool_size=20,
+        database_statement_timeout_ms=5000,
+    )
+    options = settings.get_sql_alch_engine_options()
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+
+def test_instrumented_pool_status(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    with engine.connect():
+        status = pool_status(engine)
+        assert status["checked_out"] == 1
+        assert status["idle"] == 0
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    status = pool_status(engine)
+    assert status["checked_out"] == 0
+    assert status["idle"] == 1
+    assert status["checkouts"] == 2
+    assert status["timeouts"] == 1
+    assert status["wait_time_seconds"] >= 0.05
+
+
+def test_get_pool_status(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.get("/main/pool", headers=headers)
+    assert response.status_code == 200
+    assert response.json["data"]["default"]["pool"] == "StaticPool"
@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app import create_app, db
+from app.readiness import DatabaseUnavailable, wait_for_database
+
+UNREACHABLE = "sqlite:////nonexistent/directory/carford.db"
+
+
+def test_ready(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json == {"status": "ready"}
+
+
+def test_not_ready_without_database():
+    app = create_app(start_db=False)
+    app.config["SQLALCHEMY_DATABASE_URI"] = UNREACHABLE
+    db.init_app(app)
+
+    response = app.test_client().get("/ready")
+    assert response.status_code == 503
+    assert response.json == {"msg": "Database unavailable"}
+
+
+def test_wait_for_database_backs_off(monkeypatch):
+    clock = [0.0]
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr("app.readiness.time.monotonic", lambda: clock[0])
+    with pytest.raises(DatabaseUnavailable):
+        wait_for_database(
+            create_engine(UNREACHABLE),
+            timeout=3.0,
+            initial_delay=0.1,
+            max_delay=1.0,
+            sleep=sleep,
+        )
+    assert len(delays) > 4
+    assert all(0.05 <= delay <= 0.1 for delay in delays[:1])
+    assert all(0.5 <= delay <= 1.0 for delay in delays[4:-1])
+    assert sum(delays) == pytest.approx(3.0)
+
+
+def test_wait_for_database_returns_once_ready():
+    assert wait_for_database(create_engine("sqlite://"), timeout=0) == 1
@@ -0,0 +1,171 @@
+import json
+import sqlite3
+import sys
+
+import pytest
+from sqlalchemy import event, insert
+
+from app import create_app, db, migrate
+from app.models import Car, Owner
+
+
+@pytest.fixture
+def replica_uris(request, tmp_path):
+    return getattr(request, "param", [f"sqlite:///{tmp_path / 'replica_0.db'}"])
+
+
+@pytest.fixture
+def app(tmp_path, replica_uris):
+    app = create_app(start_db=False)
+
+    app.config["TESTING"] = True
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'primary.db'}"
+    app.config["SQLALCHEMY_BINDS"] = {
+        f"replica_{i}": uri for i, uri in enumerate(replica_uris)
+    }
+    app.config["JWT_SECRET_KEY"] = "asecret"
+    app.config["RESPONSE_CACHE_SIZE"] = 0
+
+    db.init_app(app)
+    migrate.init_app(app, db)
+
+    with app.app_context():
+        db.create_all(bind_key=None)
+        for key, engine in db.engines.items():
+            if key and "nonexistent" not in str(engine.url):
+                db.metadata.create_all(engine)
+        yield app
+        db.session.remove()
+        db.drop_all(bind_key=None)
+    for key in app.config["SQLALCHEMY_BINDS"]:
+        db.metadatas.pop(key, None)
+
+
+def test_reads_are_served_by_the_replica(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = client.post("/main/owners", json={"name": "Primary"}, headers=headers)
+    assert response.status_code == 201
+
+    response = client.get("/main/owners", headers=headers)
+    assert response.json["data"] == []
+
+    with db.engines["replica_0"].begin() as connection:
+        connection.execute(insert(Owner), {"name": "Replica"})
+    response = client.get("/main/owners", headers=headers)
+    assert [owner["name"] for owner in response.json["data"]] == ["Replica"]
+
+
+@pytest.mark.parametrize(
+    "replica_uris", [["sqlite:////nonexistent/replica_0.db"]], indirect=True
+)
+def test_failed_replica_falls_back_to_primary(client, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    client.post("/main/owners", json={"name": "Primary"}, headers=headers)
+
+    for _ in range(2):
+        response = client.get("/main/cars", headers=headers)
+        assert response.status_code == 200
+        response = client.get("/main/owners", headers=headers)
+        assert response.status_code == 200
+        assert [owner["name"] for owner in response.json["data"]] == ["Primary"]
+
+
+def test_failed_replica_stream_resumes_on_primary(client, jwt_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    db.session.execute(insert(Owner), [{"name": f"Primary {i}"} for i in range(3)])
+    db.session.commit()
+    with db.engines["replica_0"].begin() as connection:
+        connection.execute(insert(Owner), [{"name": f"Replica {i}"} for i in range(3)])
+
+    # The cars of each batch of owners are read once the batch is fetched.
+    monkeypatch.setattr(sys.modules["app.streaming"], "STREAM_BATCH_SIZE", 1)
+    reads = []
+
+    def fail_second_batch(cursor, statement, parameters, context):
+        if "FROM car" in statement:
+            reads.append(statement)
+            if len(reads) == 2:
+                raise sqlite3.OperationalError("disk I/O error")
+
+    event.listen(db.engines["replica_0"], "do_execute", fail_second_batch)
+    try:
+        response = client.get("/main/owners?stream=1", headers=headers)
+        lines = response.get_data(as_text=True).splitlines()
+    finally:
+        event.remove(db.engines["replica_0"], "do_execute", fail_second_batch)
+    assert response.status_code == 200
+    names = [json.loads(line)["name"] for line in lines]
+    assert names == ["Replica 0", "Primary 1", "Primary 2"]
+
+
+def test_failed_replica_export_resumes_on_primary(client, jwt_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    cars = {1: [1, 2], 2: [], 3: [3], 4: [], 5: [4, 5]}
+    for name, engine in (("Primary", db.engine), ("Replica", db.engines["replica_0"])):
+        with engine.begin() as connection:
+            connection.execute(
+                insert(Owner),
+                [
+                    {"id": owner_id, "name": f"{name} {owner_id}", "num_cars": len(ids)}
+                    for owner_id, ids in cars.items()
+                ],
+            )
+            connection.execute(
+                insert(Car),
+                [
+                    {
+                        "id": car_id,
+                        "owner_id": owner_id,
+                        "color": "blue",
+                        "model": "sedan",
+                    }
+                    for owner_id, ids in cars.items()
+                    for car_id in ids
+                ],
+            )
+
+    # Interrupts the cursor of the replica once the first batch was sent.
+    monkeypatch.setattr(sys.modules["app.export"], "STREAM_BATCH_SIZE", 3)
+    failing = []
+
+    def interrupt(cursor, statement, parameters, context):
+        cursor.connection.set_progress_handler(lambda: bool(failing), 1)
+
+    event.listen(db.engines["replica_0"], "do_execute", interrupt)
+    try:
+        response = client.get("/main/leads/export", headers=headers, buffered=False)
+        chunks = iter(response.response)
+        body = next(chunks) + next(chunks)
+        failing.append(True)
+        body += b"".join(chunks)
+        response.close()
+    finally:
+        event.remove(db.engines["replica_0"], "do_execute", interrupt)
+
+    assert response.status_code == 200
+    rows = [line.split(",") for line in body.decode().splitlines()[1:]]
+    assert [(row[0], row[1], row[3]) for row in rows] == [
+        ("1", "Replica 1", "1"),
+        ("1", "Replica 1", "2"),
+        ("2", "Replica 2", ""),
+        ("3", "Primary 3", "3"),
+        ("4", "Primary 4", ""),
+        ("5", "Primary 5", "4"),
+        ("5", "Primary 5", "5"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "replica_uris",
+    [["sqlite:////nonexistent/replica_0.db", "sqlite:////nonexistent/replica_1.db"]],
+    indirect=True,
+)
+def test_replicas_are_used_round_robin(app):
+    from app.replicas import get_router
+
+    router = get_router()
+    first, second = router.choose(), router.choose()
+    assert {first, second} == {db.engines["replica_0"], db.engines["replica_1"]}
+
+    router.mark_down("replica_0")
+    assert router.choose() is router.choose() is db.engines["replica_1"]
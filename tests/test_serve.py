@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+from app import db, password_hasher
+from app.config import get_serve_settings
+from app.serve import available_cpus, parse_args, post_fork
+
+
+def test_parse_args_defaults(monkeypatch):
+    for name in ("SERVE_HOST", "SERVE_PORT", "SERVE_WORKERS", "SERVE_THREADS"):
+        monkeypatch.delenv(name, raising=False)
+    get_serve_settings.cache_clear()
+    args = parse_args([])
+    assert args.workers == available_cpus()
+    assert args.threads == 1
+    assert args.bind == "0.0.0.0:5000"
+
+    args = parse_args(["--workers", "3", "--threads", "4"])
+    assert (args.workers, args.threads) == (3, 4)
+
+    monkeypatch.setenv("SERVE_WORKERS", "5")
+    get_serve_settings.cache_clear()
+    assert parse_args([]).workers == 5
+    get_serve_settings.cache_clear()
+
+
+def test_post_fork_resets_process_state(app):
+    password_hasher.hash("pasSword123@")
+    engine_pool = db.engine.pool
+    assert app.extensions["password_hasher"]["pool"] is not None
+
+    server = SimpleNamespace(app=SimpleNamespace(application=app))
+    post_fork(server, worker=None)
+
+    assert app.extensions["password_hasher"]["pool"] is None
+    assert db.engine.pool is not engine_pool
@@ -0,0 +1,73 @@
+from app import db, response_cache
+from app.models import FleetStat, Owner
+from app.stats import count_stats, read_stats, stats_cli
+
+
+def counted_stats():
+    stats = read_stats(db.session)
+    db.session.query(FleetStat).delete()
+    db.session.add_all(FleetStat(**row) for row in count_stats(db.session))
+    rebuilt = read_stats(db.session)
+    db.session.rollback()
+    return stats, rebuilt
+
+
+def test_stats_follow_writes(client, jwt_token, create_owner):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    other = client.post("/main/owners", json={"name": "Other"}, headers=headers)
+    other_id = other.json["id"]
+    car = {"owner_id": create_owner, "color": "blue", "model": "sedan"}
+
+    first = client.post("/main/cars", json=car, headers=headers).json["id"]
+    client.post("/main/cars", json={**car, "color": "gray"}, headers=headers)
+    client.put(
+        f"/main/cars/{first}",
+        json={"owner_id": other_id, "color": "yellow", "model": "hatch"},
+        headers=headers,
+    )
+    client.post(
+        "/main/cars/batch",
+        json=[{**car, "owner_id": other_id}, car, {**car, "model": "hatch"}],
+        headers=headers,
+    )
+    client.post("/main/owners/batch", json=[{"name": "A"}], headers=headers)
+    last = client.post("/main/owners", json={"name": "Gone"}, headers=headers)
+    client.delete(f"/main/owners/{last.json['id']}", headers=headers)
+    owner = db.session.get(Owner, other_id)
+    owner.sale_opportunity = False
+    db.session.commit()
+    response_cache.invalidate()
+
+    response = client.get("/main/stats", headers=headers)
+    assert response.status_code == 200
+    assert response.json == {
+        "cars_by_color": {"yellow": 1, "blue": 3, "gray": 1},
+        "cars_by_model": {"hatch": 2, "sedan": 3, "convertible": 0},
+        "owners_by_sale_opportunity": {"true": 2, "false": 1},
+        "owners_by_car_count": {"0": 1, "1": 0, "2": 1, "3": 1},
+    }
+    stats, rebuilt = counted_stats()
+    assert stats == rebuilt == response.json
+
+
+def test_stats_rebuild_command(app, client, jwt_token, create_car):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    db.session.query(FleetStat).delete()
+    db.session.add(FleetStat(metric="cars_by_color", key="blue", count=42))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(stats_cli, ["rebuild"])
+    assert result.exit_code == 0
+    assert "Rebuilt 4 fleet statistics." in result.output
+    response_cache.invalidate()
+
+    response = client.get("/main/stats", headers=headers)
+    assert response.json["cars_by_color"] == {"yellow": 0, "blue": 1, "gray": 0}
+    assert response.json["owners_by_car_count"]["1"] == 1
+
+
+def test_stats_query_count_is_constant(client, jwt_token, create_car, query_counter):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    query_counter.clear()
+    client.get("/main/stats", headers=headers)
+    assert len(query_counter) == 1